@@ -0,0 +1,96 @@
+"""
+This module contains the structured form of an assembler listing. Each
+line of the listing is an instruction record with an optional label, so
+passes that run after code generation can rewrite the listing before it
+is written to a file.
+"""
+from collections import namedtuple
+import io
+
+class Instruction(namedtuple("Instruction", ["opcode", "operand", "label"])):
+    """
+    A single line of the listing. All fields are optional, a line with
+    only a label defines a jump target and an empty line is a blank.
+    """
+    __slots__ = ()
+
+    # Directives that start in the first column rather than indented.
+    UNINDENTED = (".alias", ".scend", ".scope")
+
+    def __new__(cls, opcode = None, operand = None, label = None):
+        return super().__new__(cls, opcode, operand, label)
+
+    def isInstruction(self):
+        """
+        Returns true for machine instructions and macros, false for
+        labels, blanks and assembler directives.
+        """
+        return self.opcode != None and not self.opcode.startswith(".")
+
+    def __str__(self):
+        text = ""
+        if self.label != None:
+            text = self.label + ":"
+            if self.opcode != None:
+                text = text + "\t"
+        elif self.opcode != None and self.opcode not in Instruction.UNINDENTED:
+            text = "\t"
+        if self.opcode != None:
+            text = text + self.opcode
+            if self.operand != None:
+                text = text + " " + self.operand
+        return text
+
+def parseLine(line):
+    """
+    Converts one line of assembler text into an instruction record.
+
+    Arguments:
+    line -- the text of the line without the line terminator.
+    """
+    label = None
+    if line != "" and not line[0].isspace() and not line.startswith("."):
+        label, sep, line = line.partition(":")
+    line = line.strip()
+    if line == "":
+        return Instruction(label = label)
+    opcode, sep, operand = line.partition(" ")
+    operand = operand.strip()
+    return Instruction(opcode, operand if operand != "" else None, label)
+
+def parseListing(text):
+    """
+    Converts assembler text into a list of instruction records.
+
+    Arguments:
+    text -- the assembler text.
+    """
+    return [parseLine(line) for line in text.splitlines()]
+
+def formatListing(instructions):
+    """
+    Converts a list of instruction records back into assembler text.
+
+    Arguments:
+    instructions -- the instruction records.
+    """
+    with io.StringIO() as buffer:
+        writeListing(instructions, buffer)
+        return buffer.getvalue()
+
+def writeListing(instructions, outputFile):
+    """
+    Writes a list of instruction records as assembler text in one call,
+    rather than a write for each line.
+
+    Arguments:
+    instructions -- the instruction records.
+    outputFile -- a text file, or a buffer such as io.StringIO.
+    """
+    outputFile.writelines([str(instruction) + "\n" for instruction in instructions])
+
+def countInstructions(instructions):
+    """
+    Returns the number of machine instructions and macros in a listing.
+    """
+    return sum(1 for instruction in instructions if instruction.isInstruction())
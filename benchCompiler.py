@@ -0,0 +1,159 @@
+"""
+This module measures how the compiler's throughput scales with the size and
+shape of its input, on synthetic programs from programgen.py. For each case
+it reports the tokens per second of the tokenizer, the nodes per second of
+the parser, the assembler lines per second of the code generator and the
+peak memory of each phase. The results are compared against a JSON baseline
+and a case that got slower or larger than the tolerance is flagged. The
+first run saves the baseline, --save replaces it. Run it from the command
+line: python benchCompiler.py
+"""
+from instrumentation import Instrumentation
+from programgen import ProgramGenerator
+from tinylisp import compileSource
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import sys
+
+# The shapes and sizes measured. A deep nesting of a few hundred levels
+# exceeds the recursion limit of the code generator.
+CASES = [("wide", 1000), ("wide", 4000), ("deep", 100), ("table", 20000),
+         ("strings", 1000)]
+
+# The rates and the phase each is measured over.
+RATES = [("tokensPerSecond", "tokens", "tokenize"),
+         ("nodesPerSecond", "nodes", "parse"),
+         ("linesPerSecond", "lines", "generate")]
+
+def compileCase(source, options, traceMemory):
+    stats = Instrumentation(traceMemory)
+    # The code generator prints as it goes, which isn't measured. The
+    # garbage collector is off while timing, as timeit does.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            compileSource(source, options, stats = stats)
+    finally:
+        if enabled:
+            gc.enable()
+    return stats
+
+def measure(shape, size, seed = 0, repeat = 5, options = ()):
+    """
+    Compiles a synthetic program and returns its measurements.
+
+    Arguments:
+    shape -- the shape of the program, see ProgramGenerator.
+    size -- the size of the program.
+    seed -- the seed of the program generator.
+    repeat -- the number of timed compiles, the fastest time of each phase
+    is used.
+    options -- the compiler options.
+
+    Returns:
+    a dictionary of the counts, rates and peak memory of each phase.
+    """
+    source = ProgramGenerator(seed).generate(shape, size)
+    # Memory tracing slows the phases down, so it gets a run of its own.
+    traced = compileCase(source, options, True)
+    seconds = {}
+    for run in range(repeat):
+        stats = compileCase(source, options, False)
+        for entry in stats.phases:
+            name = entry["phase"]
+            seconds[name] = min(seconds.get(name, entry["seconds"]), entry["seconds"])
+
+    result = {"shape" : shape, "size" : size, "seed" : seed,
+              "tokens" : traced.tokens, "nodes" : sum(traced.nodes.values()),
+              "lines" : traced.instructions["lines"],
+              "seconds" : sum(seconds.values()),
+              "peak" : {entry["phase"] : entry["peak"] for entry in traced.phases}}
+    for rate, count, phase in RATES:
+        result[rate] = result[count] / seconds[phase] if seconds.get(phase) else None
+    return result
+
+def caseName(result):
+    return "{}-{}".format(result["shape"], result["size"])
+
+def compare(baseline, results, tolerance):
+    """
+    Returns a message for each rate that fell and each peak that grew by
+    more than the tolerance compared to the baseline.
+
+    Arguments:
+    baseline -- the results of an earlier run.
+    results -- the results of this run.
+    tolerance -- the fraction a measurement may change by, e.g. 0.25.
+    """
+    previous = {caseName(result) : result for result in baseline}
+    regressions = []
+    for result in results:
+        name = caseName(result)
+        if name not in previous:
+            continue
+        before = previous[name]
+        if (before["tokens"], before["nodes"]) != (result["tokens"], result["nodes"]):
+            # The rates of another program can't be compared.
+            regressions.append("{} program changed since the baseline, save a new one".format(name))
+            continue
+        for rate, count, phase in RATES:
+            if result[rate] != None and before.get(rate) and result[rate] < before[rate] * (1 - tolerance):
+                regressions.append("{} {} fell from {:.0f} to {:.0f}".format(
+                                   name, rate, before[rate], result[rate]))
+        for phase, peak in result["peak"].items():
+            beforePeak = before["peak"].get(phase)
+            if beforePeak and peak > beforePeak * (1 + tolerance):
+                regressions.append("{} {} peak memory grew from {} to {} bytes".format(
+                                   name, phase, beforePeak, peak))
+    return regressions
+
+def formatRate(rate):
+    return "-" if rate == None else "{:.0f}".format(rate)
+
+def report(results):
+    lines = ["{:<14}{:>9}{:>9}{:>9}{:>12}{:>12}{:>12}{:>12}".format(
+             "case", "tokens", "nodes", "lines", "tokens/s", "nodes/s", "lines/s", "peak KB")]
+    for result in results:
+        lines.append("{:<14}{:>9}{:>9}{:>9}{:>12}{:>12}{:>12}{:>12.1f}".format(
+                     caseName(result), result["tokens"], result["nodes"], result["lines"],
+                     formatRate(result["tokensPerSecond"]), formatRate(result["nodesPerSecond"]),
+                     formatRate(result["linesPerSecond"]), max(result["peak"].values()) / 1024.0))
+    return "\n".join(lines)
+
+def main(argv):
+    argParser = argparse.ArgumentParser(description="Benchmarks the compiler on synthetic programs.")
+    argParser.add_argument("--baseline", default="bench-baseline.json",
+                           help="the JSON file of the results compared against (default bench-baseline.json)")
+    argParser.add_argument("--save", action="store_true",
+                           help="replace the baseline with the results of this run")
+    argParser.add_argument("--tolerance", type=float, default=0.25,
+                           help="the fraction a rate may fall or a peak grow before it is flagged (default 0.25)")
+    argParser.add_argument("--repeat", type=int, default=5,
+                           help="the number of timed compiles of each case (default 5)")
+    argParser.add_argument("--seed", type=int, default=0, help="the seed of the programs (default 0)")
+    options = argParser.parse_args(argv)
+
+    results = [measure(shape, size, options.seed, options.repeat) for shape, size in CASES]
+    print(report(results))
+
+    if options.save or not os.path.exists(options.baseline):
+        with open(options.baseline, "w") as baselineFile:
+            json.dump(results, baselineFile, indent=2)
+        print("baseline saved to {}".format(options.baseline))
+        return 0
+
+    with open(options.baseline) as baselineFile:
+        regressions = compare(json.load(baselineFile), results, options.tolerance)
+    for regression in regressions:
+        print("regression: " + regression)
+    if len(regressions) == 0:
+        print("no regressions against {}".format(options.baseline))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,109 @@
+"""
+This module compares the recursive and the explicit stack parser engines
+on deeply nested and on wide inputs, and reports the memory used per
+token and per tree node. Run it from the command line:
+python benchParser.py
+"""
+import sys
+import timeit
+import tracemalloc
+from schemeparser import SchemeParser
+from tokenizer import Tokenizer
+
+def deepSource(depth):
+    """
+    Returns a program whose main is a chain of nested if expressions.
+
+    Arguments:
+    depth -- the number of nested if expressions.
+    """
+    return ("(define main " + "(if (= dup 0) 1 " * depth + "0" + ")" * depth +
+            ")\n")
+
+def wideSource(width):
+    """
+    Returns a program with many small top level definitions.
+
+    Arguments:
+    width -- the number of definitions.
+    """
+    return "".join("(define f{0} (lambda (* dup (- dup {0}))))\n".format(idx)
+                   for idx in range(width))
+
+def tokenize(source):
+    tokenizer = Tokenizer(SchemeParser.COMMENT,
+                          SchemeParser.KEYWORDS,
+                          SchemeParser.OPERATORS,
+                          SchemeParser.SEPARATORS)
+    tokenizer.tokenizeLine(source)
+    return tokenizer.tokenList
+
+def timeEngine(tokenList, recursive, repeat):
+    """
+    Returns the best time in seconds to parse the tokens, or None if the
+    engine exceeded the recursion limit.
+    """
+    def run():
+        SchemeParser(recursive).parse(tokenList)
+    try:
+        return min(timeit.repeat(run, number=1, repeat=repeat))
+    except RecursionError:
+        return None
+
+def tableSource(length):
+    """
+    Returns a program with a single bytes table on one line.
+
+    Arguments:
+    length -- the number of values in the table.
+    """
+    return ("(define table (bytes '(" +
+            " ".join(str(idx % 256) for idx in range(length)) + ")))\n")
+
+def countNodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count = count + 1
+        stack.extend(node.children)
+    return count
+
+def measureMemory(source):
+    """
+    Returns the bytes allocated per token and per tree node.
+    """
+    tracemalloc.start()
+    try:
+        tokenList = tokenize(source)
+        tokenMemory = tracemalloc.get_traced_memory()[0]
+        parser = SchemeParser()
+        parser.parse(tokenList)
+        nodeMemory = tracemalloc.get_traced_memory()[0] - tokenMemory
+    finally:
+        tracemalloc.stop()
+    return tokenMemory / len(tokenList), nodeMemory / countNodes(parser.astRoot)
+
+def formatTime(seconds):
+    if seconds == None:
+        return "RecursionError"
+    return "{:.2f} ms".format(seconds * 1000)
+
+def main(repeat=5):
+    cases = [("deep", depth, deepSource(depth)) for depth in (100, 250, 2500, 25000)]
+    cases += [("wide", width, wideSource(width)) for width in (1000, 10000)]
+
+    print("recursion limit {}".format(sys.getrecursionlimit()))
+    print("{:<6}{:>8}{:>10}{:>18}{:>18}".format("shape", "size", "tokens", "recursive", "iterative"))
+    for shape, size, source in cases:
+        tokenList = tokenize(source)
+        recursive = timeEngine(tokenList, True, repeat)
+        iterative = timeEngine(tokenList, False, repeat)
+        print("{:<6}{:>8}{:>10}{:>18}{:>18}".format(shape, size, len(tokenList),
+              formatTime(recursive), formatTime(iterative)))
+
+    perToken, perNode = measureMemory(wideSource(20000) + tableSource(100000))
+    print("memory {:.1f} bytes/token {:.1f} bytes/node".format(perToken, perNode))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+This module contains the branch layout pass, which runs on the listing of
+each top level form after the peephole optimizer. A 6502 relative branch
+only reaches 127 bytes forward or 128 back, and the NMOS 6502 has no bra.
+The pass first threads jumps whose target is another jump or a return, as
+happens at the end of nested if expressions. It then lays the code out with
+the shortest branch that reaches, starting from short branches everywhere
+and only lengthening the ones that don't reach. A conditional branch that
+doesn't reach is inverted to skip over a jmp, and a bra becomes a jmp.
+"""
+from assembly import Instruction
+from simulator import Simulator
+import os
+import re
+
+class BranchLayout:
+    CPUS = ("nmos", "65c02")
+    # Each conditional branch and the one with the opposite condition.
+    INVERSE = {"beq" : "bne", "bne" : "beq"}
+    BRANCHES = ("beq", "bne", "bra")
+    JUMPS = ("bra", "jmp")
+    # Lines that take no space, so a jump to them lands on what follows.
+    EMPTY = (None, ".alias", ".scend", ".scope")
+    LABEL = re.compile(r"[A-Za-z_]\w*$")
+
+    def __init__(self, cpu = "65c02", threadJumps = True):
+        """
+        Initializer for the processor the code runs on.
+
+        Arguments:
+        cpu -- nmos for the original 6502 which has no bra, or 65c02.
+        threadJumps -- retarget jumps to jumps and returns.
+        """
+        if cpu not in BranchLayout.CPUS:
+            raise Exception('Unknown CPU {}, use one of {}'.format(cpu, ", ".join(BranchLayout.CPUS)))
+        self.cpu = cpu
+        self.threadJumps = threadJumps
+        # The sizes of the reference implementations, an opcode that isn't
+        # known is given the size of the largest so no branch is too short.
+        self.sizes = {opcode : entry[1] for opcode, entry in Simulator().instructions.items()}
+        self.unknownSize = max(self.sizes.values())
+        self.threaded = 0
+        self.returns = 0
+        self.relaxed = 0
+        self.labelCount = 0
+
+    def layout(self, instructions):
+        """
+        Threads the jumps of a form and chooses the size of each branch.
+
+        Arguments:
+        instructions -- the instruction records of a form.
+
+        Returns:
+        the new list of instruction records.
+        """
+        # The new labels only have to be unique within the form.
+        self.labelCount = 0
+        if self.threadJumps:
+            instructions = self.thread(instructions)
+        return self.relax(instructions)
+
+    def thread(self, instructions):
+        chains, labels = self.scopes(instructions)
+        replacements = {}
+        inserts = {}
+        for idx, instruction in enumerate(instructions):
+            if instruction.opcode not in BranchLayout.BRANCHES + ("jmp",) or not self.isLabel(instruction):
+                continue
+            target = self.resolve(instruction.operand, chains[idx], labels)
+            if target == None:
+                continue
+
+            # Follow the chain of unconditional jumps from the target.
+            final = target
+            landing = self.landing(instructions, target)
+            seen = {target}
+            while (landing != None and instructions[landing].opcode in BranchLayout.JUMPS and
+                   self.isLabel(instructions[landing])):
+                following = self.resolve(instructions[landing].operand, chains[landing], labels)
+                if following == None or following in seen:
+                    break
+                seen.add(following)
+                final = following
+                landing = self.landing(instructions, following)
+
+            if (instruction.opcode in BranchLayout.JUMPS and landing != None and
+                instructions[landing].opcode == "rts"):
+                # Jumping to a return is the same as returning.
+                replacements[idx] = Instruction("rts", None, instruction.label)
+                self.returns = self.returns + 1
+            elif final != target:
+                # Only a label in a scope that encloses the branch can be
+                # seen from it.
+                scope = chains[final]
+                if len(scope) == 0 or chains[idx][:len(scope)] != scope:
+                    continue
+                name = instructions[final].label
+                if self.resolve(name, chains[idx], labels) != final:
+                    if final not in inserts:
+                        inserts[final] = self.newLabel("_jt")
+                    name = inserts[final]
+                replacements[idx] = instruction._replace(operand = name)
+                self.threaded = self.threaded + 1
+
+        output = []
+        for idx, instruction in enumerate(instructions):
+            if idx in inserts:
+                output.append(Instruction(label = inserts[idx]))
+            output.append(replacements.get(idx, instruction))
+        return output
+
+    def relax(self, instructions):
+        chains, labels = self.scopes(instructions)
+        long = set()
+        if self.cpu == "nmos":
+            long.update(idx for idx, instruction in enumerate(instructions) if instruction.opcode == "bra")
+
+        # Lengthening a branch only moves others further apart, so this
+        # stops once every branch that is left short reaches.
+        grew = True
+        while grew:
+            grew = False
+            addresses = self.addresses(instructions, long)
+            for idx, instruction in enumerate(instructions):
+                if instruction.opcode not in BranchLayout.BRANCHES or idx in long:
+                    continue
+                target = self.resolve(instruction.operand, chains[idx], labels) if self.isLabel(instruction) else None
+                if target == None or not -128 <= addresses[target] - (addresses[idx] + 2) <= 127:
+                    long.add(idx)
+                    grew = True
+
+        output = []
+        for idx, instruction in enumerate(instructions):
+            if idx not in long:
+                output.append(instruction)
+            elif instruction.opcode == "bra":
+                output.append(Instruction("jmp", instruction.operand, instruction.label))
+            else:
+                skip = self.newLabel("_br")
+                output.append(Instruction(BranchLayout.INVERSE[instruction.opcode], skip, instruction.label))
+                output.append(Instruction("jmp", instruction.operand))
+                output.append(Instruction(label = skip))
+                self.relaxed = self.relaxed + 1
+        return output
+
+    def scopes(self, instructions):
+        """
+        Returns the chain of scopes each line is in, and a dictionary of
+        the (scope, name) of each label to its line. Global labels are in
+        scope None.
+        """
+        chains = []
+        labels = {}
+        chain = ()
+        count = 0
+        for idx, instruction in enumerate(instructions):
+            if instruction.opcode == ".scope":
+                count = count + 1
+                chain = chain + (count,)
+            chains.append(chain)
+            if instruction.label != None:
+                scope = chain[-1] if instruction.label.startswith("_") and chain else None
+                labels.setdefault((scope, instruction.label), idx)
+            if instruction.opcode == ".scend":
+                chain = chain[:-1]
+        return chains, labels
+
+    def resolve(self, name, chain, labels):
+        # A local label is found in the innermost scope that defines it.
+        if name.startswith("_"):
+            for scope in reversed(chain):
+                if (scope, name) in labels:
+                    return labels[(scope, name)]
+        return labels.get((None, name))
+
+    def landing(self, instructions, idx):
+        # The first line at or after idx that takes space.
+        while idx < len(instructions) and instructions[idx].opcode in BranchLayout.EMPTY:
+            idx = idx + 1
+        return idx if idx < len(instructions) else None
+
+    def addresses(self, instructions, long):
+        addresses = []
+        address = 0
+        for idx, instruction in enumerate(instructions):
+            addresses.append(address)
+            address = address + self.size(instruction, idx in long)
+        return addresses
+
+    def size(self, instruction, long = False):
+        """
+        Returns the bytes an instruction takes.
+
+        Arguments:
+        instruction -- the instruction record.
+        long -- the branch is a jmp, or an inverted branch over a jmp.
+        """
+        if instruction.opcode in BranchLayout.EMPTY:
+            return 0
+        if long:
+            return 3 if instruction.opcode == "bra" else 5
+        if instruction.opcode == ".byte":
+            return sum(len(item) - 2 if item.startswith("\"") else 1
+                       for item in self.splitData(instruction.operand))
+        if instruction.opcode == ".word":
+            return 2 * len(self.splitData(instruction.operand))
+        if instruction.opcode == ".incbin":
+            return os.path.getsize(instruction.operand.strip("\""))
+        return self.sizes.get(instruction.opcode, self.unknownSize)
+
+    def splitData(self, operand):
+        # Commas inside strings don't separate items.
+        return re.findall(r'"[^"]*"|[^,\s][^,]*', operand)
+
+    def isLabel(self, instruction):
+        return instruction.operand != None and BranchLayout.LABEL.match(instruction.operand) != None
+
+    def newLabel(self, prefix):
+        self.labelCount = self.labelCount + 1
+        return "{}_{}".format(prefix, self.labelCount)
+
+    def report(self):
+        """
+        Returns a text report of the jumps threaded and branches relaxed.
+        """
+        return "branches: {} jumps threaded, {} jumps to a return replaced, {} branches relaxed for {}".format(
+               self.threaded, self.returns, self.relaxed, self.cpu)
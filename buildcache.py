@@ -0,0 +1,147 @@
+"""
+This module contains the on disk cache of the code generated for each top
+level form. A form's entry is keyed by a digest of its syntax tree, the
+compiler's own source and the options, so a rebuild after an edit only
+generates the forms that changed and splices in the rest. The entries of
+each version of the compiler are kept in a directory of their own, and
+those of other versions are removed when the cache is opened.
+"""
+from assembly import formatListing, parseListing
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+class BuildCache:
+    # The characters of the compiler digest that name the directory of its
+    # entries.
+    GENERATION = 16
+    # The modules whose code decides what is generated for a form.
+    SOURCES = ("assembly.py", "branches.py", "filetable.py", "peephole.py", "simulator.py", "symboltable.py",
+               "tinylisp.py")
+
+    def __init__(self, directory = ".tinycomp-cache", limit = None):
+        """
+        Initializer that creates the cache directory if it is missing and
+        removes the entries written by other versions of the compiler.
+
+        Arguments:
+        directory -- the directory that holds the entries, or None to
+        keep them in memory for as long as the cache lives.
+        limit -- the most entries kept in memory, the least recently used
+        are dropped beyond it, or None for no limit.
+        """
+        self.directory = None
+        self.entries = OrderedDict()
+        self.limit = limit
+        self.version = self.compilerDigest()
+        if directory != None:
+            self.directory = Path(directory) / self.version[:BuildCache.GENERATION]
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.prune()
+        self.hits = 0
+        self.misses = 0
+
+    def compilerDigest(self):
+        """
+        Returns a digest of the compiler's source, so entries written by
+        another version of the compiler are never used.
+        """
+        digest = hashlib.sha1()
+        home = Path(__file__).parent
+        for name in BuildCache.SOURCES:
+            digest.update((home / name).read_bytes())
+        return digest.hexdigest()
+
+    def prune(self):
+        """
+        Removes the entries of other versions of the compiler, which are
+        never read again. Only the names the cache writes are touched.
+        """
+        pattern = re.compile("[0-9a-f]{{{}}}$".format(BuildCache.GENERATION))
+        for child in self.directory.parent.iterdir():
+            if child == self.directory:
+                continue
+            if child.is_dir() and pattern.match(child.name):
+                shutil.rmtree(str(child), ignore_errors=True)
+            elif child.suffix in (".asm", ".tmp") and re.match("[0-9a-f]{40}$", child.stem):
+                # The entries of a cache written before the versions had
+                # directories of their own.
+                child.unlink(missing_ok=True)
+
+    def key(self, node, context):
+        """
+        Returns the key of a form.
+
+        Arguments:
+        node -- the syntax tree of the form.
+        context -- a string of everything else the generated code depends
+        on, such as the options.
+        """
+        digest = hashlib.sha1()
+        digest.update(self.version.encode("utf-8"))
+        digest.update(context.encode("utf-8"))
+        self.digestTree(node, digest)
+        return digest.hexdigest()
+
+    def digestTree(self, node, digest):
+        # The lengths keep values and child counts from running together.
+        value = "" if node.value == None else str(node.value)
+        digest.update("{} {} {} {}:{}\n".format(node.type, int(node.quoted), len(node.children),
+                                                len(value), value).encode("utf-8"))
+        for child in node.children:
+            self.digestTree(child, digest)
+
+    def get(self, key):
+        """
+        Returns the cached instructions for a key, or None when there are
+        none.
+        """
+        if self.directory == None:
+            instructions = self.entries.get(key)
+            if instructions == None:
+                self.misses = self.misses + 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return list(instructions)
+
+        try:
+            text = (self.directory / (key + ".asm")).read_text()
+        except OSError:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        return parseListing(text)
+
+    def put(self, key, instructions):
+        """
+        Stores the instructions for a key. The file is renamed into place
+        so builds running at the same time never read a partial entry.
+        """
+        if self.directory == None:
+            self.entries[key] = list(instructions)
+            self.entries.move_to_end(key)
+            while self.limit != None and len(self.entries) > self.limit:
+                self.entries.popitem(last=False)
+            return
+
+        # A newer compiler opening the cache at the same time may have
+        # removed the directory, then the entry just isn't kept.
+        try:
+            descriptor, name = tempfile.mkstemp(dir=str(self.directory), suffix=".tmp")
+            with os.fdopen(descriptor, "w") as entryFile:
+                entryFile.write(formatListing(instructions))
+            os.replace(name, str(self.directory / (key + ".asm")))
+        except OSError:
+            pass
+
+    def report(self):
+        """
+        Returns a text report of the cache hits and misses.
+        """
+        return "cache: {} forms reused, {} generated in {}".format(
+               self.hits, self.misses, self.directory or "memory")
@@ -0,0 +1,146 @@
+"""
+This module contains the build driver which compiles many source files, or
+every .scm file below a directory, across a pool of processes. The results
+are reported in the order of the sources whatever order the files finish
+in, and a failure in one file is collected rather than stopping the build.
+Run it from the command line, options it doesn't know are passed on to the
+compiler: python builder.py --jobs 4 src -O2
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tinylisp import compileFile, parseArguments as parseCompilerArguments
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+def parseArguments(argv):
+    """
+    Parses the command line into the build options and the arguments that
+    are passed on to the compiler.
+
+    Arguments:
+    argv -- the command line arguments without the program name.
+    """
+    argParser = argparse.ArgumentParser(description="Builds many Tiny Scheme sources in parallel.")
+    argParser.add_argument("sources", nargs="+", help="the source files and directories of them")
+    argParser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                           help="the number of files compiled at once (default the number of CPUs)")
+    argParser.add_argument("--output-dir", help="the directory for the assembler files, "
+                           "by default they are written next to the sources")
+    argParser.add_argument("-v", "--verbose", action="store_true",
+                           help="print what the compiler printed for each file")
+    return argParser.parse_known_args(argv)
+
+def collectSources(paths):
+    """
+    Returns the (source, relative name) pairs for the paths, a directory
+    standing for the .scm files below it in sorted order.
+
+    Arguments:
+    paths -- the source files and directories.
+    """
+    sources = []
+    seen = set()
+    for path in map(Path, paths):
+        if path.is_dir():
+            found = [(source, source.relative_to(path)) for source in sorted(path.rglob("*.scm"))]
+        else:
+            found = [(path, Path(path.name))]
+        for source, relative in found:
+            if source.resolve() not in seen:
+                seen.add(source.resolve())
+                sources.append((source, relative))
+    return sources
+
+def outputPath(source, relative, outputDir):
+    if outputDir == None:
+        return source.with_suffix(".asm")
+    return Path(outputDir) / relative.with_suffix(".asm")
+
+def buildFile(sourceName, outputName, compilerArguments):
+    """
+    Compiles one file, which runs in a worker process.
+
+    Arguments:
+    sourceName -- the name of the source file.
+    outputName -- the name of the assembler file.
+    compilerArguments -- the command line options for the compiler.
+
+    Returns:
+    a tuple of what the compiler printed and the error, which is None
+    when the file compiled.
+    """
+    printed = io.StringIO()
+    try:
+        options = parseCompilerArguments([sourceName] + compilerArguments)
+        Path(outputName).parent.mkdir(parents=True, exist_ok=True)
+        with contextlib.redirect_stdout(printed):
+            compileFile(sourceName, outputName, options)
+    except SystemExit:
+        # argparse exits on bad options, which fails this file.
+        return printed.getvalue(), "invalid compiler options {}".format(" ".join(compilerArguments))
+    except Exception as ex:
+        return printed.getvalue(), str(ex) or type(ex).__name__
+    return printed.getvalue(), None
+
+def build(sources, outputDir = None, jobs = 1, compilerArguments = ()):
+    """
+    Compiles the sources and returns their results in the same order.
+
+    Arguments:
+    sources -- the (source, relative name) pairs from collectSources.
+    outputDir -- the directory for the assembler files, or None to write
+    them next to the sources.
+    jobs -- the number of worker processes, 1 compiles in this process.
+    compilerArguments -- the command line options for the compiler.
+
+    Returns:
+    a list of (source, output, printed, error) tuples.
+    """
+    outputs = [outputPath(source, relative, outputDir) for source, relative in sources]
+    # Two sources with the same name in different directories would
+    # overwrite each other's output, or race on it in two workers.
+    writers = {}
+    for (source, relative), output in zip(sources, outputs):
+        other = writers.setdefault(output.resolve(), source)
+        if other != source:
+            raise Exception("{} and {} both write {}".format(other, source, output))
+    arguments = ([str(source) for source, relative in sources], [str(output) for output in outputs],
+                 [list(compilerArguments)] * len(sources))
+    if jobs > 1 and len(sources) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(buildFile, *arguments))
+    else:
+        results = list(map(buildFile, *arguments))
+    return [(source, output, printed, error)
+            for (source, relative), output, (printed, error) in zip(sources, outputs, results)]
+
+def main(argv):
+    options, compilerArguments = parseArguments(argv)
+    sources = collectSources(options.sources)
+    if len(sources) == 0:
+        print("no sources found", file=sys.stderr)
+        return 1
+
+    try:
+        results = build(sources, options.output_dir, options.jobs, compilerArguments)
+    except Exception as ex:
+        print("error: {}".format(ex), file=sys.stderr)
+        return 1
+
+    failures = 0
+    for source, output, printed, error in results:
+        if options.verbose and printed:
+            print(printed, end="")
+        if error == None:
+            print("{} -> {}".format(source, output))
+        else:
+            failures = failures + 1
+            print("{}: error: {}".format(source, error), file=sys.stderr)
+    print("built {} of {} files".format(len(sources) - failures, len(sources)))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
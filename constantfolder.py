@@ -0,0 +1,113 @@
+"""
+This module contains the constant folding pass which runs on the abstract
+syntax tree before code generation. Arithmetic whose operands are all
+literals is evaluated with the 16 bit wraparound of the target, and an if
+whose test compares literals is replaced by the test and the branch that is
+taken. Only what the code generator emits code for is folded.
+"""
+from schemeparser import AbstractSyntaxTree
+
+class ConstantFolder:
+    # The target machine word.
+    MASK = 0xFFFF
+
+    def __init__(self):
+        self.arithmetic = {
+            AbstractSyntaxTree.SUB : lambda a, b: a - b,
+            AbstractSyntaxTree.MULTIPLY : lambda a, b: a * b,
+            AbstractSyntaxTree.DIVIDE : lambda a, b: a // b if b != 0 else None
+        }
+        # Comparisons set the processor flags rather than leave a value
+        # on the data stack, so they only fold as the test of an if.
+        self.comparisons = {
+            AbstractSyntaxTree.EQUALS : lambda a, b: a == b
+        }
+        self.folds = 0
+
+    def fold(self, node):
+        """
+        Folds the constant expressions below a node in place.
+
+        Arguments:
+        node -- the root of the tree to fold.
+        """
+        idx = 0
+        while idx < len(node.children):
+            child = node.children[idx]
+            if child.type == AbstractSyntaxTree.SEXPR and not child.quoted:
+                self.fold(child)
+                replacement = self.foldSexpr(child)
+                if replacement != None:
+                    # The replacement was folded along with its parent.
+                    node.children[idx] = replacement
+                    self.folds = self.folds + 1
+            idx = idx + 1
+
+    def foldSexpr(self, node):
+        """
+        Returns the node that replaces an S expression, or None if it
+        can't be folded.
+
+        Arguments:
+        node -- the S expression whose children are already folded.
+        """
+        if len(node.children) == 0:
+            return None
+
+        operator = node.children[0].type
+        if operator in self.arithmetic and len(node.children) == 3:
+            a = self.literalValue(node.children[1])
+            b = self.literalValue(node.children[2])
+            if a != None and b != None:
+                value = self.arithmetic[operator](a, b)
+                if value != None:
+                    return self.createLiteral(value)
+        elif operator == AbstractSyntaxTree.IF and len(node.children) >= 3:
+            # Only a branch that is a single expression can be moved into
+            # the place of the if. The test stays in front of it, since a
+            # later if may test the flags it sets.
+            test = self.testValue(node.children[1])
+            if test == True:
+                branch = node.children[2:3]
+            elif test == False:
+                branch = node.children[3:]
+            else:
+                return None
+            if len(branch) == 1 and self.canReplace(branch[0]):
+                replacement = AbstractSyntaxTree(type = AbstractSyntaxTree.SEXPR)
+                replacement.children = [node.children[1], branch[0]]
+                return replacement
+        return None
+
+    def canReplace(self, node):
+        # The branch follows the test, where an identifier is a variable as
+        # it was in the if. Keywords other than dup consume their siblings
+        # and can't move at all.
+        return node.type in (AbstractSyntaxTree.SEXPR, AbstractSyntaxTree.LITERAL,
+                             AbstractSyntaxTree.DUP, AbstractSyntaxTree.IDENTIFIER)
+
+    def testValue(self, node):
+        """
+        Returns the outcome of an if test that compares literals, or None
+        if it isn't known at compile time.
+        """
+        if node.type != AbstractSyntaxTree.SEXPR or len(node.children) != 3:
+            return None
+        comparison = self.comparisons.get(node.children[0].type)
+        a = self.literalValue(node.children[1])
+        b = self.literalValue(node.children[2])
+        if comparison == None or a == None or b == None:
+            return None
+        return comparison(a, b)
+
+    def literalValue(self, node):
+        if node.type != AbstractSyntaxTree.LITERAL or node.quoted:
+            return None
+        try:
+            return int(node.value) & ConstantFolder.MASK
+        except ValueError:
+            return None
+
+    def createLiteral(self, value):
+        return AbstractSyntaxTree(type = AbstractSyntaxTree.LITERAL,
+                                  value = str(value & ConstantFolder.MASK))
@@ -0,0 +1,115 @@
+"""
+This module contains the dead code pass which runs on the abstract syntax
+tree before code generation. Starting from main, and any names that must be
+kept, it follows the symbols bound to the identifiers and the string
+references of each define it reaches. The defines and pool strings that are
+never reached are dropped, since every byte of them would otherwise end up
+in ROM.
+"""
+from filetable import isFileTable
+from schemeparser import AbstractSyntaxTree, stringDigest
+
+class DeadCodeEliminator:
+    def __init__(self, keep = ()):
+        """
+        Initializer for the names reachability starts from.
+
+        Arguments:
+        keep -- the names of defines to keep along with main, for example
+        entry points called from outside the program.
+        """
+        self.keep = ["main"] + [name for name in keep if name != "main"]
+        self.reached = set()
+        self.dropped = []
+        self.droppedStrings = 0
+
+    def eliminate(self, root):
+        """
+        Removes the unreachable defines and pool strings below the root
+        in place. Nothing is removed when none of the names to keep is
+        defined, as in a library without a main.
+
+        Arguments:
+        root -- the root of the abstract syntax tree.
+        """
+        # The symbols referenced by each define, code outside a define is
+        # owned by None and always runs.
+        self.symbols = {None : set()}
+        self.strings = {None : set()}
+        self.collect(root, None)
+
+        defined = {symbol.name : symbol for symbol in self.symbols if symbol != None}
+        work = [defined[name] for name in self.keep if name in defined]
+        if len(work) == 0:
+            return
+        work.extend(self.symbols[None])
+        strings = set(self.strings[None])
+        while work:
+            symbol = work.pop()
+            if symbol in self.reached or symbol not in self.symbols:
+                continue
+            self.reached.add(symbol)
+            work.extend(self.symbols[symbol])
+            strings.update(self.strings[symbol])
+        self.prune(root, strings)
+
+    def collect(self, node, owner):
+        """
+        Records the symbols and strings referenced below a node. A define
+        can be nested in another, when its parentheses are unbalanced,
+        and then owns its own references.
+        """
+        for idx, child in enumerate(node.children):
+            symbol = self.definedSymbol(child)
+            if symbol != None:
+                self.symbols.setdefault(symbol, set())
+                self.strings.setdefault(symbol, set())
+                self.collect(child, symbol)
+            elif child.type == AbstractSyntaxTree.IDENTIFIER:
+                # The identifier after define is the name being defined,
+                # every other one is a call, a variable or an address.
+                if (child.symbol != None and
+                    not (idx == 1 and node.children[0].type == AbstractSyntaxTree.DEFINE)):
+                    self.symbols[owner].add(child.symbol)
+            elif child.type == AbstractSyntaxTree.REFERENCE:
+                self.strings[owner].add(child.value)
+            elif child.type != AbstractSyntaxTree.STRING_POOL and not isFileTable(child):
+                # The names in a file form are options.
+                self.collect(child, owner)
+
+    def prune(self, node, strings):
+        children = []
+        for child in node.children:
+            symbol = self.definedSymbol(child)
+            if symbol != None and symbol not in self.reached:
+                # Keep the defines that are nested in a dropped one.
+                self.dropped.append(symbol.name)
+                self.prune(child, strings)
+                children.extend(nested for nested in child.children
+                                if self.definedSymbol(nested) != None)
+                continue
+            if child.type == AbstractSyntaxTree.STRING_POOL:
+                kept = [string for string in child.children if stringDigest(string.value) in strings]
+                self.droppedStrings = self.droppedStrings + len(child.children) - len(kept)
+                child.children = kept
+            else:
+                self.prune(child, strings)
+            children.append(child)
+        node.children = children
+
+    def definedSymbol(self, node):
+        if (node.type == AbstractSyntaxTree.SEXPR and len(node.children) >= 2 and
+            node.children[0].type == AbstractSyntaxTree.DEFINE and
+            node.children[1].type == AbstractSyntaxTree.IDENTIFIER):
+            return node.children[1].symbol
+        return None
+
+    def report(self):
+        """
+        Returns a text report of the dropped defines and strings.
+        """
+        lines = ["dead code: {} defines kept, {} dropped, {} strings dropped".format(
+                 len(self.reached), len(self.dropped), self.droppedStrings)]
+        for name in self.dropped:
+            lines.append("    {}".format(name))
+        return "\n".join(lines)
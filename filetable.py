@@ -0,0 +1,203 @@
+"""
+This module reads the tables that bytes and words take from a file rather
+than from a quoted list, e.g. (define sine (bytes (file "sine.bin"))). The
+values never pass through the tokenizer and parser. A binary file is mapped
+into memory and converted a chunk at a time, a file ending in .csv holds
+numbers separated by commas or new lines. The options after the path are:
+width N -- the bytes of each value in a binary file, 1 or 2, by default the
+width of the table.
+big, little -- the byte order of a binary file, by default little like the
+6502.
+csv -- read the file as numbers whatever its name.
+start N, end N -- only the values from index start up to end, like a slice.
+"""
+from schemeparser import AbstractSyntaxTree
+import array
+import csv
+import mmap
+import os
+import sys
+
+class FileTable:
+    # The values emitted on each line of a data directive.
+    CHUNK = 32
+    FLAGS = ("big", "csv", "little")
+    NUMBERS = ("end", "start", "width")
+    WIDTHS = (1, 2)
+
+    def __init__(self, node, width, directory = ""):
+        """
+        Initializer for the table a file form describes.
+
+        Arguments:
+        node -- the S expression that starts with file.
+        width -- the bytes of each value of the table, 1 for bytes and 2
+        for words.
+        directory -- the directory a relative path is in, that of the source.
+        """
+        if len(node.children) < 2 or node.children[1].type != AbstractSyntaxTree.STRING:
+            raise Exception('File requires a path string.')
+        self.width = width
+        self.path = os.path.join(directory, node.children[1].value)
+        self.big = False
+        self.csv = self.path.lower().endswith(".csv")
+        self.elementWidth = width
+        self.start = None
+        self.end = None
+
+        idx = 2
+        while idx < len(node.children):
+            option = node.children[idx].value if node.children[idx].type == AbstractSyntaxTree.IDENTIFIER else None
+            if option in FileTable.FLAGS:
+                if option == "csv":
+                    self.csv = True
+                else:
+                    self.big = option == "big"
+            elif option in FileTable.NUMBERS:
+                idx = idx + 1
+                value = self.number(node.children[idx] if idx < len(node.children) else None)
+                if value == None:
+                    raise Exception("File option '{}' requires a number.".format(option))
+                if option == "width":
+                    if value not in FileTable.WIDTHS:
+                        raise Exception("File width must be 1 or 2, not {}.".format(value))
+                    self.elementWidth = value
+                elif option == "start":
+                    self.start = value
+                else:
+                    self.end = value
+            else:
+                raise Exception("Unknown file option '{}'.".format(node.children[idx].value))
+            idx = idx + 1
+
+    def number(self, node):
+        if node == None or node.type != AbstractSyntaxTree.LITERAL or node.quoted:
+            return None
+        try:
+            return int(node.value, 0)
+        except ValueError:
+            return None
+
+    def canInclude(self):
+        """
+        Returns True when the file holds exactly the bytes of the table, so
+        the assembler can include it as it is.
+        """
+        return (not self.csv and self.start == None and self.end == None and
+                self.elementWidth == self.width and not (self.big and self.width > 1))
+
+    def count(self):
+        """
+        Returns the number of values in the table.
+        """
+        if self.csv:
+            return len(self.readCsv())
+        return len(range(*self.binarySlice(self.fileSize())))
+
+    def chunks(self):
+        """
+        Generator that yields the operand of a data directive for each
+        chunk of the values.
+        """
+        if self.csv:
+            values = self.readCsv()
+            for position in range(0, len(values), FileTable.CHUNK):
+                yield self.operand(values[position:position + FileTable.CHUNK])
+            return
+
+        try:
+            tableFile = open(self.path, "rb")
+        except OSError:
+            raise Exception("Can't read table file '{}'.".format(self.path))
+        with tableFile:
+            start, end, step = self.binarySlice(os.fstat(tableFile.fileno()).st_size)
+            if end <= start:
+                return
+            with mmap.mmap(tableFile.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+                size = FileTable.CHUNK * self.elementWidth
+                for position in range(start * self.elementWidth, end * self.elementWidth, size):
+                    data = mapped[position:min(position + size, end * self.elementWidth)]
+                    yield self.operand(self.convert(data))
+
+    def convert(self, data):
+        # Bytes are already values, words are swapped when the file's byte
+        # order isn't that of this machine.
+        if self.elementWidth == 1:
+            return data
+        values = array.array("H", data)
+        if self.big != (sys.byteorder == "big"):
+            values.byteswap()
+        return values
+
+    def operand(self, values):
+        if self.width < self.elementWidth and max(values) > 0xFF:
+            raise Exception("Value {} in '{}' doesn't fit in a byte.".format(max(values), self.path))
+        return ", ".join(map(str, values))
+
+    def fileSize(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            raise Exception("Can't read table file '{}'.".format(self.path))
+
+    def binarySlice(self, size):
+        if size % self.elementWidth != 0:
+            raise Exception("The size of '{}' isn't a multiple of {} bytes.".format(self.path, self.elementWidth))
+        return slice(self.start, self.end).indices(size // self.elementWidth)
+
+    def readCsv(self):
+        """
+        Returns the numbers of a CSV file in the slice.
+        """
+        limit = 1 << (8 * self.width)
+        values = []
+        try:
+            with open(self.path, newline = "") as csvFile:
+                for row in csv.reader(csvFile):
+                    for field in row:
+                        field = field.strip()
+                        if field == "":
+                            continue
+                        try:
+                            value = int(field, 0)
+                        except ValueError:
+                            raise Exception("'{}' in '{}' isn't a number.".format(field, self.path))
+                        if not 0 <= value < limit:
+                            raise Exception("Value {} in '{}' doesn't fit in {} bytes.".format(
+                                            value, self.path, self.width))
+                        values.append(value)
+        except OSError:
+            raise Exception("Can't read table file '{}'.".format(self.path))
+        return values[self.start:self.end]
+
+    def stamp(self):
+        """
+        Returns what identifies the contents of the file, its path, size
+        and time of last change.
+        """
+        try:
+            status = os.stat(self.path)
+        except OSError:
+            return (self.path, None, None)
+        return (self.path, status.st_size, status.st_mtime_ns)
+
+def isFileTable(node):
+    """
+    Returns True for an S expression that starts with file.
+    """
+    return (node.type == AbstractSyntaxTree.SEXPR and not node.quoted and len(node.children) > 0 and
+            node.children[0].type == AbstractSyntaxTree.FILE)
+
+def fileStamps(node, directory = ""):
+    """
+    Returns the stamps of the files of the file forms below a node, which
+    the build cache adds to the key of a form.
+    """
+    stamps = []
+    for child in node.children:
+        if isFileTable(child):
+            if len(child.children) > 1 and child.children[1].type == AbstractSyntaxTree.STRING:
+                stamps.append(FileTable(child, 1, directory).stamp())
+        else:
+            stamps.extend(fileStamps(child, directory))
+    return stamps
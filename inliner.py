@@ -0,0 +1,239 @@
+"""
+This module contains the inlining pass which runs on the abstract syntax
+tree before code generation. A call to a small lambda that makes no calls
+itself is replaced by a copy of its body, which saves the jsr and rts. A
+lambda whose calls were all replaced is dropped.
+"""
+from schemeparser import AbstractSyntaxTree
+
+class Inliner:
+    # The estimated bytes emitted for each kind of node.
+    SIZES = {
+        AbstractSyntaxTree.ADD : 3,
+        AbstractSyntaxTree.DISPLAY : 3,
+        AbstractSyntaxTree.DIVIDE : 3,
+        AbstractSyntaxTree.DUP : 10,
+        AbstractSyntaxTree.EQUALS : 3,
+        AbstractSyntaxTree.GREATER_THAN : 3,
+        AbstractSyntaxTree.IF : 4,
+        AbstractSyntaxTree.LESS_THAN : 3,
+        AbstractSyntaxTree.LITERAL : 10,
+        AbstractSyntaxTree.MULTIPLY : 3,
+        AbstractSyntaxTree.REFERENCE : 10,
+        AbstractSyntaxTree.SUB : 3
+    }
+    # The bytes of a call and of a return.
+    CALL_SIZE = 3
+    RETURN_SIZE = 1
+
+    def __init__(self, threshold = 32, optimizeSize = False):
+        """
+        Initializer for the inlining limits.
+
+        Arguments:
+        threshold -- the largest estimated size in bytes of a lambda body
+        that is inlined.
+        optimizeSize -- only inline a lambda when that doesn't make the
+        program larger, whatever the threshold.
+        """
+        self.threshold = threshold
+        self.optimizeSize = optimizeSize
+        self.inlined = {}
+        self.expanded = set()
+        self.dropped = []
+
+    def inline(self, root):
+        """
+        Inlines the calls to small leaf lambdas below the root in place.
+        A lambda that becomes a leaf once its own calls are inlined is
+        considered again, so this works up the call graph.
+
+        Arguments:
+        root -- the root of the abstract syntax tree.
+        """
+        changed = True
+        while changed:
+            lambdas = self.findLambdas(root)
+            graph = self.callGraph(lambdas)
+            calls = {}
+            self.countCalls(root, calls)
+            candidates = {}
+            for symbol, body in lambdas.items():
+                if len(graph[symbol]) == 0 and self.isWorthInlining(body, calls.get(symbol, 0)):
+                    candidates[symbol] = body
+            changed = self.replaceCalls(root, candidates) > 0
+        self.dropLambdas(root)
+
+    def findLambdas(self, root):
+        """
+        Returns a dictionary of the symbols of the defines of a lambda to
+        the nodes of its body.
+        """
+        lambdas = {}
+        for node in root.children:
+            if (node.type == AbstractSyntaxTree.SEXPR and len(node.children) == 3 and
+                node.children[0].type == AbstractSyntaxTree.DEFINE and
+                node.children[1].type == AbstractSyntaxTree.IDENTIFIER and
+                node.children[1].symbol != None):
+                value = node.children[2]
+                if (value.type == AbstractSyntaxTree.SEXPR and len(value.children) >= 2 and
+                    value.children[0].type == AbstractSyntaxTree.LAMBDA):
+                    # The code generator ignores the arguments of a lambda
+                    # with more than one expression after lambda.
+                    start = 2 if len(value.children) >= 3 else 1
+                    lambdas[node.children[1].symbol] = value.children[start:]
+        return lambdas
+
+    def callGraph(self, lambdas):
+        """
+        Returns a dictionary of each lambda to the set of symbols it calls.
+        """
+        graph = {}
+        for symbol, body in lambdas.items():
+            graph[symbol] = set()
+            for node in body:
+                self.findCalls(node, graph[symbol])
+        return graph
+
+    def findCalls(self, node, callees):
+        if node.type != AbstractSyntaxTree.SEXPR or node.quoted:
+            return
+        if len(node.children) > 0 and node.children[0].type == AbstractSyntaxTree.IDENTIFIER:
+            callees.add(self.callee(node))
+        for child in node.children:
+            self.findCalls(child, callees)
+
+    def countCalls(self, node, calls):
+        if node.quoted:
+            return
+        if (node.type == AbstractSyntaxTree.SEXPR and len(node.children) > 0 and
+            node.children[0].type == AbstractSyntaxTree.IDENTIFIER):
+            symbol = self.callee(node)
+            calls[symbol] = calls.get(symbol, 0) + 1
+        for child in node.children:
+            self.countCalls(child, calls)
+
+    def callee(self, node):
+        """
+        Returns the symbol an S expression calls through any aliases, or
+        None if its name isn't bound.
+        """
+        symbol = node.children[0].symbol
+        return symbol.resolve() if symbol != None else None
+
+    def estimateSize(self, node):
+        """
+        Returns the estimated bytes of code emitted for a node.
+        """
+        if node.quoted:
+            return 0
+        if node.type == AbstractSyntaxTree.IDENTIFIER:
+            # Only variables reach here, calls are counted by their S expression.
+            return 12
+        size = Inliner.SIZES.get(node.type, 0)
+        if (node.type == AbstractSyntaxTree.SEXPR and len(node.children) > 0 and
+            node.children[0].type == AbstractSyntaxTree.IDENTIFIER):
+            return size + Inliner.CALL_SIZE + sum(self.estimateSize(child) for child in node.children[1:])
+        return size + sum(self.estimateSize(child) for child in node.children)
+
+    def isWorthInlining(self, body, calls):
+        if calls == 0 or len(body) == 0:
+            return False
+        # Body nodes that aren't S expressions must not be the first of a
+        # sequence, where an identifier would be taken as a call.
+        for node in body:
+            if ((node.type != AbstractSyntaxTree.SEXPR or node.quoted) and
+                node.type not in (AbstractSyntaxTree.LITERAL, AbstractSyntaxTree.DUP)):
+                return False
+        size = sum(self.estimateSize(node) for node in body)
+        if self.optimizeSize:
+            # Every call site gets a copy, but the calls, the original
+            # body and its return go away.
+            return calls * size <= size + Inliner.RETURN_SIZE + calls * Inliner.CALL_SIZE
+        return size <= self.threshold
+
+    def replaceCalls(self, node, candidates):
+        """
+        Replaces the calls to the candidates below a node and returns how
+        many were replaced.
+        """
+        count = 0
+        for idx, child in enumerate(node.children):
+            if child.type != AbstractSyntaxTree.SEXPR or child.quoted:
+                continue
+            count = count + self.replaceCalls(child, candidates)
+            if (len(child.children) > 0 and
+                child.children[0].type == AbstractSyntaxTree.IDENTIFIER and
+                self.callee(child) in candidates):
+                symbol = self.callee(child)
+                replacement = self.expandCall(child, candidates[symbol])
+                if replacement != None:
+                    node.children[idx] = replacement
+                    self.expanded.add(symbol)
+                    self.inlined[symbol.name] = self.inlined.get(symbol.name, 0) + 1
+                    count = count + 1
+        return count
+
+    def expandCall(self, call, body):
+        """
+        Returns the node that replaces a call, which is a copy of the body
+        after the arguments, or None if it can't be replaced.
+        """
+        arguments = call.children[1:]
+        if len(arguments) == 0 and len(body) == 1 and body[0].type == AbstractSyntaxTree.SEXPR:
+            return self.copyTree(body[0])
+
+        # An S expression whose first child is not an identifier is a
+        # sequence that is evaluated in order.
+        if len(arguments) > 0 and arguments[0].type == AbstractSyntaxTree.IDENTIFIER:
+            return None
+        sequence = AbstractSyntaxTree(AbstractSyntaxTree.SEXPR)
+        sequence.children = arguments + [self.copyTree(node) for node in body]
+        return sequence
+
+    def copyTree(self, node):
+        copy = AbstractSyntaxTree(node.type, node.value, node.quoted)
+        copy.symbol = node.symbol
+        copy.children = [self.copyTree(child) for child in node.children]
+        return copy
+
+    def dropLambdas(self, root):
+        """
+        Removes the defines of inlined lambdas that are no longer
+        referenced.
+        """
+        references = set()
+        self.findReferences(root, references)
+        children = []
+        for node in root.children:
+            symbol = self.definedSymbol(node)
+            if symbol in self.expanded and symbol not in references and symbol.name != "main":
+                self.dropped.append(symbol.name)
+            else:
+                children.append(node)
+        root.children = children
+
+    def findReferences(self, node, references):
+        for idx, child in enumerate(node.children):
+            if child.type == AbstractSyntaxTree.IDENTIFIER:
+                if not (idx == 1 and node.children[0].type == AbstractSyntaxTree.DEFINE):
+                    references.add(child.symbol)
+            else:
+                self.findReferences(child, references)
+
+    def definedSymbol(self, node):
+        if (node.type == AbstractSyntaxTree.SEXPR and len(node.children) >= 2 and
+            node.children[0].type == AbstractSyntaxTree.DEFINE):
+            return node.children[1].symbol
+        return None
+
+    def report(self):
+        """
+        Returns a text report of the inlined calls and dropped lambdas.
+        """
+        lines = ["inliner: {} calls inlined, {} lambdas dropped".format(
+                 sum(self.inlined.values()), len(self.dropped))]
+        for name in sorted(self.inlined):
+            lines.append("    {:<24}{:>6}{}".format(name, self.inlined[name],
+                         " dropped" if name in self.dropped else ""))
+        return "\n".join(lines)
@@ -0,0 +1,163 @@
+"""
+This module contains the optional instrumentation of a compile. It records
+the wall time and the memory allocated by each phase, the rate tokens are
+read at, the syntax tree nodes of each type, how often each handler of the
+dispatch tables runs and the instructions emitted. The compiler only calls
+into it when it is given an Instrumentation, with --stats on the command
+line, so a normal compile pays nothing for it.
+"""
+from assembly import countInstructions
+from schemeparser import AbstractSyntaxTree
+import contextlib
+import json
+import time
+import tracemalloc
+
+class Instrumentation:
+    def __init__(self, traceMemory = True):
+        """
+        Initializer for empty statistics.
+
+        Arguments:
+        traceMemory -- record the allocations of each phase with
+        tracemalloc, which slows the phases down.
+        """
+        self.traceMemory = traceMemory
+        self.phases = []
+        self.tokens = 0
+        self.nodes = {}
+        self.dispatches = {}
+        self.instructions = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager that records the wall time and allocations of the
+        code it wraps as a phase.
+
+        Arguments:
+        name -- the name of the phase.
+        """
+        tracing = self.traceMemory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.traceMemory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = {"phase" : name, "seconds" : time.perf_counter() - start}
+            if self.traceMemory:
+                current, peak = tracemalloc.get_traced_memory()
+                entry["allocated"] = current - before
+                entry["peak"] = peak - before
+            if tracing:
+                tracemalloc.stop()
+            self.phases.append(entry)
+
+    def countDispatch(self, table):
+        """
+        Replaces the handlers of a dispatch table in place with ones that
+        count their calls.
+
+        Arguments:
+        table -- a dictionary of token or node types to bound methods.
+        """
+        for key, handler in table.items():
+            table[key] = self.counted(handler)
+
+    def counted(self, handler):
+        name = handler.__qualname__
+        self.dispatches.setdefault(name, 0)
+        dispatches = self.dispatches
+
+        def call(*arguments):
+            dispatches[name] += 1
+            return handler(*arguments)
+        return call
+
+    def countNodes(self, node):
+        """
+        Counts the nodes of a syntax tree by type.
+        """
+        name = AbstractSyntaxTree.NAMES[node.type]
+        self.nodes[name] = self.nodes.get(name, 0) + 1
+        for child in node.children:
+            self.countNodes(child)
+
+    def countListing(self, instructions):
+        """
+        Counts the lines of a listing, the machine instructions and macros
+        among them, and each opcode.
+        """
+        opcodes = {}
+        for instruction in instructions:
+            if instruction.isInstruction():
+                opcodes[instruction.opcode] = opcodes.get(instruction.opcode, 0) + 1
+        self.instructions = {"lines" : len(instructions),
+                             "instructions" : countInstructions(instructions),
+                             "opcodes" : opcodes}
+
+    def seconds(self, name):
+        return sum(entry["seconds"] for entry in self.phases if entry["phase"] == name)
+
+    def toDict(self):
+        """
+        Returns the statistics as a dictionary that can be written as JSON.
+        """
+        tokenSeconds = self.seconds("tokenize")
+        return {"phases" : self.phases,
+                "seconds" : sum(entry["seconds"] for entry in self.phases),
+                "tokens" : self.tokens,
+                "tokensPerSecond" : self.tokens / tokenSeconds if tokenSeconds > 0 else None,
+                "nodes" : self.nodes,
+                "dispatches" : self.dispatches,
+                "instructions" : self.instructions}
+
+    def writeJson(self, filename):
+        """
+        Writes the statistics to a JSON file.
+
+        Arguments:
+        filename -- the name of the file.
+        """
+        with open(filename, "w") as jsonFile:
+            json.dump(self.toDict(), jsonFile, indent=2)
+
+    def report(self):
+        """
+        Returns a text report of the statistics.
+        """
+        stats = self.toDict()
+        lines = ["stats: {:.1f} ms, {} tokens, {} nodes, {} instructions".format(
+                 stats["seconds"] * 1000.0, self.tokens, sum(self.nodes.values()),
+                 self.instructions.get("instructions", 0))]
+        if stats["tokensPerSecond"] != None:
+            lines.append("    {:.0f} tokens per second".format(stats["tokensPerSecond"]))
+        lines.append("    {:<24}{:>10}{:>12}".format("phase", "ms", "allocated"))
+        for entry in self.phases:
+            lines.append("    {:<24}{:>10.2f}{:>12}".format(entry["phase"], entry["seconds"] * 1000.0,
+                         entry.get("allocated", "")))
+        lines.append("    {:<24}{:>10}".format("node", "count"))
+        for name, count in sorted(self.nodes.items(), key=lambda item: (-item[1], item[0])):
+            lines.append("    {:<24}{:>10}".format(name, count))
+        lines.append("    {:<32}{:>10}".format("handler", "calls"))
+        for name, count in sorted(self.dispatches.items(), key=lambda item: (-item[1], item[0])):
+            if count > 0:
+                lines.append("    {:<32}{:>10}".format(name, count))
+        return "\n".join(lines)
+
+def phase(stats, name):
+    """
+    Returns the context manager that records a phase, or one that does
+    nothing when there is no instrumentation.
+
+    Arguments:
+    stats -- an Instrumentation or None.
+    name -- the name of the phase.
+    """
+    if stats == None:
+        return contextlib.nullcontext()
+    return stats.phase(name)
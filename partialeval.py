@@ -0,0 +1,298 @@
+"""
+This module contains the partial evaluator, which runs on the abstract
+syntax tree after constant folding. A call to a pure lambda whose arguments
+are all literals is run at compile time by an interpreter of the subset of
+the language the code generator supports, and the call is replaced by the
+values it leaves on the data stack. A lambda is pure when its body only
+pushes literals, uses dup, arithmetic, = and if, and calls other pure
+lambdas. The interpreter gives up on anything else, on a call that reaches
+below its own arguments on the data stack or reads the flags its caller
+set, and when it runs out of steps.
+"""
+from inliner import Inliner
+from schemeparser import AbstractSyntaxTree
+from symboltable import Symbol
+
+class Unevaluable(Exception):
+    """
+    Raised when a call can't be evaluated at compile time.
+    """
+
+class PartialEvaluator:
+    # The target machine word.
+    MASK = 0xFFFF
+    # The keywords the interpreter runs. Each consumes its siblings.
+    ARITHMETIC = {
+        AbstractSyntaxTree.SUB : lambda a, b: a - b,
+        AbstractSyntaxTree.MULTIPLY : lambda a, b: a * b,
+        AbstractSyntaxTree.DIVIDE : lambda a, b: a // b
+    }
+    # The nodes a branch of an if may be without consuming its siblings.
+    SINGLE = (AbstractSyntaxTree.SEXPR, AbstractSyntaxTree.LITERAL, AbstractSyntaxTree.DUP)
+
+    def __init__(self, budget = 10000, maxValues = 16, optimizeSize = False):
+        """
+        Initializer for the evaluation limits.
+
+        Arguments:
+        budget -- the most nodes run to evaluate a call.
+        maxValues -- the most values a replaced call may leave.
+        optimizeSize -- only replace a call when that doesn't make the
+        program larger.
+        """
+        self.budget = budget
+        self.maxValues = maxValues
+        self.optimizeSize = optimizeSize
+        self.inliner = Inliner()
+        self.pure = {}
+        self.memo = {}
+        self.hits = 0
+        self.evaluated = {}
+        self.stack = []
+        self.zero = None
+        self.steps = 0
+
+    def evaluate(self, root):
+        """
+        Replaces the calls to pure lambdas with literal arguments below
+        the root in place.
+
+        Arguments:
+        root -- the root of the abstract syntax tree.
+
+        Returns:
+        the number of calls replaced.
+        """
+        return self.replaceCalls(root)
+
+    def replaceCalls(self, node):
+        # Calls in the arguments are replaced first, so a call whose
+        # arguments become literals is evaluated as well.
+        count = 0
+        for idx, child in enumerate(node.children):
+            if child.type != AbstractSyntaxTree.SEXPR or child.quoted:
+                continue
+            count = count + self.replaceCalls(child)
+            replacement = self.evaluateCall(child)
+            if replacement != None:
+                node.children[idx] = replacement
+                count = count + 1
+        return count
+
+    def evaluateCall(self, node):
+        """
+        Returns the node that replaces a call, or None if the call can't
+        be evaluated or its replacement is too large.
+
+        Arguments:
+        node -- an S expression.
+        """
+        if len(node.children) == 0 or node.children[0].type != AbstractSyntaxTree.IDENTIFIER:
+            return None
+        arguments = [self.literalValue(child) for child in node.children[1:]]
+        symbol = self.target(node.children[0].symbol)
+        if None in arguments or symbol == None:
+            return None
+
+        # The call starts with only its arguments on the stack and flags
+        # that aren't known, so its result doesn't depend on the caller.
+        self.stack = arguments
+        self.zero = None
+        self.steps = self.budget
+        try:
+            if not self.isPure(symbol):
+                return None
+            self.call(symbol)
+        except (Unevaluable, RecursionError):
+            return None
+
+        if len(self.stack) > self.maxValues:
+            return None
+        replacement = self.createReplacement(self.stack, self.zero)
+        if self.optimizeSize and self.inliner.estimateSize(replacement) > self.inliner.estimateSize(node):
+            return None
+        self.evaluated[symbol.name] = self.evaluated.get(symbol.name, 0) + 1
+        return replacement
+
+    def createReplacement(self, values, zero):
+        """
+        Returns a literal for a single value, otherwise a sequence that
+        pushes the values. When the call left the zero flag set by a
+        comparison, the sequence ends with a comparison that sets it the
+        same way, since an if after the call may test it.
+        """
+        if len(values) == 1 and zero == None:
+            return self.createLiteral(values[0])
+        replacement = AbstractSyntaxTree(type = AbstractSyntaxTree.SEXPR)
+        replacement.children = [self.createLiteral(value) for value in values]
+        if zero != None:
+            comparison = AbstractSyntaxTree(type = AbstractSyntaxTree.SEXPR)
+            comparison.children = [AbstractSyntaxTree(type = AbstractSyntaxTree.EQUALS, value = "="),
+                                   self.createLiteral(0), self.createLiteral(0 if zero else 1)]
+            replacement.children.append(comparison)
+        return replacement
+
+    def call(self, symbol):
+        # A lambda may use the whole stack, so a result is only reused for
+        # the same stack and flags.
+        key = (symbol.name, tuple(self.stack), self.zero)
+        result = self.memo.get(key)
+        if result != None:
+            self.hits = self.hits + 1
+            self.stack, self.zero = list(result[0]), result[1]
+            return
+
+        value = symbol.node.children[2]
+        # The code generator ignores the arguments of a lambda with more
+        # than one expression after lambda.
+        self.run(value.children, 2 if len(value.children) >= 3 else 1)
+        self.memo[key] = (tuple(self.stack), self.zero)
+
+    def run(self, children, idx):
+        """
+        Runs the nodes of a list from an index to its end, as the code
+        generator's processCdr emits them.
+        """
+        while idx < len(children):
+            idx = self.runNode(children, idx)
+        return idx
+
+    def runNode(self, children, idx):
+        """
+        Runs the node at an index of a list and returns the index of the
+        next one, as the code generator's processCar emits it.
+        """
+        self.steps = self.steps - 1
+        if self.steps < 0:
+            raise Unevaluable("Out of steps")
+
+        node = children[idx]
+        if node.type == AbstractSyntaxTree.SEXPR and not node.quoted:
+            self.run(node.children, 0)
+        elif node.type == AbstractSyntaxTree.LITERAL:
+            value = self.literalValue(node)
+            if value == None:
+                raise Unevaluable("Not a number")
+            self.stack.append(value)
+        elif node.type == AbstractSyntaxTree.DUP:
+            self.stack.append(self.peek())
+        elif node.type == AbstractSyntaxTree.COMMENT:
+            pass
+        elif node.type in PartialEvaluator.ARITHMETIC:
+            if len(children) < 3:
+                raise Unevaluable("Missing argument")
+            self.run(children, idx + 1)
+            b = self.pop()
+            a = self.pop()
+            if node.type == AbstractSyntaxTree.DIVIDE and b == 0:
+                raise Unevaluable("Division by zero")
+            self.stack.append(PartialEvaluator.ARITHMETIC[node.type](a, b) & PartialEvaluator.MASK)
+            return len(children)
+        elif node.type == AbstractSyntaxTree.EQUALS:
+            self.run(children, idx + 1)
+            self.zero = self.pop() == self.pop()
+            return len(children)
+        elif node.type == AbstractSyntaxTree.IF:
+            return self.runIf(children, idx)
+        elif node.type == AbstractSyntaxTree.IDENTIFIER and idx == 0:
+            symbol = self.target(node.symbol)
+            if symbol == None:
+                raise Unevaluable("Not a lambda")
+            self.run(children, idx + 1)
+            self.call(symbol)
+            return len(children)
+        else:
+            # Reading a variable, printing and the keywords the code
+            # generator doesn't support.
+            raise Unevaluable("Not pure")
+        return idx + 1
+
+    def runIf(self, children, idx):
+        # The test leaves the zero flag set when its values are equal,
+        # then the next node runs, otherwise the rest of the list does.
+        if idx + 1 >= len(children):
+            raise Unevaluable("Missing test")
+        idx = self.runNode(children, idx + 1)
+        if idx >= len(children) or children[idx].type not in PartialEvaluator.SINGLE:
+            raise Unevaluable("Unsupported if")
+        if self.zero == None:
+            raise Unevaluable("Flags set by the caller")
+        if self.zero:
+            self.runNode(children, idx)
+        else:
+            self.run(children, idx + 1)
+        return len(children)
+
+    def peek(self):
+        if len(self.stack) == 0:
+            raise Unevaluable("Stack underflow")
+        return self.stack[-1]
+
+    def pop(self):
+        value = self.peek()
+        self.stack.pop()
+        return value
+
+    def isPure(self, symbol):
+        """
+        Returns True when the body of a lambda only uses what the
+        interpreter runs. This is a quick check before running a call, the
+        interpreter itself still gives up on anything else.
+        """
+        if symbol.name not in self.pure:
+            # A recursive call is taken to be pure while the body is checked.
+            self.pure[symbol.name] = True
+            value = symbol.node.children[2]
+            start = 2 if len(value.children) >= 3 else 1
+            self.pure[symbol.name] = all(self.isPureNode(child, idx)
+                                         for idx, child in enumerate(value.children) if idx >= start)
+        return self.pure[symbol.name]
+
+    def isPureNode(self, node, idx):
+        if node.type == AbstractSyntaxTree.SEXPR:
+            return not node.quoted and all(self.isPureNode(child, position)
+                                           for position, child in enumerate(node.children))
+        if node.type == AbstractSyntaxTree.IDENTIFIER:
+            symbol = self.target(node.symbol)
+            return idx == 0 and symbol != None and self.isPure(symbol)
+        if node.type == AbstractSyntaxTree.LITERAL:
+            return self.literalValue(node) != None
+        return node.type in PartialEvaluator.ARITHMETIC or node.type in (
+               AbstractSyntaxTree.COMMENT, AbstractSyntaxTree.DUP, AbstractSyntaxTree.EQUALS,
+               AbstractSyntaxTree.IF)
+
+    def target(self, symbol):
+        """
+        Returns the symbol of the lambda a name is bound to through any
+        aliases, or None if it isn't a lambda.
+        """
+        if symbol != None:
+            symbol = symbol.resolve()
+        if symbol == None or symbol.kind != Symbol.LAMBDA or len(symbol.node.children) < 3:
+            return None
+        value = symbol.node.children[2]
+        if (value.type != AbstractSyntaxTree.SEXPR or value.quoted or len(value.children) < 2 or
+            value.children[0].type != AbstractSyntaxTree.LAMBDA):
+            return None
+        return symbol
+
+    def literalValue(self, node):
+        if node.type != AbstractSyntaxTree.LITERAL or node.quoted:
+            return None
+        try:
+            return int(node.value) & PartialEvaluator.MASK
+        except ValueError:
+            return None
+
+    def createLiteral(self, value):
+        return AbstractSyntaxTree(type = AbstractSyntaxTree.LITERAL, value = str(value))
+
+    def report(self):
+        """
+        Returns a text report of the calls replaced by their values.
+        """
+        lines = ["partial evaluator: {} calls replaced, {} memoized results reused".format(
+                 sum(self.evaluated.values()), self.hits)]
+        for name, count in sorted(self.evaluated.items()):
+            lines.append("    {} {} call{}".format(name, count, "s" if count > 1 else ""))
+        return "\n".join(lines)
@@ -0,0 +1,181 @@
+"""
+This module contains the peephole optimizer which runs between code
+generation and writing the assembler file. It scans the listing for short
+instruction sequences and replaces them with cheaper equivalents. Every
+jsr saved on the 6502 is six cycles and three bytes.
+"""
+from assembly import Instruction, countInstructions
+
+class PeepholeOptimizer:
+    def __init__(self, rules = None):
+        """
+        Initializer that sets up the rule table. A rule is called with the
+        listing and the index of an instruction whose opcode matches the
+        key in the table. It returns the number of instructions it matched
+        and their replacement, or None if it does not apply.
+
+        Arguments:
+        rules -- a dictionary of opcode to a list of (name, rule) pairs,
+        the default rules are used if it is omitted.
+        """
+        if rules == None:
+            rules = {
+                "`pushi" : [("fold-decrement", self.foldDecrement),
+                            ("fold-increment", self.foldIncrement),
+                            ("remove-add-zero", self.removeAddZero)],
+                "`add16i" : [("fold-increment", self.foldCachedStep),
+                             ("remove-add-zero", self.removeCachedZero)],
+                "`sub16i" : [("fold-decrement", self.foldCachedStep),
+                             ("remove-add-zero", self.removeCachedZero)],
+                "`dup" : [("remove-dup-drop", self.removeDupDrop)],
+                "`spill" : [("remove-spill-fill", self.removeSpillFill)],
+                "bra" : [("remove-branch-to-next", self.removeBranchToNext),
+                         ("remove-unreachable", self.removeUnreachable)],
+                "jmp" : [("remove-branch-to-next", self.removeBranchToNext),
+                         ("remove-unreachable", self.removeUnreachable)],
+                "rts" : [("remove-unreachable", self.removeUnreachable)]
+            }
+        self.rules = rules
+        self.hits = {}
+        self.before = 0
+        self.after = 0
+
+    def optimize(self, instructions):
+        """
+        Applies the rules until none of them match.
+
+        Arguments:
+        instructions -- a list of instruction records.
+
+        Returns:
+        the optimized list of instruction records.
+        """
+        self.before = self.before + countInstructions(instructions)
+        changed = True
+        while changed:
+            changed = False
+            output = []
+            idx = 0
+            while idx < len(instructions):
+                match = self.matchRules(instructions, idx)
+                if match == None:
+                    output.append(instructions[idx])
+                    idx = idx + 1
+                else:
+                    count, replacement = match
+                    # Keep a label that was attached to the first instruction.
+                    label = instructions[idx].label
+                    if label != None:
+                        if replacement:
+                            replacement[0] = replacement[0]._replace(label = label)
+                        else:
+                            replacement = [Instruction(label = label)]
+                    output.extend(replacement)
+                    idx = idx + count
+                    changed = True
+            instructions = output
+        self.after = self.after + countInstructions(instructions)
+        return instructions
+
+    def matchRules(self, instructions, idx):
+        for name, rule in self.rules.get(instructions[idx].opcode, []):
+            match = rule(instructions, idx)
+            if match != None:
+                self.hits[name] = self.hits.get(name, 0) + 1
+                return match
+        return None
+
+    def report(self):
+        """
+        Returns a text report of the rule hits and instruction counts.
+        """
+        lines = ["peephole: {} instructions before, {} after".format(self.before, self.after)]
+        for name in sorted(self.hits):
+            lines.append("    {:<24}{:>6}".format(name, self.hits[name]))
+        return "\n".join(lines)
+
+    def window(self, instructions, idx, length):
+        """
+        Returns the instructions starting at idx, or None if there are
+        not enough of them or a label other than on the first one would
+        be skipped over.
+        """
+        window = instructions[idx:idx + length]
+        if len(window) < length:
+            return None
+        for instruction in window[1:]:
+            if instruction.label != None:
+                return None
+        return window
+
+    """
+    The following methods are the default rules. They all have the same
+    argument signature so they can be placed in the rule table.
+    """
+    def foldDecrement(self, instructions, idx):
+        window = self.window(instructions, idx, 2)
+        if window != None and window[0].operand == "1" and window[1] == Instruction("jsr", "sub16"):
+            return 2, [Instruction("`dec16")]
+        return None
+
+    def foldIncrement(self, instructions, idx):
+        window = self.window(instructions, idx, 2)
+        if window != None and window[0].operand == "1" and window[1] == Instruction("jsr", "add16"):
+            return 2, [Instruction("`inc16")]
+        return None
+
+    def removeAddZero(self, instructions, idx):
+        window = self.window(instructions, idx, 2)
+        if (window != None and window[0].operand == "0" and
+            window[1] in (Instruction("jsr", "add16"), Instruction("jsr", "sub16"))):
+            return 2, []
+        return None
+
+    def removeDupDrop(self, instructions, idx):
+        window = self.window(instructions, idx, 2)
+        if window != None and window[1] == Instruction("`drop"):
+            return 2, []
+        return None
+
+    def foldCachedStep(self, instructions, idx):
+        # The cached top of stack variants of the fold rules above.
+        if instructions[idx].operand == "1":
+            opcode = "`inc16t" if instructions[idx].opcode == "`add16i" else "`dec16t"
+            return 1, [Instruction(opcode)]
+        return None
+
+    def removeCachedZero(self, instructions, idx):
+        if instructions[idx].operand == "0":
+            return 1, []
+        return None
+
+    def removeSpillFill(self, instructions, idx):
+        window = self.window(instructions, idx, 2)
+        if window != None and window[1] == Instruction("`fill"):
+            return 2, []
+        return None
+
+    def removeBranchToNext(self, instructions, idx):
+        # A branch to one of the labels that immediately follow it does
+        # nothing. The labels are in the same scope since no directive
+        # comes between them.
+        target = instructions[idx].operand
+        idx = idx + 1
+        while idx < len(instructions) and instructions[idx].label != None:
+            if instructions[idx].label == target:
+                return 1, []
+            if instructions[idx].opcode != None:
+                break
+            idx = idx + 1
+        return None
+
+    def removeUnreachable(self, instructions, idx):
+        # Instructions after an unconditional transfer can't be reached
+        # until the next label or directive.
+        end = idx + 1
+        while (end < len(instructions) and instructions[end].label == None and
+               instructions[end].isInstruction()):
+            end = end + 1
+        if end == idx + 1:
+            return None
+        return end - idx, [instructions[idx]]
@@ -0,0 +1,118 @@
+"""
+This module contains the profiler which attributes the bytes of a listing,
+and the cycles spent executing it, to the global labels that own them.
+Every define emits a global label, so this gives the size and cost of each
+define. Cycles come from a simulator run or from an instruction trace file.
+"""
+import json
+
+class Profiler:
+    def __init__(self, simulator):
+        """
+        Initializer that finds the owner of each line of a listing, which
+        is the last global label at or before it.
+
+        Arguments:
+        simulator -- a simulator with the listing loaded.
+        """
+        self.simulator = simulator
+        self.owners = []
+        self.entries = {}
+
+        owner = "(none)"
+        for idx, instruction in enumerate(simulator.listing):
+            if instruction.label != None and not instruction.label.startswith("_"):
+                owner = instruction.label
+            self.owners.append(owner)
+            size = simulator.addresses[idx + 1] - simulator.addresses[idx]
+            if size > 0 or owner not in self.entries:
+                self.entry(owner)["bytes"] += size
+
+    def entry(self, label):
+        if label not in self.entries:
+            self.entries[label] = {"label" : label, "bytes" : 0, "cycles" : 0,
+                                   "instructions" : 0}
+        return self.entries[label]
+
+    def record(self, idx, cycles):
+        """
+        Attributes an executed instruction to its owner. This has the
+        signature of the simulator trace hook.
+
+        Arguments:
+        idx -- the listing index of the instruction.
+        cycles -- the cycles it took.
+        """
+        entry = self.entry(self.owners[idx])
+        entry["cycles"] += cycles
+        entry["instructions"] += 1
+
+    def simulate(self, entry = "main", maxSteps = 1000000):
+        """
+        Runs the listing in the simulator and records every instruction.
+        """
+        self.simulator.trace = self.record
+        try:
+            self.simulator.run(entry, maxSteps)
+        finally:
+            self.simulator.trace = None
+
+    def readTrace(self, filename):
+        """
+        Records the instructions in a trace file. Each line holds the
+        address of an executed instruction in hex and its cycles, for
+        a listing assembled at Simulator.ORIGIN. Addresses that are not
+        the start of a line of the listing are counted as outside.
+
+        Arguments:
+        filename -- the name of the trace file.
+        """
+        with open(filename) as traceFile:
+            for line in traceFile:
+                fields = line.split()
+                if len(fields) < 2 or fields[0].startswith("#"):
+                    continue
+                address = int(fields[0].lstrip("$"), 16)
+                idx = self.simulator.indexes.get(address)
+                if idx == None:
+                    entry = self.entry("(outside)")
+                    entry["cycles"] += int(fields[1])
+                    entry["instructions"] += 1
+                else:
+                    self.record(idx, int(fields[1]))
+
+    def results(self):
+        """
+        Returns the entries sorted by cycles and then by bytes.
+        """
+        return sorted(self.entries.values(),
+                      key=lambda entry: (-entry["cycles"], -entry["bytes"], entry["label"]))
+
+    def report(self):
+        """
+        Returns the results as a text table.
+        """
+        results = self.results()
+        totalBytes = sum(entry["bytes"] for entry in results)
+        totalCycles = sum(entry["cycles"] for entry in results)
+        lines = ["{:<24}{:>8}{:>12}{:>8}{:>14}".format("label", "bytes", "cycles", "%", "instructions")]
+        for entry in results:
+            share = 100.0 * entry["cycles"] / totalCycles if totalCycles else 0.0
+            lines.append("{:<24}{:>8}{:>12}{:>8.1f}{:>14}".format(entry["label"],
+                         entry["bytes"], entry["cycles"], share, entry["instructions"]))
+        lines.append("{:<24}{:>8}{:>12}".format("total", totalBytes, totalCycles))
+        return "\n".join(lines)
+
+    def writeJson(self, filename):
+        """
+        Writes the results as JSON.
+
+        Arguments:
+        filename -- the name of the file.
+        """
+        results = self.results()
+        with open(filename, "w") as jsonFile:
+            json.dump({"labels" : results,
+                       "totalBytes" : sum(entry["bytes"] for entry in results),
+                       "totalCycles" : sum(entry["cycles"] for entry in results)},
+                      jsonFile, indent=2)
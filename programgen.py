@@ -0,0 +1,115 @@
+"""
+This module generates synthetic Scheme programs for the compiler benchmarks.
+The programs are made from a seeded random generator, so the same seed and
+size always give the same source. Each shape stresses a different part of
+the compiler:
+wide -- thousands of small defines called in a chain from main.
+deep -- heavily nested if and arithmetic expressions.
+table -- huge bytes and words tables on long lines.
+strings -- many displayed strings, some of which end others.
+Run it from the command line to write a program:
+python programgen.py wide 1000 --seed 7 -o wide.scm
+"""
+import argparse
+import random
+import sys
+
+class ProgramGenerator:
+    # Arithmetic operators that take two arguments, only those the code
+    # generator handles, since it skips the others without emitting code.
+    OPERATORS = ("-", "*", "/")
+    WORDS = ("alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta",
+             "iota", "kappa", "lambda", "omega")
+
+    def __init__(self, seed = 0):
+        """
+        Initializer for a generator whose programs are fixed by the seed.
+
+        Arguments:
+        seed -- the seed of the random generator.
+        """
+        self.random = random.Random(seed)
+        self.shapes = {
+            "deep" : self.deep,
+            "strings" : self.strings,
+            "table" : self.table,
+            "wide" : self.wide
+        }
+
+    def generate(self, shape, size):
+        """
+        Returns the source of a program.
+
+        Arguments:
+        shape -- one of deep, strings, table or wide.
+        size -- the number of defines, the nesting depth, the number of
+        table values or the number of strings.
+        """
+        generate = self.shapes.get(shape)
+        if generate == None:
+            raise Exception('Unknown program shape {}'.format(shape))
+        return generate(size)
+
+    def wide(self, size):
+        # Each define calls the one before, so all of them are reachable.
+        lines = ["(define f0 (lambda (- dup 1)))\n"]
+        for idx in range(1, size):
+            lines.append("(define f{} (lambda ({} dup (f{} ({} dup {})))))\n".format(
+                         idx, self.operator(), idx - 1, self.operator(), self.literal()))
+        lines.append("(define main (f{} {}))\n".format(size - 1, self.literal()))
+        return "".join(lines)
+
+    def deep(self, size):
+        return "(define main (lambda {}))\n".format(self.expression(size))
+
+    def expression(self, depth):
+        # Built from the inside out so the depth doesn't use the stack.
+        text = self.literal()
+        for level in range(depth):
+            if self.random.random() < 0.5:
+                text = "(if (= dup {}) {} {})".format(self.literal(), text, self.literal())
+            else:
+                text = "({} {} {})".format(self.operator(), text, self.literal())
+        return text
+
+    def table(self, size):
+        byteValues = " ".join(str(self.random.randrange(256)) for idx in range(size))
+        wordValues = " ".join(str(self.random.randrange(65536)) for idx in range(size))
+        return ("(define bytes1 (bytes '({})))\n"
+                "(define words1 (words '({})))\n"
+                "(define main (lambda (- bytes1 words1)))\n").format(byteValues, wordValues)
+
+    def strings(self, size):
+        lines = []
+        for idx in range(size):
+            words = self.random.sample(ProgramGenerator.WORDS, self.random.randrange(1, 4))
+            lines.append("(define s{} (lambda (display \"{}\")))\n".format(idx, " ".join(words)))
+        lines.append("(define main (lambda () {}))\n".format(
+                     " ".join("(s{})".format(idx) for idx in range(size))))
+        return "".join(lines)
+
+    def operator(self):
+        return self.random.choice(ProgramGenerator.OPERATORS)
+
+    def literal(self):
+        return str(self.random.randrange(1, 100))
+
+def main(argv):
+    argParser = argparse.ArgumentParser(description="Generates synthetic Tiny Scheme programs.")
+    argParser.add_argument("shape", choices=["deep", "strings", "table", "wide"],
+                           help="the kind of program")
+    argParser.add_argument("size", type=int, help="the size of the program")
+    argParser.add_argument("--seed", type=int, default=0, help="the random seed (default 0)")
+    argParser.add_argument("-o", "--output", help="the file to write, by default standard output")
+    options = argParser.parse_args(argv)
+
+    source = ProgramGenerator(options.seed).generate(options.shape, options.size)
+    if options.output == None:
+        sys.stdout.write(source)
+    else:
+        with open(options.output, "w") as outputFile:
+            outputFile.write(source)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
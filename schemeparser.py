@@ -1,7 +1,18 @@
+import hashlib
 import sys
 from tokenizer import Token, Tokenizer
 
+def stringDigest(value):
+    """
+    Returns the part of a string's label derived from its content, so the
+    label is the same for every occurrence and every run.
+    """
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:12]
+
 class AbstractSyntaxTree:
+    # Nodes are numerous, so they don't carry an instance dictionary.
+    __slots__ = ("type", "value", "quoted", "children", "symbol")
+
     UNDEFINED = 0
     ROOT = 1
 
@@ -33,30 +44,44 @@ class AbstractSyntaxTree:
 
     DUP = 23
 
-    NAMES = ["UNDEFINED", "ROOT", "COMMENT", "DEFINE", "DISPLAY", "REFERENCE", "BYTES", "WORDS", "IDENTIFIER", "IF", "LABEL", "LAMBDA", "LITERAL", "SEXPR", "STRING", "EQUALS", "ADD", "SUB", "MULTIPLY", "DIVIDE", "GREATER_THAN", "LESS_THAN", "STRING_POOL", "DUP"]
+    # A table read from a file, its path is a STRING outside the pool.
+    FILE = 24
+
+    NAMES = ["UNDEFINED", "ROOT", "COMMENT", "DEFINE", "DISPLAY", "REFERENCE", "BYTES", "WORDS", "IDENTIFIER", "IF", "LABEL", "LAMBDA", "LITERAL", "SEXPR", "STRING", "EQUALS", "ADD", "SUB", "MULTIPLY", "DIVIDE", "GREATER_THAN", "LESS_THAN", "STRING_POOL", "DUP", "FILE"]
 
     def __init__(self, type = UNDEFINED, value = None, quoted=False):
         self.type = type
         self.value = value
         self.quoted = quoted
         self.children = [ ]
+        # The Symbol an identifier is bound to by the resolve pass.
+        self.symbol = None
 
     def __str__(self):
         return "{}, value='{}', quoted={}, hash={}, children='{}'".format(AbstractSyntaxTree.NAMES[self.type], self.value, self.quoted, hash(self), len(self.children))
 
 class SchemeParser:
     COMMENT = ";"
-    KEYWORDS = ["abs", "and", "append", "apply", "bytes", "car", "cdr", "cond",
-                "cons", "define", "display", "do", "dup", "filter", "if",
-                "lambda", "length", "let", "map", "member", "modulo", "newline",
-                "not", "or", "reverse", "words" ]
-    OPERATORS = ["=", "+", "-", "*", "/", "<", ">"]
+    KEYWORDS = frozenset(["abs", "and", "append", "apply", "bytes", "car", "cdr", "cond",
+                          "cons", "define", "display", "do", "dup", "file", "filter", "if",
+                          "lambda", "length", "let", "map", "member", "modulo", "newline",
+                          "not", "or", "reverse", "words" ])
+    OPERATORS = frozenset(["=", "+", "-", "*", "/", "<", ">"])
     SEPARATORS = "()'"
 
-    def __init__(self):
+    def __init__(self, recursive=False):
+        """
+        Initializer that sets up the parser.
+
+        Arguments:
+        recursive -- use the recursive descent engine rather than the
+        explicit stack engine.
+        """
+        self.recursive = recursive
         self.astRoot = AbstractSyntaxTree(AbstractSyntaxTree.ROOT)
         self.stringPool = AbstractSyntaxTree(type=AbstractSyntaxTree.STRING_POOL)
         self.astRoot.children.append(self.stringPool)
+        self.strings = {}
 
         self.tokenDispatch = {
             Token.COMMENT : self.parseComment,
@@ -82,6 +107,7 @@ class SchemeParser:
             "display" : AbstractSyntaxTree.DISPLAY,
             "do" : None,
             "dup" : AbstractSyntaxTree.DUP,
+            "file" : AbstractSyntaxTree.FILE,
             "filter" : None,
             "if" : AbstractSyntaxTree.IF,
             "lambda" : AbstractSyntaxTree.LAMBDA,
@@ -105,79 +131,177 @@ class SchemeParser:
         }
 
     def parse(self, tokenList):
-        self.parseSexpr(self.astRoot, tokenList, 0, False)
+        self.parseStream(tokenList)
+
+    def parseStream(self, tokens):
+        """
+        Parses tokens from any iterable into the abstract syntax tree.
+
+        Arguments:
+        tokens -- an iterable of tokens (e.g. Tokenizer.iterTokens).
+        """
+        for node in self.iterParse(tokens):
+            self.astRoot.children.append(node)
+
+    def iterParse(self, tokens):
+        """
+        Generator that parses tokens from any iterable and yields each
+        top level node as soon as it is complete. Only one token of
+        lookahead and the node being built are held in memory, so when
+        the caller does not keep the nodes memory tracks nesting depth
+        rather than the size of the input. Strings are still collected
+        into the string pool.
+
+        Arguments:
+        tokens -- an iterable of tokens (e.g. Tokenizer.iterTokens).
+        """
+        if self.recursive:
+            return self.iterParseRecursive(tokens)
+        return self.iterParseIterative(tokens)
+
+    def iterParseRecursive(self, tokens):
+        """
+        The recursive descent engine, which uses one Python frame per
+        nesting level and so is bounded by the recursion limit.
+        """
+        stream = TokenStream(tokens)
+        form = AbstractSyntaxTree(AbstractSyntaxTree.ROOT)
+        while stream.peek() != None and stream.peek().value != ')':
+            self.parseElement(form, stream, False)
+            yield from form.children
+            form.children.clear()
 
-    def parseSexpr(self, astParent, tokenList, idx, quoted):
-        while idx < len(tokenList) and tokenList[idx].value != ')':
+    def iterParseIterative(self, tokens):
+        """
+        The explicit stack engine. The stack holds the open S expressions
+        so nesting depth is only limited by memory. It builds the same
+        tree as the recursive engine, including the handling of quotes.
+        """
+        stream = TokenStream(tokens)
+        form = AbstractSyntaxTree(AbstractSyntaxTree.ROOT)
+        stack = [form]
+        quoted = False
+        while True:
+            if len(stack) == 1 and form.children:
+                yield from form.children
+                form.children.clear()
+
+            token = stream.peek()
+            if not quoted and (token == None or token.value == ')'):
+                # The top level ends at the first unmatched parenthesis.
+                if len(stack) == 1:
+                    return
+                stream.next()
+                stack.pop()
+            elif token.type == Token.SEPARATOR:
+                stream.next()
+                if token.value == '(':
+                    sexpr = AbstractSyntaxTree(type = AbstractSyntaxTree.SEXPR,
+                                               quoted=quoted)
+                    stack[-1].children.append(sexpr)
+                    stack.append(sexpr)
+                    quoted = False
+                else:
+                    # the next element is quoted if there is one.
+                    quoted = token.value == "'" and stream.peek() != None
+            else:
+                dispatch = self.tokenDispatch.get(token.type)
+                if dispatch != None:
+                    dispatch(stack[-1], stream, quoted)
+                else:
+                    stream.next()
+                quoted = False
+
+    def parseSexpr(self, astParent, tokens, quoted):
+        while tokens.peek() != None and tokens.peek().value != ')':
             # don't pass the quote down to contained elements!
-            idx = self.parseElement(astParent, tokenList, idx, False)
-        return idx + 1
+            self.parseElement(astParent, tokens, False)
+        tokens.next()
 
-    def parseElement(self, astParent, tokenList, idx, quoted):
-        dispatch = self.tokenDispatch.get(tokenList[idx].type)
+    def parseElement(self, astParent, tokens, quoted):
+        dispatch = self.tokenDispatch.get(tokens.peek().type)
         if dispatch != None:
-            idx = dispatch(astParent, tokenList, idx, quoted)
+            dispatch(astParent, tokens, quoted)
         else:
-            idx = idx + 1
-        return idx
+            tokens.next()
 
-    def parseComment(self, astParent, tokenList, idx, quoted):
+    def parseComment(self, astParent, tokens, quoted):
         comment = AbstractSyntaxTree(type=AbstractSyntaxTree.COMMENT,
-                                     value = tokenList[idx].value,
+                                     value = tokens.next().value,
                                      quoted=quoted)
         astParent.children.append(comment)
-        return idx + 1
 
-    def parseIdentifier(self, astParent, tokenList, idx, quoted):
+    def parseIdentifier(self, astParent, tokens, quoted):
         identifier = AbstractSyntaxTree(type = AbstractSyntaxTree.IDENTIFIER,
-                                        value = tokenList[idx].value,
+                                        value = sys.intern(tokens.next().value),
                                         quoted=quoted)
         astParent.children.append(identifier)
-        return idx + 1
 
-    def parseKeyword(self, astParent, tokenList, idx, quoted):
-        type = self.keywordOperatorMap.get(tokenList[idx].value)
+    def parseKeyword(self, astParent, tokens, quoted):
+        type = self.keywordOperatorMap.get(tokens.next().value)
         if type != None:
             keyword = AbstractSyntaxTree(type = type)
             astParent.children.append(keyword)
-        return idx + 1
 
-    def parseLiteral(self, astParent, tokenList, idx, quoted):
+    def parseLiteral(self, astParent, tokens, quoted):
         literal = AbstractSyntaxTree(type = AbstractSyntaxTree.LITERAL,
                                      quoted=quoted)
-        literal.value = tokenList[idx].value
+        literal.value = sys.intern(tokens.next().value)
         astParent.children.append(literal)
-        return idx + 1
 
-    def parseSeparator(self, astParent, tokenList, idx, quoted):
-        if tokenList[idx].value == '(':
+    def parseSeparator(self, astParent, tokens, quoted):
+        value = tokens.next().value
+        if value == '(':
             sexpr = AbstractSyntaxTree(type = AbstractSyntaxTree.SEXPR,
                                        quoted=quoted)
             astParent.children.append(sexpr)
-            idx = self.parseSexpr(sexpr, tokenList, idx + 1, quoted)
-        elif tokenList[idx].value == ')':
-            idx = idx + 1
-        elif tokenList[idx].value == "'":
+            self.parseSexpr(sexpr, tokens, quoted)
+        elif value == "'" and tokens.peek() != None:
             # parse the next element, but set the quoted state.
-            idx = self.parseElement(astParent, tokenList, idx + 1, True)
-        return idx
+            self.parseElement(astParent, tokens, True)
+
+    def parseString(self, astParent, tokens, quoted):
+        value = tokens.next().value
+        if astParent.children and astParent.children[0].type == AbstractSyntaxTree.FILE:
+            # The path of a table file isn't stored in the program.
+            path = AbstractSyntaxTree(type = AbstractSyntaxTree.STRING)
+            path.value = value
+            astParent.children.append(path)
+            return
 
-    def parseString(self, astParent, tokenList, idx, quoted):
-        string = AbstractSyntaxTree(type = AbstractSyntaxTree.STRING)
-        string.value = tokenList[idx].value
-        self.stringPool.children.append(string)
+        # Identical strings share one entry in the pool.
+        if value not in self.strings:
+            string = AbstractSyntaxTree(type = AbstractSyntaxTree.STRING)
+            string.value = value
+            self.stringPool.children.append(string)
+            self.strings[value] = string
 
         ref = AbstractSyntaxTree(type = AbstractSyntaxTree.REFERENCE)
-        ref.value = str(hash(string))
+        ref.value = stringDigest(value)
         astParent.children.append(ref)
 
-        return idx + 1
-
-    def parseVector(self, astParent, tokenList, idx, quoted):
-        while idx < len(tokenList) and tokenList[idx].value != ']':
-            dispatch = self.tokenDispatch.get(tokenList[idx].type)
+    def parseVector(self, astParent, tokens, quoted):
+        while tokens.peek() != None and tokens.peek().value != ']':
+            dispatch = self.tokenDispatch.get(tokens.peek().type)
             if dispatch != None:
-                idx = dispatch(astParent, tokenList, idx, quoted)
+                dispatch(astParent, tokens, quoted)
             else:
-                idx = idx + 1
-        return idx + 1
+                tokens.next()
+        tokens.next()
+
+class TokenStream:
+    """
+    Wraps any iterable of tokens and provides one token of lookahead,
+    so the parser never needs random access to a token list.
+    """
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.token = next(self.tokens, None)
+
+    def peek(self):
+        return self.token
+
+    def next(self):
+        token = self.token
+        self.token = next(self.tokens, None)
+        return token
@@ -0,0 +1,211 @@
+"""
+This module contains the compile server, which stays resident so an editor
+or build doesn't pay for starting Python and importing the compiler on every
+compile. The code of each top level form is cached in memory between
+requests, so a recompile only generates the forms that changed. That cache
+is the only state kept, each request gets a new tokenizer and parser since
+they are cheap to make and hold the state of a single source. It either
+polls a set of sources and recompiles the ones that change, or answers
+requests on a Unix socket:
+python server.py --watch src -O2
+python server.py --socket /tmp/tinycomp.sock
+python server.py --socket /tmp/tinycomp.sock --send factorial.scm -O2
+Each compile reports how long it took.
+"""
+from buildcache import BuildCache
+from builder import collectSources
+from pathlib import Path
+from tinylisp import compileFile, parseArguments as parseCompilerArguments
+import argparse
+import contextlib
+import io
+import json
+import socket
+import socketserver
+import sys
+import time
+
+class CompileServer:
+    # The most forms cached in memory, so a server that runs for days
+    # doesn't keep the code of every version of every form.
+    CACHE_LIMIT = 4096
+
+    def __init__(self, cache = None, cacheLimit = CACHE_LIMIT):
+        """
+        Initializer for a server whose caches live as long as it does.
+
+        Arguments:
+        cache -- the BuildCache to use, by default one held in memory.
+        cacheLimit -- the most forms the cache in memory keeps, the least
+        recently used are dropped beyond it.
+        """
+        self.cache = cache if cache != None else BuildCache(None, cacheLimit)
+        self.modified = {}
+        self.latencies = []
+
+    def compile(self, argv):
+        """
+        Compiles a source and returns the response to the request.
+
+        Arguments:
+        argv -- the compiler command line, starting with the source.
+
+        Returns:
+        a dictionary of the source, whether it compiled, the error, what
+        the compiler printed and the milliseconds it took.
+        """
+        start = time.perf_counter()
+        printed = io.StringIO()
+        source = argv[0] if argv else None
+        error = None
+        try:
+            with contextlib.redirect_stdout(printed), contextlib.redirect_stderr(printed):
+                options = parseCompilerArguments(argv)
+                compileFile(options.source, options.output or Path(options.source).stem + ".asm",
+                            options, self.cache)
+        except SystemExit:
+            error = "invalid compiler options {}".format(" ".join(argv))
+        except Exception as ex:
+            error = str(ex) or type(ex).__name__
+        milliseconds = (time.perf_counter() - start) * 1000.0
+        self.latencies.append(milliseconds)
+        return {"source" : source, "ok" : error == None, "error" : error,
+                "output" : printed.getvalue(), "milliseconds" : round(milliseconds, 3)}
+
+    def poll(self, paths, compilerArguments = ()):
+        """
+        Compiles the sources that are new or changed since the last poll.
+
+        Arguments:
+        paths -- the source files and directories to watch.
+        compilerArguments -- the compiler options after the source.
+
+        Returns:
+        the responses in the order of the sources.
+        """
+        responses = []
+        for source, relative in collectSources(paths):
+            try:
+                modified = source.stat().st_mtime_ns
+            except OSError:
+                continue
+            if self.modified.get(source) != modified:
+                self.modified[source] = modified
+                output = str(source.with_suffix(".asm"))
+                responses.append(self.compile([str(source), "-o", output] + list(compilerArguments)))
+        return responses
+
+    def watch(self, paths, compilerArguments = (), interval = 0.5):
+        """
+        Polls the sources until interrupted, printing each compile.
+        """
+        try:
+            while True:
+                for response in self.poll(paths, compilerArguments):
+                    print(formatResponse(response), flush=True)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def serve(self, socketPath):
+        """
+        Answers requests on a Unix socket until interrupted. A request is a
+        line of JSON holding the compiler command line as argv, and the
+        response is a line of JSON.
+
+        Arguments:
+        socketPath -- the path of the socket.
+        """
+        server = self.createSocketServer(socketPath)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            Path(socketPath).unlink(missing_ok=True)
+
+    def createSocketServer(self, socketPath):
+        if not hasattr(socketserver, "UnixStreamServer"):
+            raise Exception('Unix sockets are not available here, use --watch')
+        compileServer = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        argv = request["argv"]
+                        if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+                            raise ValueError("argv isn't a list of strings")
+                    except (ValueError, KeyError, TypeError) as ex:
+                        # A bad request gets an error reply rather than
+                        # closing the connection.
+                        response = {"source" : None, "ok" : False, "error" : "invalid request: {}".format(ex),
+                                    "output" : "", "milliseconds" : 0.0}
+                    else:
+                        response = compileServer.compile(argv)
+                    print(formatResponse(response), flush=True)
+                    self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+        Path(socketPath).unlink(missing_ok=True)
+        return socketserver.UnixStreamServer(socketPath, RequestHandler)
+
+def request(socketPath, argv):
+    """
+    Sends a compile request to a server and returns its response.
+
+    Arguments:
+    socketPath -- the path of the server's socket.
+    argv -- the compiler command line, starting with the source.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socketPath)
+        client.sendall((json.dumps({"argv" : argv}) + "\n").encode("utf-8"))
+        with client.makefile("r", encoding="utf-8") as reader:
+            return json.loads(reader.readline())
+
+def formatResponse(response):
+    if response["ok"]:
+        return "{} compiled in {:.1f} ms".format(response["source"], response["milliseconds"])
+    return "{}: error: {} ({:.1f} ms)".format(response["source"], response["error"],
+                                              response["milliseconds"])
+
+def main(argv):
+    argParser = argparse.ArgumentParser(description="Resident Tiny Scheme compile server.")
+    mode = argParser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--watch", nargs="+", metavar="PATH",
+                      help="recompile these sources, or the .scm files below these directories, when they change")
+    mode.add_argument("--socket", help="answer compile requests on this Unix socket")
+    argParser.add_argument("--send", metavar="SOURCE",
+                           help="send a compile request for this source to the server on --socket")
+    argParser.add_argument("--interval", type=float, default=0.5,
+                           help="the seconds between polls of watched sources (default 0.5)")
+    argParser.add_argument("--cache", metavar="DIR",
+                           help="keep the form cache in this directory rather than in memory")
+    argParser.add_argument("--cache-limit", type=int, default=CompileServer.CACHE_LIMIT, metavar="FORMS",
+                           help="the most forms kept in the cache in memory (default {})".format(
+                           CompileServer.CACHE_LIMIT))
+    options, compilerArguments = argParser.parse_known_args(argv)
+
+    if options.send != None:
+        if options.socket == None:
+            argParser.error("--send needs --socket")
+        # The server runs in its own directory, so the paths are absolute.
+        source = Path(options.send).resolve()
+        if "-o" not in compilerArguments and "--output" not in compilerArguments:
+            compilerArguments = ["-o", str(source.with_suffix(".asm"))] + compilerArguments
+        response = request(options.socket, [str(source)] + compilerArguments)
+        print(response["output"], end="")
+        print(formatResponse(response))
+        return 0 if response["ok"] else 1
+
+    server = CompileServer(BuildCache(options.cache) if options.cache != None else None, options.cache_limit)
+    if options.watch != None:
+        server.watch(options.watch, compilerArguments, options.interval)
+    else:
+        server.serve(options.socket)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,568 @@
+"""
+This module contains a small simulator for the assembler listings that the
+compiler produces. Rather than decoding machine code it executes the listing
+one instruction or macro at a time, with Python implementations of the macro
+library and runtime routines the code generator assumes. Each macro and
+routine is charged the cycles and bytes of its reference 6502
+implementation, which lets the runtime cost of code generation changes be
+measured without real hardware or an assembler. Run it from the command line:
+python simulator.py factorial.asm
+"""
+from assembly import parseListing
+import sys
+
+class Simulator:
+    # Where the listing is placed in the 64K address space.
+    ORIGIN = 0x0800
+
+    def __init__(self):
+        """
+        Initializer that sets up the instruction and routine tables. The
+        instruction table maps an opcode to its implementation, its size
+        in bytes and its cycles. The routine table does the same for the
+        runtime library called with jsr, the cycles include the rts.
+        Cycle counts that depend on the operands are computed by the
+        implementation and added to the fixed cost. The Z flag is only
+        set by the comparison routines, every other macro and routine
+        preserves it. The macros and routines that end in t, or take an
+        i or v operand, work on the top of stack cached in tos.
+        """
+        self.instructions = {
+            "`add16i" : (self.executeAdd16i, 13, 18),
+            "`add16v" : (self.executeAdd16v, 15, 22),
+            "`cmp16i" : (self.executeCmp16i, 10, 12),
+            "`cmp16v" : (self.executeCmp16v, 12, 16),
+            "`dec16" : (self.executeDec16, 8, 14),
+            "`dec16t" : (self.executeDec16t, 8, 12),
+            "`drop" : (self.executeDrop, 2, 4),
+            "`dup" : (self.executeDup, 10, 20),
+            "`fill" : (self.executeFill, 10, 18),
+            "`inc16" : (self.executeInc16, 6, 10),
+            "`inc16t" : (self.executeInc16t, 6, 8),
+            "`initb" : (self.executeInit, 4, 5),
+            "`initw" : (self.executeInit, 8, 10),
+            "`loadi" : (self.executeLoadi, 8, 10),
+            "`loadv" : (self.executeLoadv, 10, 14),
+            "`print" : (self.executePrint, 7, 40),
+            "`peek" : (self.executePeek, 8, 14),
+            "`pushi" : (self.executePushi, 10, 16),
+            "`pushv" : (self.executePushv, 12, 20),
+            "`shl16" : (self.executeShl16, 4, 12),
+            "`shl16t" : (self.executeShl16t, 4, 10),
+            "`shr16" : (self.executeShr16, 4, 12),
+            "`shr16t" : (self.executeShr16t, 4, 10),
+            "`spill" : (self.executeSpill, 10, 18),
+            "`sub16i" : (self.executeSub16i, 13, 18),
+            "`sub16v" : (self.executeSub16v, 15, 22),
+            "beq" : (self.executeBeq, 2, 2),
+            "bne" : (self.executeBne, 2, 2),
+            "bra" : (self.executeJmp, 2, 3),
+            "jmp" : (self.executeJmp, 3, 3),
+            "jsr" : (self.executeJsr, 3, 6),
+            "rts" : (self.executeRts, 1, 6)
+        }
+        self.routines = {
+            "add16" : (self.routineAdd16, 36),
+            "add16t" : (self.routineAdd16t, 32),
+            "div16" : (self.routineDiv16, 40),
+            "div16t" : (self.routineDiv16t, 36),
+            "equals16" : (self.routineEquals16, 30),
+            "equals16t" : (self.routineEquals16t, 26),
+            "mul16" : (self.routineMul16, 40),
+            "mul16t" : (self.routineMul16t, 36),
+            "println" : (self.routinePrintln, 30),
+            "sub16" : (self.routineSub16, 36),
+            "sub16t" : (self.routineSub16t, 32)
+        }
+        self.directives = {
+            ".alias" : self.loadAlias,
+            ".byte" : self.loadBytes,
+            ".incbin" : self.loadIncbin,
+            ".scend" : self.loadScend,
+            ".scope" : self.loadScope,
+            ".word" : self.loadWords
+        }
+        self.trace = None
+
+    def loadFile(self, filename):
+        """
+        Loads an assembler file by name.
+
+        Arguments:
+        filename -- the name of the file.
+        """
+        with open(filename) as listingFile:
+            self.load(parseListing(listingFile.read()))
+
+    def load(self, listing):
+        """
+        Places a listing in memory and resolves its labels.
+
+        Arguments:
+        listing -- a list of instruction records.
+        """
+        self.listing = listing
+        self.memory = bytearray(0x10000)
+        self.addresses = []
+        self.scopeChains = []
+        self.globals = {}
+        self.locals = {}
+        self.pending = []
+        self.aliases = []
+        self.scopeCount = 0
+        self.scopeChain = ()
+        self.address = Simulator.ORIGIN
+
+        for instruction in listing:
+            self.addresses.append(self.address)
+            self.scopeChains.append(self.scopeChain)
+            if instruction.label != None:
+                self.defineLabel(instruction.label, self.address)
+            if instruction.opcode in self.directives:
+                self.directives[instruction.opcode](instruction)
+            elif instruction.opcode != None:
+                entry = self.instructions.get(instruction.opcode)
+                if entry == None:
+                    raise Exception("Unknown instruction '{}'".format(instruction.opcode))
+                self.address = self.address + entry[1]
+        self.addresses.append(self.address)
+        self.size = self.address - Simulator.ORIGIN
+
+        # Aliases of labels defined later, which can be aliases themselves.
+        while self.aliases:
+            aliases, self.aliases = self.aliases, []
+            for name, expression, scopeChain in aliases:
+                self.scopeChain = scopeChain
+                try:
+                    self.defineLabel(name, self.evaluate(expression, scopeChain))
+                except Exception:
+                    self.aliases.append((name, expression, scopeChain))
+            if len(self.aliases) == len(aliases):
+                name, expression, scopeChain = self.aliases[0]
+                self.evaluate(expression, scopeChain)
+        self.scopeChain = ()
+
+        # Like the assembler, reject a relative branch that doesn't reach.
+        for idx, instruction in enumerate(listing):
+            if instruction.opcode in ("beq", "bne", "bra"):
+                offset = self.evaluate(instruction.operand, self.scopeChains[idx]) - (self.addresses[idx] + 2)
+                if not -128 <= (offset + 0x8000) % 0x10000 - 0x8000 <= 127:
+                    raise Exception("Branch out of range at '{}'".format(instruction))
+
+        # Data that refers to labels is written once all labels are known.
+        for address, width, expression, scopeChain in self.pending:
+            value = self.evaluate(expression, scopeChain)
+            self.memory[address] = value & 0xFF
+            if width == 2:
+                self.memory[address + 1] = (value >> 8) & 0xFF
+
+        # Execution continues at the listing index of a label's address,
+        # which is the first instruction placed there if there is one.
+        self.indexes = {}
+        for idx in range(len(listing) - 1, -1, -1):
+            address = self.addresses[idx]
+            if listing[idx].isInstruction() or address not in self.indexes or \
+               not listing[self.indexes[address]].isInstruction():
+                self.indexes[address] = idx
+
+    def defineLabel(self, name, value):
+        if name.startswith("_") and self.scopeChain:
+            self.locals[(self.scopeChain[-1], name)] = value
+        else:
+            self.globals[name] = value
+
+    def resolve(self, name, scopeChain):
+        """
+        Returns the value of a label, local labels are found in the
+        innermost scope that defines them.
+        """
+        if name.startswith("_"):
+            for scope in reversed(scopeChain):
+                if (scope, name) in self.locals:
+                    return self.locals[(scope, name)]
+        elif name in self.globals:
+            return self.globals[name]
+        raise Exception("Undefined label '{}'".format(name))
+
+    def evaluate(self, expression, scopeChain):
+        """
+        Returns the value of an operand, which is a sum or difference of
+        numbers and labels. Numbers may be decimal, $hex or %binary and a
+        leading # for immediate mode is ignored.
+        """
+        expression = expression.replace(" ", "").lstrip("#")
+        value = 0
+        sign = 1
+        term = ""
+        for char in expression + "+":
+            if char not in "+-":
+                term = term + char
+            elif term != "":
+                value = value + sign * self.evaluateTerm(term, scopeChain)
+                sign = 1 if char == "+" else -1
+                term = ""
+            elif char == "-":
+                sign = -sign
+        return value & 0xFFFF
+
+    def evaluateTerm(self, term, scopeChain):
+        if term.startswith("<"):
+            return self.evaluateTerm(term[1:], scopeChain) & 0xFF
+        if term.startswith(">"):
+            return self.evaluateTerm(term[1:], scopeChain) >> 8
+        if term.startswith("$"):
+            return int(term[1:], 16)
+        if term.startswith("%"):
+            return int(term[1:], 2)
+        if term.isdigit():
+            return int(term)
+        return self.resolve(term, scopeChain)
+
+    def splitOperands(self, operand):
+        """
+        Splits a comma separated operand list, leaving strings intact.
+        """
+        items = []
+        item = ""
+        quoted = False
+        for char in operand:
+            if char == "\"":
+                quoted = not quoted
+            if char == "," and not quoted:
+                items.append(item.strip())
+                item = ""
+            else:
+                item = item + char
+        items.append(item.strip())
+        return items
+
+    """
+    The following methods load directives. They all have the same argument
+    signature so they can be placed in the directive table.
+    """
+    def loadAlias(self, instruction):
+        name, sep, expression = instruction.operand.partition(" ")
+        try:
+            self.defineLabel(name, self.evaluate(expression, self.scopeChain))
+        except Exception:
+            self.aliases.append((name, expression, self.scopeChain))
+
+    def loadBytes(self, instruction):
+        for item in self.splitOperands(instruction.operand):
+            if item.startswith("\""):
+                for char in item[1:-1]:
+                    self.memory[self.address] = ord(char) & 0xFF
+                    self.address = self.address + 1
+            else:
+                self.pending.append((self.address, 1, item, self.scopeChain))
+                self.address = self.address + 1
+
+    def loadIncbin(self, instruction):
+        with open(instruction.operand.strip("\""), "rb") as binaryFile:
+            data = binaryFile.read()
+        if self.address + len(data) > len(self.memory):
+            raise Exception("'{}' doesn't fit in memory".format(instruction))
+        self.memory[self.address:self.address + len(data)] = data
+        self.address = self.address + len(data)
+
+    def loadWords(self, instruction):
+        for item in self.splitOperands(instruction.operand):
+            self.pending.append((self.address, 2, item, self.scopeChain))
+            self.address = self.address + 2
+
+    def loadScope(self, instruction):
+        self.scopeCount = self.scopeCount + 1
+        self.scopeChain = self.scopeChain + (self.scopeCount,)
+
+    def loadScend(self, instruction):
+        self.scopeChain = self.scopeChain[:-1]
+
+    def run(self, entry = "main", maxSteps = 1000000):
+        """
+        Runs the loaded listing from a label until the entry returns or
+        execution runs off the end of the listing.
+
+        Arguments:
+        entry -- the label to start at.
+        maxSteps -- the number of instructions after which the run is
+        abandoned.
+
+        Returns:
+        the simulator, whose statistics describe the run.
+        """
+        self.cycles = 0
+        self.steps = 0
+        self.counts = {}
+        self.dataStack = []
+        self.tos = 0
+        self.returnStack = []
+        self.maxDataDepth = 0
+        self.maxReturnDepth = 0
+        self.zero = False
+        self.output = []
+
+        self.pc = self.indexes.get(self.resolve(entry, ()))
+        self.running = True
+        while self.running:
+            if self.pc >= len(self.listing):
+                break
+            instruction = self.listing[self.pc]
+            self.pc = self.pc + 1
+            if not instruction.isInstruction():
+                if instruction.opcode in (".byte", ".incbin", ".word"):
+                    raise Exception("Executed data at '{}'".format(instruction))
+                continue
+
+            self.steps = self.steps + 1
+            if self.steps > maxSteps:
+                raise Exception("Exceeded {} steps".format(maxSteps))
+            self.counts[instruction.opcode] = self.counts.get(instruction.opcode, 0) + 1
+
+            idx = self.pc - 1
+            execute, size, cycles = self.instructions[instruction.opcode]
+            cycles = cycles + (execute(instruction) or 0)
+            self.cycles = self.cycles + cycles
+            if self.trace != None:
+                self.trace(idx, cycles)
+
+            self.maxDataDepth = max(self.maxDataDepth, len(self.dataStack))
+            self.maxReturnDepth = max(self.maxReturnDepth, len(self.returnStack))
+        return self
+
+    def report(self):
+        """
+        Returns a text report of the last run.
+        """
+        lines = ["cycles {}, instructions {}, max data stack {}, max return stack {}".
+                 format(self.cycles, self.steps, self.maxDataDepth, self.maxReturnDepth)]
+        for opcode in sorted(self.counts):
+            lines.append("    {:<12}{:>10}".format(opcode, self.counts[opcode]))
+        return "\n".join(lines)
+
+    def operandValue(self, instruction):
+        return self.evaluate(instruction.operand, self.scopeChains[self.pc - 1])
+
+    def jump(self, instruction):
+        address = self.operandValue(instruction)
+        if address not in self.indexes:
+            raise Exception("Jump outside the listing at '{}'".format(instruction))
+        self.pc = self.indexes[address]
+
+    def push(self, value):
+        self.dataStack.append(value & 0xFFFF)
+
+    def pop(self):
+        if len(self.dataStack) == 0:
+            raise Exception("Data stack underflow at '{}'".format(self.listing[self.pc - 1]))
+        return self.dataStack.pop()
+
+    def readWord(self, address):
+        return self.memory[address] | (self.memory[(address + 1) & 0xFFFF] << 8)
+
+    def readOperand(self, instruction):
+        # Returns the value of a variable operand and the cycles saved
+        # when it is in the zero page.
+        address = self.operandValue(instruction)
+        return self.readWord(address), -2 if address < 0x100 else 0
+
+    """
+    The following methods implement the instructions and macros. They all
+    have the same argument signature so they can be placed in the
+    instruction table, and return any cycles beyond the fixed cost.
+    """
+    def executeAdd16i(self, instruction):
+        self.tos = (self.tos + self.operandValue(instruction)) & 0xFFFF
+
+    def executeAdd16v(self, instruction):
+        value, cycles = self.readOperand(instruction)
+        self.tos = (self.tos + value) & 0xFFFF
+        return cycles
+
+    def executeBeq(self, instruction):
+        if self.zero:
+            self.jump(instruction)
+            return 1
+
+    def executeBne(self, instruction):
+        if not self.zero:
+            self.jump(instruction)
+            return 1
+
+    def executeCmp16i(self, instruction):
+        self.zero = self.tos == self.operandValue(instruction) & 0xFFFF
+
+    def executeCmp16v(self, instruction):
+        value, cycles = self.readOperand(instruction)
+        self.zero = self.tos == value
+        return cycles
+
+    def executeDec16(self, instruction):
+        self.push(self.pop() - 1)
+
+    def executeDec16t(self, instruction):
+        self.tos = (self.tos - 1) & 0xFFFF
+
+    def executeDrop(self, instruction):
+        self.pop()
+
+    def executeDup(self, instruction):
+        value = self.pop()
+        self.push(value)
+        self.push(value)
+
+    def executeFill(self, instruction):
+        self.tos = self.pop()
+
+    def executeInc16(self, instruction):
+        self.push(self.pop() + 1)
+
+    def executeInc16t(self, instruction):
+        self.tos = (self.tos + 1) & 0xFFFF
+
+    def executeJmp(self, instruction):
+        self.jump(instruction)
+
+    def executeJsr(self, instruction):
+        routine = self.routines.get(instruction.operand)
+        if routine != None and instruction.operand not in self.globals:
+            # The return address is on the stack while the routine runs.
+            self.returnStack.append(self.pc)
+            self.maxReturnDepth = max(self.maxReturnDepth, len(self.returnStack))
+            execute, cycles = routine
+            cycles = cycles + (execute() or 0)
+            self.returnStack.pop()
+            return cycles
+        self.returnStack.append(self.pc)
+        self.jump(instruction)
+
+    def executeInit(self, instruction):
+        # Stores a value in a zero page variable.
+        name, value = self.splitOperands(instruction.operand)
+        scopeChain = self.scopeChains[self.pc - 1]
+        address = self.evaluate(name, scopeChain)
+        value = self.evaluate(value, scopeChain)
+        self.memory[address] = value & 0xFF
+        if instruction.opcode == "`initw":
+            self.memory[(address + 1) & 0xFFFF] = (value >> 8) & 0xFF
+
+    def executeLoadi(self, instruction):
+        self.tos = self.operandValue(instruction) & 0xFFFF
+
+    def executeLoadv(self, instruction):
+        self.tos, cycles = self.readOperand(instruction)
+        return cycles
+
+    def executePeek(self, instruction):
+        self.tos = self.pop()
+        self.push(self.tos)
+
+    def executePrint(self, instruction):
+        self.output.append(str(self.operandValue(instruction)))
+
+    def executePushi(self, instruction):
+        self.push(self.operandValue(instruction))
+
+    def executePushv(self, instruction):
+        address = self.operandValue(instruction)
+        self.push(self.readWord(address))
+        # Zero page operands save a byte and a cycle on each access.
+        if address < 0x100:
+            return -2
+
+    def executeRts(self, instruction):
+        if len(self.returnStack) == 0:
+            self.running = False
+        else:
+            self.pc = self.returnStack.pop()
+
+    def executeShl16(self, instruction):
+        self.push(self.pop() << 1)
+
+    def executeShl16t(self, instruction):
+        self.tos = (self.tos << 1) & 0xFFFF
+
+    def executeShr16(self, instruction):
+        self.push(self.pop() >> 1)
+
+    def executeShr16t(self, instruction):
+        self.tos = self.tos >> 1
+
+    def executeSpill(self, instruction):
+        self.push(self.tos)
+
+    def executeSub16i(self, instruction):
+        self.tos = (self.tos - self.operandValue(instruction)) & 0xFFFF
+
+    def executeSub16v(self, instruction):
+        value, cycles = self.readOperand(instruction)
+        self.tos = (self.tos - value) & 0xFFFF
+        return cycles
+
+    """
+    The following methods implement the runtime routines. They take the
+    arguments from the data stack and return any cycles beyond the fixed
+    cost. The variants for a cached top of stack take the right operand
+    from tos, and leave the result there.
+    """
+    def routineAdd16(self):
+        b = self.pop()
+        self.push(self.pop() + b)
+
+    def routineDiv16(self):
+        # A shift and subtract loop over the 16 bits of the dividend.
+        b = self.pop()
+        a = self.pop()
+        if b == 0:
+            raise Exception("Division by zero")
+        self.push(a // b)
+        return 16 * 38
+
+    def routineEquals16(self):
+        self.zero = self.pop() == self.pop()
+
+    def routineMul16(self):
+        # A shift and add loop, which adds for each set bit.
+        b = self.pop()
+        a = self.pop()
+        self.push(a * b)
+        return 16 * 25 + 20 * bin(b).count("1")
+
+    def routineSub16(self):
+        b = self.pop()
+        self.push(self.pop() - b)
+
+    def routineAdd16t(self):
+        return self.cachedRoutine(self.routineAdd16)
+
+    def routineDiv16t(self):
+        return self.cachedRoutine(self.routineDiv16)
+
+    def routineEquals16t(self):
+        self.zero = self.pop() == self.tos
+
+    def routineMul16t(self):
+        return self.cachedRoutine(self.routineMul16)
+
+    def routineSub16t(self):
+        return self.cachedRoutine(self.routineSub16)
+
+    def cachedRoutine(self, routine):
+        self.push(self.tos)
+        cycles = routine()
+        self.tos = self.pop()
+        return cycles
+
+    def routinePrintln(self):
+        address = self.pop()
+        length = 0
+        while self.memory[(address + length) & 0xFFFF] != 0:
+            length = length + 1
+        self.output.append(bytes(self.memory[address:address + length]).decode("latin-1") + "\n")
+        return 14 * length
+
+if __name__ == '__main__':
+    simulator = Simulator()
+    simulator.loadFile(sys.argv[1])
+    simulator.run(sys.argv[2] if len(sys.argv) > 2 else "main")
+    print("".join(simulator.output))
+    print(simulator.report())
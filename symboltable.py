@@ -0,0 +1,169 @@
+"""
+This module contains the symbol table and the resolve pass, which runs on
+the abstract syntax tree right after parsing. Every define makes a symbol
+with its kind and size, and every identifier is bound to the symbol of the
+define it names. Later passes look at the bound symbol rather than compare
+names, and a reference to a name that is never defined is an error at
+compile time rather than in the assembler.
+"""
+from filetable import FileTable, isFileTable
+from inliner import Inliner
+from schemeparser import AbstractSyntaxTree
+
+class Symbol:
+    # Symbols are made for every define, so they don't carry a dictionary.
+    __slots__ = ("name", "kind", "size", "node", "target")
+
+    # A table of bytes or words.
+    DATA = "data"
+    # Code, either a lambda or an expression that runs in place.
+    LAMBDA = "lambda"
+    # Another name for the symbol of the identifier it is defined as.
+    ALIAS = "alias"
+    # A routine or table defined by another module or in assembler.
+    EXTERN = "extern"
+
+    def __init__(self, name, kind, size, node):
+        """
+        Initializer for a defined symbol.
+
+        Arguments:
+        name -- the interned name.
+        kind -- one of DATA, LAMBDA, ALIAS or EXTERN.
+        size -- the bytes of a table, the estimated bytes of code, or 0 for
+        an alias or an extern.
+        node -- the S expression of the define, or None for an extern.
+        """
+        self.name = name
+        self.kind = kind
+        self.size = size
+        self.node = node
+        self.target = None
+
+    def resolve(self):
+        """
+        Returns the symbol an alias stands for through any aliases of
+        aliases, or this symbol if it isn't an alias.
+        """
+        symbol = self
+        seen = set()
+        while symbol.kind == Symbol.ALIAS and symbol.target != None and symbol not in seen:
+            seen.add(symbol)
+            symbol = symbol.target
+        return symbol
+
+    def __repr__(self):
+        return "Symbol({}, {}, {})".format(self.name, self.kind, self.size)
+
+class SymbolTable:
+    # The bytes each element of a table takes.
+    WIDTHS = {AbstractSyntaxTree.BYTES : 1, AbstractSyntaxTree.WORDS : 2}
+
+    def __init__(self, directory = "", externs = ()):
+        """
+        Initializer for a table that only holds the externs.
+
+        Arguments:
+        directory -- the directory the paths of table files are in.
+        externs -- the names defined outside the source, by another module
+        or in assembler, which may be referenced without a define.
+        """
+        self.directory = directory
+        self.symbols = {name : Symbol(name, Symbol.EXTERN, 0, None) for name in externs}
+        self.inliner = Inliner()
+
+    def resolve(self, root):
+        """
+        Makes a symbol for each define below the root and binds every
+        identifier that refers to one. The names after lambda are its
+        arguments and the names in a file form are options, neither is
+        bound.
+
+        Arguments:
+        root -- the root of the abstract syntax tree.
+        """
+        self.define(root)
+        for symbol in self.symbols.values():
+            if symbol.kind == Symbol.ALIAS:
+                symbol.target = self.symbols.get(symbol.node.children[2].value)
+
+        undefined = []
+        self.bind(root, undefined)
+        if undefined:
+            names = list(dict.fromkeys(undefined))
+            raise Exception('Undefined reference{} to {}'.format("s" if len(names) > 1 else "",
+                            ", ".join("'{}'".format(name) for name in names)))
+
+    def define(self, node):
+        # A define can be nested in another when its parentheses are
+        # unbalanced, so the whole tree is searched.
+        for child in node.children:
+            name = self.definedName(child)
+            if name != None:
+                # A define in the source takes the place of an extern.
+                if name in self.symbols and self.symbols[name].kind != Symbol.EXTERN:
+                    raise Exception("Duplicate define of '{}'".format(name))
+                self.symbols[name] = Symbol(name, *self.classify(child), child)
+            if child.type != AbstractSyntaxTree.STRING_POOL:
+                self.define(child)
+
+    def classify(self, node):
+        """
+        Returns the kind and size of the symbol a define makes.
+        """
+        value = node.children[2] if len(node.children) > 2 else None
+        if value == None:
+            return Symbol.LAMBDA, 0
+        if value.type == AbstractSyntaxTree.IDENTIFIER and len(node.children) == 3:
+            return Symbol.ALIAS, 0
+        if (value.type == AbstractSyntaxTree.SEXPR and len(value.children) == 2 and
+            value.children[0].type in SymbolTable.WIDTHS):
+            width = SymbolTable.WIDTHS[value.children[0].type]
+            if isFileTable(value.children[1]):
+                return Symbol.DATA, width * FileTable(value.children[1], width, self.directory).count()
+            return Symbol.DATA, width * len(value.children[1].children)
+        if (value.type == AbstractSyntaxTree.SEXPR and len(value.children) > 0 and
+            value.children[0].type == AbstractSyntaxTree.LAMBDA):
+            start = 2 if len(value.children) >= 3 else 1
+            body = value.children[start:]
+            return Symbol.LAMBDA, sum(self.inliner.estimateSize(child) for child in body) + Inliner.RETURN_SIZE
+        return Symbol.LAMBDA, self.inliner.estimateSize(value)
+
+    def bind(self, node, undefined):
+        for idx, child in enumerate(node.children):
+            if child.type == AbstractSyntaxTree.IDENTIFIER:
+                child.symbol = self.symbols.get(child.value)
+                if child.symbol == None:
+                    undefined.append(child.value)
+            elif (child.type != AbstractSyntaxTree.STRING_POOL and not self.isArgumentList(node, idx) and
+                  not isFileTable(child)):
+                self.bind(child, undefined)
+
+    def isArgumentList(self, node, idx):
+        # The code generator ignores the arguments of a lambda with more
+        # than one expression after lambda.
+        return (idx == 1 and len(node.children) >= 3 and
+                node.children[0].type == AbstractSyntaxTree.LAMBDA)
+
+    def definedName(self, node):
+        if (node.type == AbstractSyntaxTree.SEXPR and len(node.children) >= 2 and
+            node.children[0].type == AbstractSyntaxTree.DEFINE and
+            node.children[1].type == AbstractSyntaxTree.IDENTIFIER):
+            return node.children[1].value
+        return None
+
+    def lookup(self, name):
+        """
+        Returns the symbol of a name, or None if it isn't defined.
+        """
+        return self.symbols.get(name)
+
+    def report(self):
+        """
+        Returns a text report of the symbols in the order they are defined.
+        """
+        lines = ["symbols: {} defined".format(len(self.symbols))]
+        for symbol in self.symbols.values():
+            lines.append("    {:<24}{:<8}{:>6} bytes{}".format(symbol.name, symbol.kind, symbol.size,
+                         " -> " + symbol.target.name if symbol.target != None else ""))
+        return "\n".join(lines)
@@ -0,0 +1,57 @@
+import contextlib
+import io
+import unittest
+from benchCompiler import compare, measure
+from programgen import ProgramGenerator
+from tinylisp import compileSource
+
+class TestBenchCompiler(unittest.TestCase):
+
+    def test_programs(self):
+        # The same seed always gives the same program.
+        for shape in ("deep", "strings", "table", "wide"):
+            source = ProgramGenerator(3).generate(shape, 20)
+            self.assertEqual( ProgramGenerator(3).generate(shape, 20), source)
+            self.assertNotEqual( ProgramGenerator(4).generate(shape, 20), source)
+
+            # Every program compiles with main and the code it reaches, and
+            # only uses operators the code generator handles.
+            self.assertNotIn( "(+", source)
+            with contextlib.redirect_stdout(io.StringIO()):
+                listing = compileSource(source)
+            self.assertIn( "main:", listing)
+
+        wide = ProgramGenerator().generate("wide", 50)
+        self.assertEqual( wide.count("(define "), 51)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIn( "f0:", compileSource(wide))
+        with self.assertRaises(Exception):
+            ProgramGenerator().generate("round", 1)
+
+    def test_compare(self):
+        result = measure("wide", 20, repeat = 1)
+        self.assertEqual( result["tokens"], 381)
+        self.assertGreater( result["linesPerSecond"], 0)
+        self.assertIn( "generate", result["peak"])
+        self.assertEqual( compare([result], [result], 0.25), [])
+
+        # A rate that fell by more than the tolerance is flagged, as is a
+        # peak that grew, but a small change is not.
+        slower = dict(result, tokensPerSecond = result["tokensPerSecond"] * 0.5)
+        slower["peak"] = dict(result["peak"], parse = result["peak"]["parse"] * 2 + 1)
+        regressions = compare([result], [slower], 0.25)
+        self.assertEqual( len(regressions), 2)
+        self.assertTrue( regressions[0].startswith("wide-20 tokensPerSecond fell"))
+        self.assertTrue( regressions[1].startswith("wide-20 parse peak memory grew"))
+        slightly = dict(result, nodesPerSecond = result["nodesPerSecond"] * 0.9)
+        self.assertEqual( compare([result], [slightly], 0.25), [])
+
+        # Cases missing from the baseline aren't compared, and a baseline
+        # of another program has to be saved again.
+        self.assertEqual( compare([], [slower], 0.25), [])
+        changed = dict(result, tokens = result["tokens"] + 1)
+        self.assertEqual( compare([changed], [result], 0.25),
+                          ["wide-20 program changed since the baseline, save a new one"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import contextlib
+import io
+import unittest
+from assembly import Instruction, parseListing
+from branches import BranchLayout
+from schemeparser import SchemeParser
+from simulator import Simulator
+from tinylisp import CodeGenerator, compileSource
+from tokenizer import Tokenizer
+
+class TestBranches(unittest.TestCase):
+
+    def test_relaxation(self):
+        # The then expression is too long for bne to branch over it.
+        body = "x"
+        for idx in range(12):
+            body = "(- x {})".format(body)
+        source = ("(define x (words '({})))\n"
+                  "(define main (if (= x 0) {} 7))\n")
+
+        with self.assertRaisesRegex(Exception, "Branch out of range at '\tbne _else'"):
+            self.simulate(self.generate(source.format(0, body)))
+
+        instructions = self.compile(source.format(0, body))
+        self.assertIn( Instruction("beq", "_br_1"), instructions)
+        idx = instructions.index(Instruction("beq", "_br_1"))
+        self.assertEqual( instructions[idx + 1:idx + 3],
+                          [Instruction("jmp", "_else"), Instruction(label = "_br_1")])
+        # The bra over the else expression still reaches.
+        self.assertIn( Instruction("bra", "_endif"), instructions)
+        self.assertEqual( self.simulate(instructions).dataStack, [0])
+        self.assertEqual( self.simulate(self.compile(source.format(1, body))).dataStack, [7])
+
+    def test_nmos(self):
+        source = ("(define x (words '({})))\n"
+                  "(define main (if (= x 0) 5 7))\n")
+
+        # The NMOS 6502 has no bra, so it becomes a jmp.
+        for value, result in ((0, [5]), (1, [7])):
+            instructions = self.compile(source.format(value), "--cpu", "nmos")
+            self.assertNotIn( "bra", [instruction.opcode for instruction in instructions])
+            self.assertIn( Instruction("jmp", "_endif"), instructions)
+            self.assertEqual( self.simulate(instructions).dataStack, result)
+        with self.assertRaises(Exception):
+            BranchLayout("z80")
+
+    def test_threading(self):
+        source = ("(define x (words '({})))\n"
+                  "(define main (if (= x 0) (if (= x 1) 10 20) 30))\n"
+                  "(define f (lambda (if (= dup 0) (if (= dup 1) 10 20) 30)))\n")
+
+        # The inner bra jumps straight to the end of the outer if, with a
+        # new label since the outer _endif is hidden by the inner one.
+        instructions = self.compile(source.format(0), "--keep", "f")
+        self.assertIn( Instruction("bra", "_jt_1"), instructions)
+        idx = instructions.index(Instruction(label = "_jt_1"))
+        self.assertEqual( instructions[idx + 1], Instruction(label = "_endif"))
+
+        # In a lambda both jumps to the end return instead.
+        f = instructions[instructions.index(Instruction(label = "f")):]
+        self.assertNotIn( "bra", [instruction.opcode for instruction in f])
+        self.assertEqual( [instruction.opcode for instruction in f].count("rts"), 3)
+
+        for value, result in ((0, [20]), (1, [30])):
+            self.assertEqual( self.simulate(self.compile(source.format(value))).dataStack, result)
+        # Without optimization nothing is threaded.
+        self.assertNotIn( Instruction(label = "_jt_1"), self.compile(source.format(0), "-O0"))
+
+    def compile(self, source, *options):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return parseListing(compileSource(source, options))
+
+    def generate(self, source):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return CodeGenerator(parser.astRoot).generate()
+
+    def simulate(self, instructions):
+        simulator = Simulator()
+        simulator.load(instructions)
+        simulator.run()
+        return simulator
+
+if __name__ == '__main__':
+    unittest.main()
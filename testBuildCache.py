@@ -0,0 +1,106 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from buildcache import BuildCache
+from pathlib import Path
+from peephole import PeepholeOptimizer
+from schemeparser import SchemeParser
+from tinylisp import CodeGenerator, compileSource
+from tokenizer import Tokenizer
+
+class TestBuildCache(unittest.TestCase):
+
+    def test_rebuild(self):
+        source = ("(define data (words '(1 2 3)))\n"
+                  "(define double (lambda (* dup 2)))\n"
+                  "(define main (double 5) (display \"Hi\"))\n")
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = BuildCache(os.path.join(directory, "cache"))
+            first = self.generate(source, directory, cache)
+            self.assertEqual( (cache.hits, cache.misses), (0, 4))
+
+            # An unchanged source is spliced together from the cache.
+            cache = BuildCache(os.path.join(directory, "cache"))
+            self.assertEqual( self.generate(source, directory, cache), first)
+            self.assertEqual( (cache.hits, cache.misses), (4, 0))
+
+            # Only the form that was edited is generated again.
+            cache = BuildCache(os.path.join(directory, "cache"))
+            edited = self.generate(source.replace("dup 2", "dup 3"), directory, cache)
+            self.assertEqual( (cache.hits, cache.misses), (3, 1))
+            self.assertEqual( edited, self.generate(source.replace("dup 2", "dup 3"), directory))
+
+            # Different options don't share entries.
+            cache = BuildCache(os.path.join(directory, "cache"))
+            self.generate(source, directory, cache, strengthReduction = True)
+            self.assertEqual( (cache.hits, cache.misses), (0, 4))
+
+    def test_key(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = BuildCache(directory)
+            a = self.parse("(define a (words '(12)))\n").children[1]
+            b = self.parse("(define a (words '(1 2)))\n").children[1]
+            self.assertNotEqual( cache.key(a, ""), cache.key(b, ""))
+            self.assertNotEqual( cache.key(a, ""), cache.key(a, "cacheTos"))
+            self.assertEqual( cache.key(a, ""),
+                              cache.key(self.parse("(define  a\n (words '(12)))").children[1], ""))
+
+    def test_prune(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "0123456789abcdef").mkdir()
+            (root / "0123456789abcdef" / ("1" * 40 + ".asm")).write_text("\trts\n")
+            (root / ("2" * 40 + ".asm")).write_text("\trts\n")
+            (root / "notes.txt").write_text("kept\n")
+
+            # The entries of other versions of the compiler are removed,
+            # anything else in the directory is left alone.
+            cache = BuildCache(directory)
+            cache.put("3" * 40, [])
+            self.assertEqual( sorted(child.name for child in root.iterdir()),
+                              [cache.version[:BuildCache.GENERATION], "notes.txt"])
+            self.assertEqual( BuildCache(directory).get("3" * 40), [])
+
+    def test_redefined(self):
+        # A form whose names are bound to something else isn't taken from
+        # the cache, even though its own tree didn't change.
+        cache = BuildCache(None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            compileSource("(define a (lambda 1))\n(define main (a 1))\n", ["-O0"], cache)
+            with self.assertRaisesRegex(Exception, "'a' is data and can't be called"):
+                compileSource("(define a (words '(1)))\n(define main (a 1))\n", ["-O0"], cache)
+
+            listing = compileSource("(define b (lambda 1))\n(define a b)\n(define main (a 1))\n",
+                                    ["-O0"], cache)
+        self.assertIn( ".alias a b", listing)
+
+    def test_limit(self):
+        # The least recently used entries in memory are dropped.
+        cache = BuildCache(None, 2)
+        cache.put("a", [])
+        cache.put("b", [])
+        self.assertEqual( cache.get("a"), [])
+        cache.put("c", [])
+        self.assertEqual( list(cache.entries), ["a", "c"])
+        self.assertEqual( cache.get("b"), None)
+
+    def generate(self, source, directory, cache = None, **options):
+        outputName = os.path.join(directory, "output.asm")
+        CodeGenerator(self.parse(source), PeepholeOptimizer(), cache = cache,
+                      **options).process(outputName)
+        with open(outputName) as outputFile:
+            return outputFile.read()
+
+    def parse(self, source):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        return parser.astRoot
+
+if __name__ == '__main__':
+    unittest.main()
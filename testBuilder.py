@@ -0,0 +1,71 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from builder import build, collectSources, main
+from pathlib import Path
+
+class TestBuilder(unittest.TestCase):
+
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory) / "src"
+            self.writeSources(root)
+            sources = collectSources([str(root), str(root / "b.scm")])
+            self.assertEqual( [str(relative) for source, relative in sources],
+                              ["a.scm", "b.scm", os.path.join("lib", "c.scm")])
+
+            # The results are in the order of the sources, and a file that
+            # fails doesn't stop the others.
+            output = Path(directory) / "out"
+            results = build(sources, str(output), jobs = 3, compilerArguments = ["-O2"])
+            self.assertEqual( [(Path(source).name, error) for source, asm, printed, error in results],
+                              [("a.scm", None), ("b.scm", "Undefined reference to 'x'"), ("c.scm", None)])
+            self.assertTrue( (output / "a.asm").exists())
+            self.assertFalse( (output / "b.asm").exists())
+            self.assertIn( "\tjsr println\n", (output / "lib" / "c.asm").read_text())
+
+            # A build in one process writes the same files.
+            serial = Path(directory) / "serial"
+            build(sources, str(serial), jobs = 1, compilerArguments = ["-O2"])
+            self.assertEqual( (serial / "a.asm").read_text(), (output / "a.asm").read_text())
+
+    def test_exit_code(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            self.writeSources(root)
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as errors:
+                self.assertEqual( main([str(root), "--jobs", "2"]), 1)
+                self.assertEqual( main([str(root / "a.scm")]), 0)
+                self.assertEqual( main([str(root / "a.scm"), "-O", "9"]), 1)
+            self.assertIn( "b.scm: error: Undefined reference to 'x'", errors.getvalue())
+            self.assertTrue( (root / "a.asm").exists())
+
+    def test_same_name(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            self.writeSources(root)
+            (root / "a.scm").replace(root / "lib" / "a.scm")
+            (root / "a.scm").write_text("(define main 1)\n")
+            output = root / "out"
+
+            # Both files would be written to out/a.asm, so nothing is built.
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as errors:
+                self.assertEqual( main([str(root / "a.scm"), str(root / "lib" / "a.scm"), "--output-dir",
+                                        str(output), "--jobs", "2"]), 1)
+            self.assertIn( "both write", errors.getvalue())
+            self.assertFalse( output.exists())
+
+            # Next to their sources they don't collide.
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual( main([str(root / "a.scm"), str(root / "lib" / "a.scm")]), 0)
+
+    def writeSources(self, root):
+        (root / "lib").mkdir(parents=True)
+        (root / "a.scm").write_text("(define main (* 6 7))\n")
+        (root / "b.scm").write_text("(define 5 x)\n")
+        (root / "lib" / "c.scm").write_text("(define main (display \"Hi\"))\n")
+
+if __name__ == '__main__':
+    unittest.main()
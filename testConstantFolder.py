@@ -0,0 +1,76 @@
+import unittest
+from constantfolder import ConstantFolder
+from schemeparser import SchemeParser, AbstractSyntaxTree
+from tokenizer import Tokenizer
+
+class TestConstantFolder(unittest.TestCase):
+
+    def test_arithmetic(self):
+        root = self.fold("(define main (* 6 (- 10 (/ 9 3))))\n"
+                         "(define wrap (- 1 2))\n"
+                         "(define big (* 300 300))\n"
+                         "(define keep (* dup (/ 5 0)))\n")
+
+        self.assertEqual( self.dumpTree(root.children[1]),
+                          ["SEXPR", ["DEFINE"], ["IDENTIFIER", "main"], ["LITERAL", "42"]])
+        self.assertEqual( self.dumpTree(root.children[2].children[2]), ["LITERAL", "65535"])
+        self.assertEqual( self.dumpTree(root.children[3].children[2]), ["LITERAL", str(90000 & 0xFFFF)])
+
+        # Division by zero and non literal operands are left alone.
+        self.assertEqual( self.dumpTree(root.children[4].children[2]),
+                          ["SEXPR", ["MULTIPLY"], ["DUP"],
+                           ["SEXPR", ["DIVIDE"], ["LITERAL", "5"], ["LITERAL", "0"]]])
+
+    def test_if(self):
+        root = self.fold("(define a (lambda (if (= 2 (- 3 1)) (print_one) 0)))\n"
+                         "(define b (if (= 3 2) 1 (- 8 1)))\n"
+                         "(define c (if (= dup 0) 1 2))\n"
+                         "(define d (if (= 1 2) 1))\n")
+
+        # The test stays in front of the branch that is taken, since it sets
+        # the flags a later if may test.
+        self.assertEqual( self.dumpTree(root.children[1].children[2]),
+                          ["SEXPR", ["LAMBDA"], ["SEXPR",
+                           ["SEXPR", ["EQUALS"], ["LITERAL", "2"], ["LITERAL", "2"]],
+                           ["SEXPR", ["IDENTIFIER", "print_one"]]]])
+        self.assertEqual( self.dumpTree(root.children[2].children[2]),
+                          ["SEXPR", ["SEXPR", ["EQUALS"], ["LITERAL", "3"], ["LITERAL", "2"]],
+                           ["LITERAL", "7"]])
+
+        # Tests that are not constant, or an else that is missing, are left alone.
+        self.assertEqual( self.dumpTree(root.children[3].children[2])[1], ["IF"])
+        self.assertEqual( self.dumpTree(root.children[4].children[2])[1], ["IF"])
+
+    def test_unsupported(self):
+        # The code generator has no code for these, so they aren't folded
+        # either.
+        root = self.fold("(define a (+ 1 2))\n"
+                         "(define b (if (< 1 2) 1 2))\n"
+                         "(define c (if (> 1 2) 1 2))\n")
+        self.assertEqual( self.dumpTree(root.children[1].children[2]),
+                          ["SEXPR", ["ADD"], ["LITERAL", "1"], ["LITERAL", "2"]])
+        self.assertEqual( self.dumpTree(root.children[2].children[2])[1], ["IF"])
+        self.assertEqual( self.dumpTree(root.children[3].children[2])[1], ["IF"])
+
+    def test_quoted(self):
+        root = self.fold("(define data (words '((+ 1 2) 3)))\n")
+        self.assertEqual( self.dumpTree(root.children[1].children[2].children[1].children[0]),
+                          ["SEXPR", ["ADD"], ["LITERAL", "1"], ["LITERAL", "2"]])
+
+    def fold(self, source):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        ConstantFolder().fold(parser.astRoot)
+        return parser.astRoot
+
+    def dumpTree(self, node):
+        dump = [AbstractSyntaxTree.NAMES[node.type]]
+        if node.value != None:
+            dump.append(node.value)
+        return dump + [self.dumpTree(child) for child in node.children]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from deadcode import DeadCodeEliminator
+from schemeparser import SchemeParser, AbstractSyntaxTree
+from symboltable import SymbolTable
+from tokenizer import Tokenizer
+
+class TestDeadCode(unittest.TestCase):
+
+    def test_reachable(self):
+        source = ("(define table (words '(1 2 3)))\n"
+                  "(define pointers (words '(table)))\n"
+                  "(define unused (bytes '(4 5)))\n"
+                  "(define lookup (lambda (- pointers 1)))\n"
+                  "(define greet (lambda (display \"Hi\")))\n"
+                  "(define bye (lambda (display \"Bye\")))\n"
+                  "(define main (lookup) (display \"Main\"))\n")
+
+        # References are followed through calls, variables and addresses
+        # in quoted lists.
+        root = self.eliminate(source)
+        self.assertEqual( self.definedNames(root), ["table", "pointers", "lookup", "main"])
+        self.assertEqual( self.eliminator.dropped, ["unused", "greet", "bye"])
+        self.assertEqual( [string.value for string in root.children[0].children], ["Main"])
+        self.assertEqual( self.eliminator.droppedStrings, 2)
+
+        # Names on the keep list are reached along with main.
+        root = self.eliminate(source, keep = ["greet"])
+        self.assertEqual( self.definedNames(root), ["table", "pointers", "lookup", "greet", "main"])
+        self.assertEqual( [string.value for string in root.children[0].children], ["Hi", "Main"])
+
+    def test_without_main(self):
+        # A library without a main or names to keep is left alone.
+        root = self.eliminate("(define a (lambda (b)))\n"
+                              "(define b (words '(1)))\n"
+                              "(define c (bytes '(2)))\n")
+        self.assertEqual( self.definedNames(root), ["a", "b", "c"])
+        self.assertEqual( self.eliminator.dropped, [])
+
+    def test_nested(self):
+        # The unbalanced parentheses in the sample nest every define in
+        # the first one, the reachable ones move up when it is dropped.
+        with open("factorial.scm") as sourceFile:
+            root = self.eliminate(sourceFile.read())
+        self.assertEqual( self.definedNames(root), ["factorial", "main"])
+        self.assertEqual( self.eliminator.dropped, ["data1", "data2", "hello_world", "print_one"])
+        self.assertEqual( root.children[0].children, [])
+
+    def eliminate(self, source, **options):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        SymbolTable().resolve(parser.astRoot)
+        self.eliminator = DeadCodeEliminator(**options)
+        self.eliminator.eliminate(parser.astRoot)
+        return parser.astRoot
+
+    def definedNames(self, root):
+        return [node.children[1].value for node in root.children
+                if node.type == AbstractSyntaxTree.SEXPR]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import contextlib
+import io
+import os
+import struct
+import tempfile
+import unittest
+from assembly import Instruction, parseListing
+from buildcache import BuildCache
+from schemeparser import SchemeParser, AbstractSyntaxTree
+from simulator import Simulator
+from tinylisp import compileFile, compileSource, parseArguments
+from tokenizer import Tokenizer
+
+class TestFileTable(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.write("bytes.bin", bytes(range(100)))
+        self.write("big.bin", struct.pack(">4H", 1, 2, 300, 65535))
+        self.write("values.csv", b"1, 2, 0x10\n4,5\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_binary(self):
+        instructions = self.compile("(define t (bytes (file \"{0}/bytes.bin\" start 10 end 80)))\n"
+                                    "(define w (words (file \"{0}/big.bin\" big)))\n"
+                                    "(define b (words (file \"{0}/bytes.bin\" width 1 end 3)))\n"
+                                    "(define main t w b)\n")
+
+        # The values are emitted a chunk at a time.
+        self.assertEqual( [instruction.opcode for instruction in instructions[:5]],
+                          [None, ".byte", ".byte", ".byte", None])
+        self.assertEqual( instructions[1].operand, ", ".join(str(value) for value in range(10, 42)))
+        self.assertIn( Instruction(".word", "1, 2, 300, 65535"), instructions)
+        self.assertIn( Instruction(".word", "0, 1, 2"), instructions)
+
+        simulator = self.simulate(instructions)
+        start = simulator.globals["t"]
+        self.assertEqual( bytes(simulator.memory[start:start + 70]), bytes(range(10, 80)))
+
+    def test_csv(self):
+        instructions = self.compile("(define v (words (file \"{0}/values.csv\" start 1)))\n"
+                                    "(define main v)\n")
+        self.assertIn( Instruction(".word", "2, 16, 4, 5"), instructions)
+
+        self.write("numbers.txt", b"7\n8\n")
+        instructions = self.compile("(define v (bytes (file \"{0}/numbers.txt\" csv)))\n"
+                                    "(define main v)\n")
+        self.assertIn( Instruction(".byte", "7, 8"), instructions)
+
+    def test_incbin(self):
+        source = ("(define raw (bytes (file \"{0}/bytes.bin\")))\n"
+                  "(define part (bytes (file \"{0}/bytes.bin\" end 4)))\n"
+                  "(define main raw part)\n")
+
+        # Only a file that needs no conversion is included as it is, and it
+        # is placed in memory the same way.
+        instructions = self.compile(source, "--incbin")
+        path = os.path.join(self.directory.name, "bytes.bin")
+        self.assertIn( Instruction(".incbin", "\"{}\"".format(path)), instructions)
+        self.assertIn( Instruction(".byte", "0, 1, 2, 3"), instructions)
+        included = self.simulate(instructions)
+        emitted = self.simulate(self.compile(source))
+        self.assertEqual( included.memory, emitted.memory)
+        self.assertEqual( included.globals["part"], emitted.globals["part"])
+
+    def test_incbin_path(self):
+        # A source given by a relative path with a directory part includes
+        # its table by an absolute path, wherever the listing is written.
+        source = os.path.join(self.directory.name, "src", "program.scm")
+        os.mkdir(os.path.dirname(source))
+        self.write(os.path.join("src", "raw.bin"), b"\x01\x02\x03")
+        with open(source, "w") as sourceFile:
+            sourceFile.write("(define raw (bytes (file \"raw.bin\")))\n(define main raw)\n")
+        output = os.path.join(self.directory.name, "program.asm")
+        options = parseArguments([os.path.relpath(source), "--incbin"])
+        with contextlib.redirect_stdout(io.StringIO()):
+            compileFile(options.source, output, options)
+        with open(output) as outputFile:
+            instructions = parseListing(outputFile.read())
+        path = os.path.join(os.path.dirname(os.path.abspath(source)), "raw.bin")
+        self.assertIn( Instruction(".incbin", "\"{}\"".format(path)), instructions)
+        simulator = Simulator()
+        simulator.load(instructions)
+        start = simulator.globals["raw"]
+        self.assertEqual( bytes(simulator.memory[start:start + 3]), b"\x01\x02\x03")
+
+    def test_parse(self):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine("(define t (words (file \"t.bin\" big width 1)))\n")
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+
+        # The path is kept in the form rather than in the string pool.
+        self.assertEqual( parser.astRoot.children[0].children, [])
+        form = parser.astRoot.children[1].children[2].children[1]
+        self.assertEqual( [(AbstractSyntaxTree.NAMES[child.type], child.value) for child in form.children],
+                          [("FILE", None), ("STRING", "t.bin"), ("IDENTIFIER", "big"),
+                           ("IDENTIFIER", "width"), ("LITERAL", "1")])
+
+        # The options aren't references and the size is that of the file.
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            compileSource("(define t (words (file \"{}/bytes.bin\" big width 1)))\n"
+                          "(define main t)\n".format(self.directory.name), ["--symbols"])
+        self.assertIn( "    t                       data       200 bytes", output.getvalue())
+
+    def test_cache(self):
+        source = "(define t (bytes (file \"{0}/data.bin\")))\n(define main t)\n"
+        cache = BuildCache(None)
+        self.write("data.bin", b"\x01\x02")
+        self.assertIn( Instruction(".byte", "1, 2"), self.compile(source, cache = cache))
+
+        # A form whose file changed isn't taken from the cache.
+        self.write("data.bin", b"\x03\x04\x05")
+        self.assertIn( Instruction(".byte", "3, 4, 5"), self.compile(source, cache = cache))
+
+    def test_errors(self):
+        self.write("odd.bin", b"\x01\x02\x03")
+        self.write("empty.bin", b"")
+        self.write("bad.csv", b"1, two\n")
+        errors = [("(file \"{0}/missing.bin\")", "Can't read table file"),
+                  ("(file)", "File requires a path string"),
+                  ("(file \"{0}/bytes.bin\" sideways)", "Unknown file option 'sideways'"),
+                  ("(file \"{0}/bytes.bin\" start)", "File option 'start' requires a number"),
+                  ("(file \"{0}/bytes.bin\" width 4)", "File width must be 1 or 2, not 4"),
+                  ("(file \"{0}/odd.bin\" width 2)", "isn't a multiple of 2 bytes"),
+                  ("(file \"{0}/big.bin\" width 2)", "Value 65535 .* doesn't fit in a byte"),
+                  ("(file \"{0}/values.csv\" start 5)", "has no values"),
+                  ("(file \"{0}/empty.bin\")", "has no values"),
+                  ("(file \"{0}/bad.csv\")", "'two' in .* isn't a number")]
+        for form, message in errors:
+            with self.assertRaisesRegex(Exception, message):
+                self.compile("(define t (bytes " + form + "))\n(define main t)\n")
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory.name, name), "wb") as binaryFile:
+            binaryFile.write(data)
+
+    def compile(self, source, *options, cache = None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return parseListing(compileSource(source.format(self.directory.name), options, cache))
+
+    def simulate(self, instructions):
+        simulator = Simulator()
+        simulator.load(instructions)
+        simulator.run()
+        return simulator
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from inliner import Inliner
+from schemeparser import SchemeParser, AbstractSyntaxTree
+from symboltable import SymbolTable
+from tokenizer import Tokenizer
+
+class TestInliner(unittest.TestCase):
+
+    def test_leaf(self):
+        root = self.inline("(define double (lambda (* dup 2)))\n"
+                           "(define greet (lambda (display \"Hi\")))\n"
+                           "(define twice (lambda ((greet) (greet))))\n"
+                           "(define main (double (double)) (twice))\n")
+
+        # A lambda becomes a leaf once its own calls are inlined, and is
+        # dropped when nothing refers to it any more.
+        self.assertEqual( [self.dumpTree(node)[2] for node in root.children[1:]],
+                          [["IDENTIFIER", "main"]])
+        main = self.dumpTree(root.children[1])
+        self.assertEqual( main[3], ["SEXPR", ["SEXPR", ["MULTIPLY"], ["DUP"], ["LITERAL", "2"]],
+                                    ["SEXPR", ["MULTIPLY"], ["DUP"], ["LITERAL", "2"]]])
+        reference = main[4][1][2]
+        self.assertEqual( reference[0], "REFERENCE")
+        self.assertEqual( main[4], ["SEXPR", ["SEXPR", ["DISPLAY"], reference],
+                                    ["SEXPR", ["DISPLAY"], reference]])
+        self.assertEqual( self.inliner.inlined, {"double" : 2, "greet" : 2, "twice" : 1})
+        self.assertEqual( sorted(self.inliner.dropped), ["double", "greet", "twice"])
+
+        # Each call site gets its own copy of the body.
+        self.assertIsNot( root.children[1].children[2].children[0], root.children[1].children[2].children[1])
+
+    def test_not_inlined(self):
+        root = self.inline("(define x (words '(5)))\n"
+                           "(define countdown\n"
+                           "  (lambda (if (= dup 0) 0 (countdown (- dup 1)))))\n"
+                           "(define double (lambda (* dup 2)))\n"
+                           "(define big (lambda (* (* (* dup 2) 3) (* (* dup 4) 5))))\n"
+                           "(define main (countdown 5) (double x) (double (big)))\n")
+
+        # Recursive lambdas, large ones and calls whose first argument is
+        # an identifier are left alone.
+        self.assertEqual( self.inliner.inlined, {"double" : 1})
+        self.assertEqual( self.inliner.dropped, [])
+        self.assertEqual( len(root.children), 6)
+
+    def test_optimize_size(self):
+        source = ("(define double (lambda (* dup 2)))\n"
+                  "(define once (lambda (- dup 1)))\n"
+                  "(define main (double) (double) (once))\n")
+
+        # A body that is larger than the calls it replaces is only
+        # inlined when it is called once.
+        self.inline(source, optimizeSize = True)
+        self.assertEqual( self.inliner.inlined, {"once" : 1})
+
+        self.inline(source, threshold = 8)
+        self.assertEqual( self.inliner.inlined, {})
+
+        self.inline(source)
+        self.assertEqual( self.inliner.inlined, {"double" : 2, "once" : 1})
+
+    def test_alias(self):
+        root = self.inline("(define double (lambda (* dup 2)))\n"
+                           "(define twice double)\n"
+                           "(define main (twice) (double))\n")
+
+        # A call through an alias is a call to the lambda it stands for,
+        # which is kept while the alias refers to it.
+        self.assertEqual( self.inliner.inlined, {"double" : 2})
+        self.assertEqual( self.inliner.dropped, [])
+        self.assertEqual( self.dumpTree(root.children[3])[3:], [["SEXPR", ["MULTIPLY"], ["DUP"], ["LITERAL", "2"]],
+                          ["SEXPR", ["MULTIPLY"], ["DUP"], ["LITERAL", "2"]]])
+
+    def inline(self, source, **options):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        SymbolTable().resolve(parser.astRoot)
+        self.inliner = Inliner(**options)
+        self.inliner.inline(parser.astRoot)
+        return parser.astRoot
+
+    def dumpTree(self, node):
+        dump = [AbstractSyntaxTree.NAMES[node.type]]
+        if node.value != None:
+            dump.append(node.value)
+        return dump + [self.dumpTree(child) for child in node.children]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import unittest
+from instrumentation import Instrumentation
+from tinylisp import compileFile, compileSource, parseArguments
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_compile_source(self):
+        source = ("(define data (words '(1 2 3)))\n"
+                  "(define main (lambda (display \"Hi\") (* dup 2)))\n")
+
+        stats = Instrumentation()
+        listing = compileSource(source, ["-O0"], stats = stats)
+        self.assertEqual( listing, compileSource(source, ["-O0"]))
+
+        # Without optimization there are no inline, fold or dead code phases.
+        self.assertEqual( [entry["phase"] for entry in stats.phases],
+                          ["tokenize", "parse", "resolve", "generate"])
+        for entry in stats.phases:
+            self.assertGreaterEqual( entry["peak"], 0)
+        self.assertEqual( stats.tokens, 29)
+        self.assertEqual( stats.nodes["DEFINE"], 2)
+        self.assertEqual( stats.nodes["LAMBDA"], 1)
+        self.assertEqual( stats.dispatches["CodeGenerator.processLambda"], 1)
+        self.assertEqual( stats.dispatches["SchemeParser.parseString"], 1)
+        self.assertEqual( stats.instructions["opcodes"]["`pushi"], 1)
+        self.assertEqual( stats.instructions["instructions"], 4)
+
+    def test_stats_option(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sourceName = os.path.join(directory, "main.scm")
+            outputName = os.path.join(directory, "main.asm")
+            with open(sourceName, "w") as sourceFile:
+                sourceFile.write("(define main (lambda (- 9 dup)))\n")
+
+            # Memory tracing can be turned off through the API.
+            stats = Instrumentation(traceMemory = False)
+            compileFile(sourceName, outputName, parseArguments([sourceName]), stats = stats)
+            self.assertNotIn( "allocated", stats.phases[0])
+            self.assertEqual( stats.phases[-1]["phase"], "write")
+            self.assertFalse( os.path.exists(os.path.join(directory, "main.stats.json")))
+
+            compileFile(sourceName, outputName, parseArguments([sourceName, "--stats"]))
+            with open(os.path.join(directory, "main.stats.json")) as jsonFile:
+                stats = json.load(jsonFile)
+            self.assertEqual( [entry["phase"] for entry in stats["phases"]],
+                              ["tokenize", "parse", "resolve", "fold", "evaluate", "deadcode", "generate", "write"])
+            self.assertEqual( stats["nodes"]["SUB"], 1)
+            self.assertGreater( stats["tokensPerSecond"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
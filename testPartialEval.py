@@ -0,0 +1,116 @@
+import contextlib
+import io
+import unittest
+from assembly import Instruction, parseListing
+from partialeval import PartialEvaluator
+from schemeparser import SchemeParser, AbstractSyntaxTree
+from simulator import Simulator
+from symboltable import SymbolTable
+from tinylisp import compileSource
+from tokenizer import Tokenizer
+
+class TestPartialEval(unittest.TestCase):
+
+    def test_factorial(self):
+        with open("factorial.scm") as sourceFile:
+            source = sourceFile.read()
+
+        # The call in main is replaced by the values it leaves, so the
+        # recursive lambda is no longer reachable.
+        instructions = self.compile(source)
+        self.assertNotIn( Instruction("jsr", "factorial"), instructions)
+        self.assertNotIn( Instruction(label = "factorial"), instructions)
+        self.assertEqual( self.results(instructions), self.results(self.compile(source, "-O0")))
+        self.assertLess( self.simulate(instructions).cycles, self.simulate(self.compile(source, "-O0")).cycles)
+
+    def test_same_results(self):
+        # Each program leaves the same stack and flags with and without
+        # the calls evaluated.
+        sources = ["(define square (lambda (* dup dup)))\n"
+                   "(define main (square 12) (- (square 3) 1))\n",
+                   "(define iszero (lambda (= dup 0)))\n"
+                   "(define main (if (iszero 0) 7 9) (if (iszero 4) 7 9))\n",
+                   "(define half (lambda (/ dup 2)))\n"
+                   "(define twice half)\n"
+                   "(define main (twice 9) (half 65535))\n",
+                   "(define pair (lambda 1 2))\n"
+                   "(define main (- (pair) 3))\n"]
+        for source in sources:
+            instructions = self.compile(source)
+            calls = [instruction.operand for instruction in instructions if instruction.opcode in ("jsr", "jmp")]
+            self.assertEqual( [call for call in calls if not call.endswith("16")], [])
+            self.assertEqual( self.results(instructions), self.results(self.compile(source, "-O0")))
+
+    def test_not_evaluated(self):
+        root, evaluator = self.evaluate("(define x (words '(5)))\n"
+                                        "(define greet (lambda (display \"Hi\")))\n"
+                                        "(define read (lambda (- x 1)))\n"
+                                        "(define under (lambda (- 1)))\n"
+                                        "(define flags (lambda (if 1 2 3)))\n"
+                                        "(define zero (lambda (/ 1 0)))\n"
+                                        "(define inc (lambda (- dup 1)))\n"
+                                        "(define main (greet) (read) (under) (flags) (zero) (inc x))\n")
+
+        # Printing, reading a variable, reaching below the arguments, an if
+        # on the caller's flags, division by zero and a variable argument.
+        self.assertEqual( evaluator.evaluated, {})
+        self.assertEqual( len(root.children[-1].children), 8)
+        self.assertEqual( evaluator.pure, {"greet" : False, "read" : False, "under" : True,
+                                           "flags" : True, "zero" : True})
+
+    def test_budget(self):
+        source = ("(define countdown\n"
+                  "  (lambda (if (= dup 0) 0 (countdown (- dup 1)))))\n"
+                  "(define main (countdown 3) (countdown 3))\n")
+
+        # The second call reuses the result of the first.
+        root, evaluator = self.evaluate(source)
+        self.assertEqual( evaluator.evaluated, {"countdown" : 2})
+        self.assertEqual( evaluator.hits, 1)
+        self.assertEqual( self.dumpTree(root.children[-1].children[2]),
+                          ["SEXPR", ["LITERAL", "3"], ["LITERAL", "2"], ["LITERAL", "1"],
+                           ["LITERAL", "0"], ["LITERAL", "0"],
+                           ["SEXPR", ["EQUALS", "="], ["LITERAL", "0"], ["LITERAL", "0"]]])
+
+        root, evaluator = self.evaluate(source, budget = 20)
+        self.assertEqual( evaluator.evaluated, {})
+
+        # Too many values or a larger replacement when optimizing for size.
+        root, evaluator = self.evaluate(source, maxValues = 4)
+        self.assertEqual( evaluator.evaluated, {})
+        root, evaluator = self.evaluate(source, optimizeSize = True)
+        self.assertEqual( evaluator.evaluated, {})
+
+    def evaluate(self, source, **options):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        SymbolTable().resolve(parser.astRoot)
+        evaluator = PartialEvaluator(**options)
+        evaluator.evaluate(parser.astRoot)
+        return parser.astRoot, evaluator
+
+    def compile(self, source, *options):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return parseListing(compileSource(source, options))
+
+    def simulate(self, instructions):
+        simulator = Simulator()
+        simulator.load(instructions)
+        simulator.run()
+        return simulator
+
+    def results(self, instructions):
+        simulator = self.simulate(instructions)
+        return simulator.dataStack, simulator.zero
+
+    def dumpTree(self, node):
+        dump = [AbstractSyntaxTree.NAMES[node.type]]
+        if node.value != None:
+            dump.append(node.value)
+        return dump + [self.dumpTree(child) for child in node.children]
+
+if __name__ == '__main__':
+    unittest.main()
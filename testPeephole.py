@@ -0,0 +1,132 @@
+import unittest
+from assembly import Instruction, formatListing, parseListing
+from peephole import PeepholeOptimizer
+
+class TestPeephole(unittest.TestCase):
+
+    def test_listing_round_trip(self):
+        listing = "".join( (
+                "ref_1:\t.byte \"Hello World!\",0\n",
+                "data1:\n",
+                "\t.byte 1, 2, 3, 4\n",
+                "factorial:\n",
+                ".scope\n",
+                "\t`pushi 0\n",
+                "\tjsr equals16\n",
+                "\tbne _else\n",
+                "_else:\n",
+                ".scend\n",
+                "\n" ))
+
+        instructions = parseListing(listing)
+        self.assertEqual( instructions[0], Instruction(".byte", "\"Hello World!\",0", "ref_1"))
+        self.assertEqual( instructions[1], Instruction(label = "data1"))
+        self.assertEqual( instructions[5], Instruction("`pushi", "0"))
+        self.assertEqual( instructions[10], Instruction())
+        self.assertEqual( formatListing(instructions), listing)
+
+    def test_rules(self):
+        listing = "".join( (
+                "main:\n",
+                "\t`pushi 1\n",
+                "\tjsr sub16\n",
+                "\t`pushi 1\n",
+                "\tjsr add16\n",
+                "\t`pushi 0\n",
+                "\tjsr sub16\n",
+                "\t`dup\n",
+                "\t`drop\n",
+                "\tbra _endif\n",
+                "_else:\n",
+                "_endif:\n",
+                "\tbra _endif\n",
+                ".scend\n",
+                "_endif:\n" ))
+
+        optimizer = PeepholeOptimizer()
+        instructions = optimizer.optimize(parseListing(listing))
+        self.assertEqual( formatListing(instructions), "".join( (
+                "main:\n",
+                "\t`dec16\n",
+                "\t`inc16\n",
+                "_else:\n",
+                "_endif:\n",
+                "\tbra _endif\n",
+                ".scend\n",
+                "_endif:\n" )))
+
+        self.assertEqual( optimizer.hits, {"fold-decrement" : 1,
+                                           "fold-increment" : 1,
+                                           "remove-add-zero" : 1,
+                                           "remove-dup-drop" : 1,
+                                           "remove-branch-to-next" : 1})
+        self.assertEqual( optimizer.before, 10)
+        self.assertEqual( optimizer.after, 3)
+
+    def test_cached_rules(self):
+        listing = "".join( (
+                "\t`loadv x\n",
+                "\t`sub16i 1\n",
+                "\t`add16i 1\n",
+                "\t`add16i 0\n",
+                "\t`sub16i 2\n",
+                "\t`spill\n",
+                "\t`fill\n" ))
+
+        optimizer = PeepholeOptimizer()
+        instructions = optimizer.optimize(parseListing(listing))
+        self.assertEqual( formatListing(instructions), "".join( (
+                "\t`loadv x\n",
+                "\t`dec16t\n",
+                "\t`inc16t\n",
+                "\t`sub16i 2\n" )))
+        self.assertEqual( optimizer.hits, {"fold-decrement" : 1,
+                                           "fold-increment" : 1,
+                                           "remove-add-zero" : 1,
+                                           "remove-spill-fill" : 1})
+
+    def test_unreachable(self):
+        listing = "".join( (
+                "\tjmp countdown\n",
+                "\tbra _endif\n",
+                "_else:\n",
+                "\trts\n",
+                "\t`pushi 1\n",
+                ".scend\n" ))
+
+        optimizer = PeepholeOptimizer()
+        instructions = optimizer.optimize(parseListing(listing))
+        self.assertEqual( formatListing(instructions), "".join( (
+                "\tjmp countdown\n",
+                "_else:\n",
+                "\trts\n",
+                ".scend\n" )))
+        self.assertEqual( optimizer.hits, {"remove-unreachable" : 2})
+
+    def test_labels_are_kept(self):
+        # A sequence is not matched across a label, and a label on the
+        # first instruction moves to the replacement.
+        instructions = [Instruction("`pushi", "1", "entry"),
+                        Instruction("jsr", "sub16"),
+                        Instruction("`dup", None, "loop"),
+                        Instruction("`drop", None, "skip")]
+
+        instructions = PeepholeOptimizer().optimize(instructions)
+        self.assertEqual( instructions, [Instruction("`dec16", None, "entry"),
+                                         Instruction("`dup", None, "loop"),
+                                         Instruction("`drop", None, "skip")])
+
+    def test_rule_table(self):
+        def removeNop(instructions, idx):
+            return 1, []
+
+        optimizer = PeepholeOptimizer({"nop" : [("remove-nop", removeNop)]})
+        instructions = optimizer.optimize([Instruction("nop"),
+                                           Instruction("`pushi", "1"),
+                                           Instruction("jsr", "sub16")])
+        self.assertEqual( instructions, [Instruction("`pushi", "1"),
+                                         Instruction("jsr", "sub16")])
+        self.assertEqual( optimizer.hits, {"remove-nop" : 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
+import os
+import tempfile
 import unittest
-from schemeparser import SchemeParser, AbstractSyntaxTree
-from tokenizer import Token
+from schemeparser import SchemeParser, AbstractSyntaxTree, stringDigest
+from tokenizer import Token, Tokenizer
 
 class TestSchemeParser(unittest.TestCase):
     def test_c_tokenize(self):
@@ -72,6 +74,84 @@ class TestSchemeParser(unittest.TestCase):
         parser.parse(tokenList)
         self.processChildren(parser.astRoot, 0)
 
+    def test_parse_stream(self):
+        source = ("; a comment.\n(define data '(1 2 3 4))\n"
+                  "(define factorial\n  (lambda\n  (if (= dup 0) 1\n"
+                  "      (* dup (factorial (- dup 1))))))\n"
+                  "(define main (factorial 5))\n")
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "source.scm")
+            with open(filename, "w") as sourcefile:
+                sourcefile.write(source)
+
+            tokenizer = self.createTokenizer()
+            tokenizer.tokenizeFile(filename)
+            parser = SchemeParser()
+            parser.parse(tokenizer.tokenList)
+
+            streamParser = SchemeParser()
+            streamParser.parseStream(self.createTokenizer().iterTokens(filename, 7))
+            self.assertEqual( self.dumpTree(streamParser.astRoot),
+                              self.dumpTree(parser.astRoot))
+
+            # Top level nodes are yielded as soon as they are complete.
+            forms = list(SchemeParser().iterParse(self.createTokenizer().iterTokens(filename, 7)))
+            self.assertEqual( [node.type for node in forms],
+                              [AbstractSyntaxTree.COMMENT] + [AbstractSyntaxTree.SEXPR] * 3)
+
+    def test_parse_deep(self):
+        depth = 5000
+        tokenizer = self.createTokenizer()
+        tokenizer.tokenizeLine("(define main " + "(if (= dup 0) 1 " * depth +
+                               "'(0))" + ")" * depth + ")\n")
+
+        # The explicit stack engine is not bounded by the recursion limit.
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        node = parser.astRoot.children[1].children[2]
+        level = 0
+        while len(node.children) == 4:
+            node = node.children[3]
+            level = level + 1
+        self.assertEqual( level, depth)
+        self.assertTrue( node.quoted)
+
+        # Both engines build the same tree when the recursion limit allows.
+        tokenizer = self.createTokenizer()
+        tokenizer.tokenizeLine("(define main " + "(if (= dup 0) '1 " * 50 +
+                               "'(0 ')" + ")" * 50 + ") ')\n")
+        recursive = SchemeParser(recursive=True)
+        recursive.parse(tokenizer.tokenList)
+        iterative = SchemeParser()
+        iterative.parse(tokenizer.tokenList)
+        self.assertEqual( self.dumpTree(iterative.astRoot),
+                          self.dumpTree(recursive.astRoot))
+
+    def test_string_pool(self):
+        tokenizer = self.createTokenizer()
+        tokenizer.tokenizeLine("(define a (lambda (display \"Hi\")))\n"
+                               "(define b (lambda (display \"Hi\") (display \"Bye\")))\n")
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+
+        # Identical strings share one pool entry, and the references are
+        # derived from the content so they are the same in every run.
+        self.assertEqual( [string.value for string in parser.stringPool.children], ["Hi", "Bye"])
+        references = [parser.astRoot.children[1].children[2].children[1].children[1],
+                      parser.astRoot.children[2].children[2].children[1].children[1]]
+        self.assertEqual( [reference.value for reference in references],
+                          [stringDigest("Hi")] * 2)
+        self.assertEqual( stringDigest("Hi"), "94dd9e08c129")
+
+    def createTokenizer(self):
+        return Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                         SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+
+    def dumpTree(self, node):
+        return (AbstractSyntaxTree.NAMES[node.type], node.value, node.quoted,
+                [self.dumpTree(child) for child in node.children])
+
     def processChildren(self, node, level):
         print("    " * level + str(node))
         children = node.children
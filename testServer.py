@@ -0,0 +1,103 @@
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from server import CompileServer, request
+
+class TestServer(unittest.TestCase):
+
+    def test_poll(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "a.scm"
+            source.write_text("(define double (lambda ((display 1) (* dup 2))))\n(define main (double 5))\n")
+            server = CompileServer()
+
+            # A new source is compiled, and again only once it changes.
+            responses = server.poll([directory])
+            self.assertEqual( [(response["source"], response["ok"]) for response in responses],
+                              [(str(source), True)])
+            self.assertGreater( responses[0]["milliseconds"], 0)
+            self.assertTrue( source.with_suffix(".asm").exists())
+            self.assertEqual( server.poll([directory]), [])
+
+            # The forms that didn't change come from the cache in memory.
+            source.write_text("(define double (lambda ((display 1) (* dup 2))))\n(define main (double 6))\n")
+            os.utime(source, ns=(0, 1))
+            responses = server.poll([directory])
+            self.assertEqual( len(responses), 1)
+            self.assertEqual( server.cache.hits, 2)
+            self.assertIn( "`pushi 6", source.with_suffix(".asm").read_text())
+            self.assertEqual( len(server.latencies), 2)
+
+    def test_cache_limit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "a.scm"
+            server = CompileServer(cacheLimit = 3)
+
+            # Each edit adds an entry and the oldest are dropped, while the
+            # forms that didn't change stay in use.
+            for value in range(5):
+                source.write_text("(define data (words '({})))\n(define main (display 1))\n".format(value))
+                self.assertTrue( server.compile([str(source), "-o", str(source.with_suffix(".asm"))])["ok"])
+                self.assertLessEqual( len(server.cache.entries), 3)
+            self.assertEqual( server.cache.hits, 8)
+
+    def test_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "bad.scm"
+            source.write_text("(define 5 x)\n")
+            server = CompileServer()
+            response = server.compile([str(source), "-o", str(source.with_suffix(".asm"))])
+            self.assertEqual( (response["ok"], response["error"]), (False, "Undefined reference to 'x'"))
+            response = server.compile([str(source), "-O", "9"])
+            self.assertFalse( response["ok"])
+
+    @unittest.skipUnless(hasattr(socketserver, "UnixStreamServer"), "needs Unix sockets")
+    def test_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "a.scm"
+            source.write_text("(define main (display 1))\n")
+            socketPath = os.path.join(directory, "server.sock")
+            server = CompileServer().createSocketServer(socketPath)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                response = request(socketPath, [str(source), "-o", str(source.with_suffix(".asm"))])
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            self.assertTrue( response["ok"])
+            self.assertIn( "\t`print 1\n", source.with_suffix(".asm").read_text())
+
+    @unittest.skipUnless(hasattr(socketserver, "UnixStreamServer"), "needs Unix sockets")
+    def test_bad_request(self):
+        with tempfile.TemporaryDirectory() as directory:
+            socketPath = os.path.join(directory, "server.sock")
+            server = CompileServer().createSocketServer(socketPath)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                # Each bad line gets an error reply on the same connection.
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                    client.connect(socketPath)
+                    client.sendall(b"not json\n{\"args\" : []}\n{\"argv\" : 5}\n")
+                    with client.makefile("r", encoding="utf-8") as reader:
+                        responses = [json.loads(reader.readline()) for idx in range(3)]
+                source = Path(directory) / "a.scm"
+                source.write_text("(define main (display 1))\n")
+                response = request(socketPath, [str(source), "-o", str(source.with_suffix(".asm"))])
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            self.assertEqual( [response["ok"] for response in responses], [False, False, False])
+            self.assertTrue( all(response["error"].startswith("invalid request") for response in responses))
+            self.assertTrue( response["ok"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from assembly import parseListing
+from profiler import Profiler
+from schemeparser import SchemeParser
+from simulator import Simulator
+from tinylisp import CodeGenerator, compileSource
+from tokenizer import Tokenizer
+
+class TestSimulator(unittest.TestCase):
+
+    def test_macros(self):
+        listing = "".join( (
+                "ref_1:\t.byte \"Hi\",0\n",
+                "table:\n",
+                "\t.word 1234, table+2\n",
+                "main:\n",
+                "\t`pushv table\n",
+                "\t`pushi 6\n",
+                "\tjsr sub16\n",
+                "\t`shl16\n",
+                "\t`pushi 3\n",
+                "\tjsr mul16\n",
+                "\t`dup\n",
+                "\t`pushi 7368\n",
+                "\tjsr equals16\n",
+                ".scope\n",
+                "\tbne _else\n",
+                "\t`pushi ref_1\n",
+                "\tjsr println\n",
+                "\tbra _endif\n",
+                "_else:\n",
+                "\t`print 0\n",
+                "_endif:\n",
+                ".scend\n" ))
+
+        simulator = Simulator()
+        simulator.load(parseListing(listing))
+        simulator.run()
+        self.assertEqual( simulator.dataStack, [7368])
+        self.assertEqual( simulator.output, ["Hi\n"])
+        self.assertEqual( simulator.readWord(simulator.globals["table"] + 2),
+                          simulator.globals["table"] + 2)
+        self.assertEqual( simulator.steps, 13)
+        self.assertEqual( simulator.maxDataDepth, 3)
+        self.assertEqual( simulator.maxReturnDepth, 1)
+        self.assertEqual( simulator.counts["jsr"], 4)
+
+        # Fixed costs plus the loops in mul16 and println.
+        self.assertEqual( simulator.cycles,
+                          20 + 16 + (6 + 36) + 12 + 16 + (6 + 40 + 16 * 25 + 20 * 2) +
+                          20 + 16 + (6 + 30) + 2 + 16 + (6 + 30 + 14 * 2) + 3)
+
+    def test_scopes(self):
+        # Local labels resolve to the innermost scope that defines them.
+        listing = "".join( (
+                "main:\n",
+                ".scope\n",
+                "\tjmp _skip\n",
+                ".scope\n",
+                "_skip:\n",
+                "\t`print 1\n",
+                ".scend\n",
+                "_skip:\n",
+                "\t`print 2\n",
+                ".scend\n" ))
+
+        simulator = Simulator()
+        simulator.load(parseListing(listing))
+        simulator.run()
+        self.assertEqual( simulator.output, ["2"])
+
+    def test_return_stack(self):
+        source = ("(define countdown\n"
+                  "  (lambda\n"
+                  "  (if (= dup 0) 0\n"
+                  "      (countdown (- dup 1)))))\n"
+                  "(define main (countdown {}))\n")
+
+        # The return stack grows with each level of recursion unless the
+        # call in tail position is a jump.
+        depths = []
+        for tailCalls in (False, True):
+            for count in (5, 50):
+                simulator = self.simulate(source.format(count), tailCalls = tailCalls)
+                depths.append(simulator.maxReturnDepth)
+        self.assertEqual( depths, [5 + 2, 50 + 2, 2, 2])
+
+    def test_factorial(self):
+        with open("factorial.scm") as sourceFile:
+            source = sourceFile.read()
+
+        simulator = self.simulate(source)
+        self.assertEqual( simulator.counts["jsr"], 22)
+        self.assertEqual( simulator.maxReturnDepth, 7)
+
+        simulator.run("hello_world")
+        self.assertEqual( simulator.output, ["Hello World!\n"])
+
+    def test_cache_tos(self):
+        source = ("(define x (words '(7)))\n"
+                  "(define y (words '(3)))\n"
+                  "(define main (* (- (- x 1) (- y 2)) (- (* x 4) 3)))\n")
+
+        # Caching the top of stack gives the same results in fewer cycles.
+        stacked = self.simulate(source, strengthReduction = True)
+        cached = self.simulate(source, strengthReduction = True, cacheTos = True)
+        self.assertEqual( stacked.dataStack, [125])
+        self.assertEqual( cached.dataStack, [125])
+        self.assertEqual( stacked.cycles, 806)
+        self.assertEqual( cached.cycles, 710)
+        self.assertEqual( cached.maxDataDepth, 1)
+
+        with open("factorial.scm") as sourceFile:
+            source = sourceFile.read()
+        stacked = self.simulate(source)
+        cached = self.simulate(source, cacheTos = True)
+        self.assertEqual( cached.dataStack, stacked.dataStack)
+        self.assertLess( cached.cycles, stacked.cycles)
+
+    def test_zero_page(self):
+        source = ("(define limit (words '(0)))\n"
+                  "(define countdown\n"
+                  "  (lambda\n"
+                  "  (if (= dup limit) 0\n"
+                  "      (countdown (- dup 1)))))\n"
+                  "(define main (countdown 50))\n")
+
+        # Main stores the initial value, after which every access to the
+        # variable is two cycles cheaper.
+        absolute = self.simulate(source)
+        zeroPage = self.simulate(source, zeroPage = {"limit" : (0x80, 2, "0")})
+        self.assertEqual( zeroPage.globals["limit"], 0x80)
+        self.assertEqual( zeroPage.dataStack, absolute.dataStack)
+        self.assertEqual( zeroPage.cycles, absolute.cycles - 51 * 2 + 10)
+
+    def test_profile(self):
+        listing = "".join( (
+                "data:\t.byte 1, 2, 3\n",
+                "double:\n",
+                ".scope\n",
+                "\t`shl16\n",
+                "_done:\n",
+                "\trts\n",
+                ".scend\n",
+                "main:\n",
+                "\t`pushi 5\n",
+                "\tjsr double\n",
+                "\tjsr double\n" ))
+
+        simulator = Simulator()
+        simulator.load(parseListing(listing))
+        profiler = Profiler(simulator)
+        profiler.simulate()
+        self.assertEqual( profiler.results(), [
+                {"label" : "double", "bytes" : 5, "cycles" : 2 * (12 + 6), "instructions" : 4},
+                {"label" : "main", "bytes" : 16, "cycles" : 16 + 2 * 6, "instructions" : 3},
+                {"label" : "data", "bytes" : 3, "cycles" : 0, "instructions" : 0} ])
+
+        # A trace file gives the address and cycles of each instruction.
+        with tempfile.TemporaryDirectory() as directory:
+            traceName = os.path.join(directory, "trace.txt")
+            with open(traceName, "w") as traceFile:
+                traceFile.write("# address cycles\n")
+                traceFile.write("${:04X} 16\n".format(simulator.globals["main"]))
+                traceFile.write("{:04x} 12\n".format(simulator.globals["double"]))
+                traceFile.write("FFFA 7\n")
+
+            profiler = Profiler(simulator)
+            profiler.readTrace(traceName)
+            self.assertEqual( [(entry["label"], entry["cycles"]) for entry in profiler.results()],
+                              [("main", 16), ("double", 12), ("(outside)", 7), ("data", 0)])
+
+    def test_optimized_results(self):
+        # A left literal is only left out of a multiply when the other
+        # operand doesn't read the stack, and a folded if still sets the
+        # flags a later if tests.
+        sources = ["(define main (if (= 1 1) 5 6) (if 0 7 8))\n",
+                   "(define main (if (= 1 2) 5 6) (if 0 7 8))\n",
+                   "(define main 5 (* 2 dup))\n",
+                   "(define main 5 (* 1 dup))\n",
+                   "(define main 5 (* 4 (- dup 1)))\n",
+                   "(define x (words '(9)))\n(define main (* 2 x) (* 5 (- x 1)) (* dup 4))\n"]
+        for source in sources:
+            self.assertEqual( self.compileAndRun(source, "-O1").dataStack,
+                              self.compileAndRun(source, "-O0").dataStack)
+
+    def compileAndRun(self, source, *options):
+        with contextlib.redirect_stdout(io.StringIO()):
+            instructions = parseListing(compileSource(source, options))
+        simulator = Simulator()
+        simulator.load(instructions)
+        simulator.run()
+        return simulator
+
+    def simulate(self, source, **options):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+
+        with tempfile.TemporaryDirectory() as directory:
+            outputName = os.path.join(directory, "output.asm")
+            CodeGenerator(parser.astRoot, **options).process(outputName)
+            simulator = Simulator()
+            simulator.loadFile(outputName)
+        return simulator.run()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import contextlib
+import io
+import sys
+import unittest
+from assembly import Instruction, parseListing
+from schemeparser import SchemeParser
+from simulator import Simulator
+from symboltable import Symbol, SymbolTable
+from tinylisp import compileSource
+from tokenizer import Token, Tokenizer
+
+class TestSymbolTable(unittest.TestCase):
+
+    def test_resolve(self):
+        source = ("(define table (words '(1 2 3))\n"
+                  "(define twice double)\n"
+                  "(define double (lambda (n) (* dup 2)))\n"
+                  "(define main (+ (twice 21) table)))\n")
+
+        root, symbols = self.resolve(source)
+        table = symbols.lookup("table")
+        self.assertEqual( (table.kind, table.size), (Symbol.DATA, 6))
+        self.assertEqual( symbols.lookup("double").kind, Symbol.LAMBDA)
+        self.assertGreater( symbols.lookup("double").size, 0)
+        twice = symbols.lookup("twice")
+        self.assertEqual( (twice.kind, twice.size), (Symbol.ALIAS, 0))
+        self.assertIs( twice.target, symbols.lookup("double"))
+        self.assertIsNone( symbols.lookup("n"))
+
+        # The defines nested in table by its missing parenthesis are found,
+        # and every identifier is bound to the symbol of its define.
+        main = symbols.lookup("main").node
+        self.assertIs( main.children[1].symbol, symbols.lookup("main"))
+        call = main.children[2].children[1]
+        self.assertIs( call.children[0].symbol, twice)
+        self.assertIs( main.children[2].children[2].symbol, table)
+
+    def test_errors(self):
+        with self.assertRaisesRegex(Exception, "Undefined references to 'f', 'x'"):
+            self.resolve("(define main (f x (f 1)))\n")
+        with self.assertRaisesRegex(Exception, "Duplicate define of 'a'"):
+            self.resolve("(define a (words '(1)))\n(define a (words '(2)))\n")
+        with self.assertRaisesRegex(Exception, "'a' is data and can't be called"):
+            compileSource("(define a (words '(1)))\n(define main (a 1))\n")
+
+    def test_alias(self):
+        source = ("(define twice double)\n"
+                  "(define double (lambda (* dup 2)))\n"
+                  "(define main (twice 21))\n")
+
+        # The alias is another name for the lambda, so it takes no space.
+        with contextlib.redirect_stdout(io.StringIO()):
+            instructions = parseListing(compileSource(source, ["-O0"]))
+        self.assertIn( Instruction(".alias", "twice double"), instructions)
+        self.assertNotIn( Instruction(label = "twice"), instructions)
+
+        simulator = Simulator()
+        simulator.load(instructions)
+        simulator.run()
+        self.assertEqual( simulator.dataStack, [21, 42])
+
+    def test_extern(self):
+        # A routine written in assembler is called like a lambda once it
+        # is declared, at every optimization level.
+        source = "(define main (lambda ((helper 3) (- table 1))))\n"
+        with self.assertRaisesRegex(Exception, "Undefined references to 'helper', 'table'"):
+            compileSource(source)
+        for level in ("-O0", "-O2"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                instructions = parseListing(compileSource(source, [level, "--extern", "helper",
+                                                                   "--extern", "table"]))
+            self.assertIn( Instruction("jsr", "helper"), instructions)
+            self.assertIn( Instruction("`pushv", "table"), instructions)
+
+        # A define in the source takes the place of the extern.
+        root, symbols = self.resolve("(define helper (lambda 1))\n(define main (helper))\n", ["helper"])
+        self.assertEqual( symbols.lookup("helper").kind, Symbol.LAMBDA)
+        root, symbols = self.resolve("(define main (helper))\n", ["helper"])
+        self.assertEqual( (symbols.lookup("helper").kind, symbols.lookup("helper").node), (Symbol.EXTERN, None))
+
+    def test_interned(self):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        self.assertIsInstance( tokenizer.keywords, frozenset)
+        tokenizer.tokenizeLine("(define long_name (long_name))\n")
+        names = [token.value for token in tokenizer.tokenList if token.type == Token.IDENTIFIER]
+        self.assertEqual( len(names), 2)
+        self.assertIs( names[0], names[1])
+        self.assertIs( names[0], sys.intern("long_name"))
+
+    def resolve(self, source, externs = ()):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        symbols = SymbolTable(externs = externs)
+        symbols.resolve(parser.astRoot)
+        return parser.astRoot, symbols
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import os
+import tempfile
+import unittest
+from assembly import Instruction, parseListing
+from schemeparser import SchemeParser, stringDigest
+from tinylisp import CodeGenerator, compileSource
+from tokenizer import Tokenizer
+
+class TestTinyLisp(unittest.TestCase):
+
+    def test_tail_calls(self):
+        source = ("(define countdown\n"
+                  "  (lambda\n"
+                  "  (if (= dup 0) 0\n"
+                  "      (countdown (- dup 1)))))\n"
+                  "(define factorial\n"
+                  "  (lambda\n"
+                  "  (if (= dup 0) 1\n"
+                  "      (* dup (factorial (- dup 1))))))\n"
+                  "(define main (countdown 5))\n")
+
+        instructions = self.generate(source, tailCalls = True)
+        countdown = instructions[:instructions.index(Instruction(label = "factorial"))]
+
+        # The recursive call in tail position no longer pushes a return
+        # address, the one inside the multiply still has to.
+        self.assertIn( Instruction("jmp", "countdown"), countdown)
+        self.assertNotIn( Instruction("jsr", "countdown"), countdown)
+        self.assertIn( Instruction("jsr", "factorial"), instructions)
+        self.assertNotIn( Instruction("jmp", "factorial"), instructions)
+
+        # Calls outside a lambda are not in tail position.
+        self.assertEqual( instructions[-1], Instruction("jsr", "countdown"))
+
+        # Without the option every call pushes a return address.
+        self.assertNotIn( Instruction("jmp", "countdown"), self.generate(source))
+
+    def test_tail_calls_in_else(self):
+        source = ("(define loop\n"
+                  "  (lambda\n"
+                  "  (if (= dup 0) (done) (step) (loop))))\n")
+
+        instructions = self.generate(source, tailCalls = True)
+        self.assertIn( Instruction("jmp", "done"), instructions)
+        self.assertIn( Instruction("jsr", "step"), instructions)
+        self.assertIn( Instruction("jmp", "loop"), instructions)
+
+    def test_strength_reduction(self):
+        source = ("(define a (* dup 8))\n"
+                  "(define b (* 10 x))\n"
+                  "(define c (* dup 7))\n"
+                  "(define d (* (f) 0))\n"
+                  "(define e (/ dup 4))\n"
+                  "(define f (/ dup 3))\n"
+                  "(define g (* dup 1))\n"
+                  "(define h (* 2 dup))\n")
+
+        self.assertEqual( self.generateDefines(source, strengthReduction = True), {
+                "a" : ["`dup", "`shl16", "`shl16", "`shl16"],
+                "b" : ["`pushv x", "`dup", "`shl16", "`shl16", "jsr add16", "`shl16"],
+                "c" : ["`dup", "`pushi 7", "jsr mul16"],
+                "d" : ["jsr f", "`drop", "`pushi 0"],
+                "e" : ["`dup", "`shr16", "`shr16"],
+                "f" : ["`dup", "`pushi 3", "jsr div16"],
+                "g" : ["`dup"],
+                # The literal is pushed before dup runs, so it isn't left out.
+                "h" : ["`pushi 2", "`dup", "jsr mul16"] })
+
+        # Without the option the generic routines are called.
+        defines = self.generateDefines(source)
+        self.assertEqual( defines["a"], ["`dup", "`pushi 8", "jsr mul16"])
+        self.assertEqual( defines["e"], ["`dup", "`pushi 4", "jsr div16"])
+
+        # When optimizing for size only the shifts that are smaller than
+        # pushing the constant and calling the routine are used.
+        defines = self.generateDefines("(define a (* dup 8))\n"
+                                       "(define b (* dup 16))\n"
+                                       "(define c (* dup 10))\n"
+                                       "(define d (* (f) 0))\n"
+                                       "(define e (/ dup 16))\n",
+                                       strengthReduction = True, optimizeSize = True)
+        self.assertEqual( defines, {
+                "a" : ["`dup", "`shl16", "`shl16", "`shl16"],
+                "b" : ["`dup", "`pushi 16", "jsr mul16"],
+                "c" : ["`dup", "`pushi 10", "jsr mul16"],
+                "d" : ["jsr f", "`drop", "`pushi 0"],
+                "e" : ["`dup", "`pushi 16", "jsr div16"] })
+
+    def test_cache_tos(self):
+        source = ("(define a (f (- dup 2)))\n"
+                  "(define b (- 10 (g)))\n"
+                  "(define c (* dup 3))\n"
+                  "(define d (- (- x 1) y))\n"
+                  "(define e (if (= dup 0) 1 2))\n")
+
+        # Operands are applied to tos and it is only spilled before calls.
+        self.assertEqual( self.generateDefines(source, cacheTos = True), {
+                "a" : ["`peek", "`sub16i 2", "`spill", "jsr f"],
+                "b" : ["`pushi 10", "jsr g", "jsr sub16"],
+                "c" : ["`peek", "`spill", "`loadi 3", "jsr mul16t", "`spill"],
+                "d" : ["`loadv x", "`sub16i 1", "`sub16v y", "`spill"],
+                "e" : ["`peek", "`cmp16i 0", "bne _else", "`pushi 1", "bra _endif"],
+                "_else" : ["`pushi 2"],
+                "_endif" : [] })
+
+    def test_string_pool(self):
+        source = ("(define a (lambda (display \"Hello World!\")))\n"
+                  "(define b (lambda (display \"World!\") (display \"Hello World!\")))\n"
+                  "(define c (lambda (display \"Bye\") (display \"!\")))\n")
+
+        # Each string is stored once, and one that ends another points
+        # into it.
+        hello = "ref_" + stringDigest("Hello World!")
+        instructions = self.generate(source)
+        self.assertEqual( instructions[:4], [
+                Instruction(".byte", "\"Hello World!\",0", hello),
+                Instruction(".byte", "\"Bye\",0", "ref_" + stringDigest("Bye")),
+                Instruction(".alias", "ref_{} {}+6".format(stringDigest("World!"), hello)),
+                Instruction(".alias", "ref_{} {}+11".format(stringDigest("!"), hello))])
+        self.assertEqual( instructions.count(Instruction("`pushi", hello)), 2)
+
+        # The listing is the same every time.
+        self.assertEqual( self.generate(source), instructions)
+
+    def test_in_memory(self):
+        source = ("(define data1 (words '(1 2 3)))\n"
+                  "(define main (lambda (display \"Hi\") (* 2 data1)))\n")
+
+        # The records are generated directly, and written and parsed back
+        # they are unchanged.
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        instructions = CodeGenerator(parser.astRoot).generate()
+        self.assertEqual( instructions, self.generate(source))
+        self.assertIn( Instruction(".word", "1, 2, 3"), instructions)
+
+        # Compiling text needs no files at all.
+        self.assertEqual( parseListing(compileSource(source, ["-O0"])), instructions)
+
+    def generateDefines(self, source, **options):
+        """
+        Returns the instructions emitted for each define as text.
+        """
+        defines = {}
+        for instruction in self.generate(source, **options):
+            if instruction.label != None:
+                name = instruction.label
+                defines[name] = []
+            elif instruction.isInstruction():
+                text = str(instruction).strip()
+                defines[name].append(text)
+        return defines
+
+    def generate(self, source, **options):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+
+        with tempfile.TemporaryDirectory() as directory:
+            outputName = os.path.join(directory, "output.asm")
+            CodeGenerator(parser.astRoot, **options).process(outputName)
+            with open(outputName) as outputFile:
+                return parseListing(outputFile.read())
+
+if __name__ == '__main__':
+    unittest.main()
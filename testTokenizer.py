@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from tokenizer import Token, Tokenizer
 
@@ -158,5 +160,60 @@ class TestTokenizer(unittest.TestCase):
             self.assertEqual( tokenList[idx], master[idx])
             idx = idx + 1
 
+    def test_long_line(self):
+        tokenizer = Tokenizer(";", ["bytes", "define"], ["="], "()'")
+
+        values = [str(value % 256) for value in range(10000)]
+        source = "(define table (bytes '(" + " ".join(values) + ")))\n"
+        tokenizer.tokenizeLine(source)
+        tokenList = tokenizer.tokenList
+        self.assertEqual( len(tokenList), len(values) + 10)
+
+        literals = [token.value for token in tokenList if token.type == Token.LITERAL]
+        self.assertEqual( literals, values)
+
+    def test_split_lines(self):
+        source = ("; a comment.\n(define hello\n  (display \"Hello\nWorld!\"))\n"
+                  "(define main (factorial 5))\n")
+
+        whole = Tokenizer(";", ["define", "display"], ["="], "()'")
+        whole.tokenizeLine(source)
+
+        # Tokens left open at the end of a line are completed by the next.
+        pieces = Tokenizer(";", ["define", "display"], ["="], "()'")
+        for line in source.splitlines(True):
+            pieces.tokenizeLine(line)
+
+        self.assertEqual( len(pieces.tokenList), len(whole.tokenList))
+        idx = 0
+        while idx < len(whole.tokenList):
+            self.assertEqual( pieces.tokenList[idx], whole.tokenList[idx])
+            idx = idx + 1
+        self.assertEqual( whole.tokenList[6], Token(type=Token.STRING, value='Hello\nWorld!'))
+
+    def test_iter_tokens(self):
+        source = ("; a comment.\n(define hello\n  (display \"Hello World!\"))\n"
+                  "(define main (factorial 5))\n")
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "source.scm")
+            with open(filename, "w") as sourcefile:
+                sourcefile.write(source)
+
+            tokenizer = Tokenizer(";", ["define", "display"], ["="], "()'")
+            tokenizer.tokenizeFile(filename)
+            master = tokenizer.tokenList
+
+            # Small chunks force tokens to span chunk boundaries.
+            for chunkSize in range(1, 12):
+                tokenizer = Tokenizer(";", ["define", "display"], ["="], "()'")
+                tokenList = list(tokenizer.iterTokens(filename, chunkSize))
+                self.assertEqual( tokenizer.tokenList, [])
+                self.assertEqual( len(tokenList), len(master))
+                idx = 0
+                while idx < len(tokenList):
+                    self.assertEqual( tokenList[idx], master[idx])
+                    idx = idx + 1
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+import contextlib
+import io
+import unittest
+from schemeparser import SchemeParser
+from symboltable import SymbolTable
+from tinylisp import compileSource, parseArguments
+from tokenizer import Tokenizer
+from zeropage import ZeroPageAllocator
+
+class TestZeroPage(unittest.TestCase):
+
+    def test_allocate(self):
+        root = self.parse("(define table (words '(1 2 3)))\n"
+                          "(define count (words '(7)))\n"
+                          "(define flag (bytes '(3)))\n"
+                          "(define limit (words '(9)))\n"
+                          "(define unused (words '(0)))\n"
+                          "(define step (lambda (- count limit)))\n"
+                          "(define main (* (- count flag) (step)))\n")
+
+        # The most referenced scalars are placed first, and the ones
+        # that don't fit or are never referenced are left alone.
+        allocator = ZeroPageAllocator(0x80, 3)
+        self.assertEqual( allocator.allocate(root), {"count" : (0x80, 2, "7"),
+                                                     "flag" : (0x82, 1, "3")})
+        self.assertEqual( allocator.references, {"count" : 2, "flag" : 1,
+                                                 "limit" : 1, "unused" : 0})
+        self.assertEqual( allocator.left, 0)
+        self.assertEqual( allocator.report().splitlines(), [
+                "zero page: 3 of 3 bytes used at $80, 0 left",
+                "    count                   $80   2 bytes     2 references",
+                "    flag                    $82   1 bytes     1 references",
+                "    limit                   not promoted     1 references",
+                "    unused                  not promoted     0 references"])
+
+    def test_references(self):
+        # Calls and the name being defined are not accesses, addresses
+        # in quoted lists are.
+        root = self.parse("(define count (words '(7)))\n"
+                          "(define pointers (words '(count count)))\n"
+                          "(define main (count))\n")
+
+        allocator = ZeroPageAllocator()
+        allocator.allocate(root)
+        self.assertEqual( allocator.references, {"count" : 2})
+
+    def test_alias(self):
+        # An access through an alias is an access to the scalar.
+        root = self.parse("(define count (words '(7)))\n"
+                          "(define total count)\n"
+                          "(define main (- total 1) (- count 1))\n")
+
+        allocator = ZeroPageAllocator()
+        allocator.allocate(root)
+        self.assertEqual( allocator.references, {"count" : 3})
+
+    def test_library(self):
+        # Without a main nothing would store the initial values.
+        root = self.parse("(define x (words '(5)))\n"
+                          "(define f (lambda (- x 1)))\n")
+        allocator = ZeroPageAllocator(0x80, 4)
+        self.assertEqual( allocator.allocate(root), {})
+        self.assertEqual( allocator.references, {"x" : 1})
+        self.assertIn( "no main to store the initial values", allocator.report())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            listing = compileSource("(define x (words '(5)))\n(define f (lambda (- x 1)))\n",
+                                    ["-O0", "--zp-window", "0x80:4"])
+        self.assertIn( "\t.word 5\n", listing)
+        self.assertNotIn( ".alias", listing)
+
+    def test_window(self):
+        with self.assertRaises(Exception):
+            ZeroPageAllocator(0xF0, 32)
+
+        # The window could overlap the tos pair of the cached top of stack.
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            parseArguments(["a.scm", "--cache-tos", "--zp-window", "0x80:32"])
+
+    def parse(self, source):
+        tokenizer = Tokenizer(SchemeParser.COMMENT, SchemeParser.KEYWORDS,
+                              SchemeParser.OPERATORS, SchemeParser.SEPARATORS)
+        tokenizer.tokenizeLine(source)
+        parser = SchemeParser()
+        parser.parse(tokenizer.tokenList)
+        SymbolTable().resolve(parser.astRoot)
+        return parser.astRoot
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,61 @@
 from pathlib import Path
-from schemeparser import SchemeParser, AbstractSyntaxTree
+from assembly import Instruction, formatListing, writeListing
+from branches import BranchLayout
+from buildcache import BuildCache
+from constantfolder import ConstantFolder
+from deadcode import DeadCodeEliminator
+from filetable import FileTable, fileStamps, isFileTable
+from inliner import Inliner
+from instrumentation import Instrumentation, phase
+from partialeval import PartialEvaluator
+from peephole import PeepholeOptimizer
+from profiler import Profiler
+from schemeparser import SchemeParser, AbstractSyntaxTree, stringDigest
+from simulator import Simulator
+from symboltable import Symbol, SymbolTable
 from tokenizer import Token, Tokenizer
+from zeropage import ZeroPageAllocator
+import argparse
+import os
 import sys
 
 class CodeGenerator:
-    def __init__(self, astRoot):
+    # The operand suffix of the cached variants of the push macros, and the
+    # routines that have an inline variant taking such an operand.
+    OPERANDS = {"`pushi" : "i", "`pushv" : "v"}
+    INLINE = {"add16" : "add16", "equals16" : "cmp16", "sub16" : "sub16"}
+
+    def __init__(self, astRoot, optimizer = None, tailCalls = False,
+                 strengthReduction = False, cacheTos = False, zeroPage = None,
+                 cache = None, branches = None, directory = "", incbin = False,
+                 optimizeSize = False):
+        """
+        Initializer that sets up the code generator.
+
+        Arguments:
+        astRoot -- the root of the abstract syntax tree.
+        optimizer -- an optional peephole optimizer for the listing.
+        tailCalls -- emit a jmp rather than a jsr for calls in tail
+        position of a lambda, so they don't grow the return stack.
+        strengthReduction -- emit shifts and adds rather than a call to
+        mul16 or div16 when an operand is a suitable constant.
+        cacheTos -- keep the top of the data stack in the zero page pair
+        tos and only spill it to the data stack at calls and branches.
+        zeroPage -- a dictionary of the defines placed in the zero page to
+        their (address, width, value), as returned by ZeroPageAllocator.
+        cache -- an optional BuildCache of the code for each top level form.
+        branches -- an optional BranchLayout that threads the jumps of
+        each form and sizes its branches.
+        directory -- the directory the paths of table files are in.
+        incbin -- emit an .incbin for a table file that holds exactly the
+        bytes of the table.
+        optimizeSize -- only strength reduce when the shifts take no more
+        bytes than the call they replace.
+        """
         self.astDispatch = {
             AbstractSyntaxTree.DEFINE : self.processDefine,
             AbstractSyntaxTree.DISPLAY : self.processDisplay,
+            AbstractSyntaxTree.DIVIDE : self.processDivide,
             AbstractSyntaxTree.DUP : self.processDup,
             AbstractSyntaxTree.EQUALS : self.processEquals,
             AbstractSyntaxTree.IDENTIFIER : self.processIdentifier,
@@ -24,11 +72,95 @@ class CodeGenerator:
             AbstractSyntaxTree.WORDS : self.processWords
         }
         self.astRoot = astRoot
+        self.optimizer = optimizer
+        self.tailCalls = tailCalls
+        self.strengthReduction = strengthReduction
+        self.cacheTos = cacheTos
+        self.cached = False
+        self.pending = None
+        self.zeroPage = zeroPage or {}
+        self.cache = cache
+        self.branches = branches
+        self.directory = directory
+        self.incbin = incbin
+        self.optimizeSize = optimizeSize
+        # The bytes of the macros, from their reference implementations.
+        self.sizes = {opcode : entry[1] for opcode, entry in Simulator().instructions.items()}
+        self.tailCallNodes = set()
 
     def process(self, outputName):
-        with open(outputName, "w") as self.of:
-            # Recursively process the arguments.
-            self.processCdr(self.astRoot, None, 0, 0)
+        instructions = self.generate()
+        with open(outputName, "w") as outputFile:
+            writeListing(instructions, outputFile)
+
+    def generate(self):
+        """
+        Returns the instruction records of the whole program, which is how
+        a caller gets the code without writing a file.
+        """
+        instructions = []
+        for idx, node in enumerate(self.astRoot.children):
+            instructions.extend(self.processForm(node, idx))
+        return instructions
+
+    def processForm(self, node, idx):
+        """
+        Returns the instructions of a top level form, which are taken from
+        the cache when it has them.
+
+        Arguments:
+        node -- the form.
+        idx -- its index in the root of the tree.
+        """
+        key = None
+        if self.cache != None:
+            key = self.cache.key(node, self.cacheContext() + self.formContext(node))
+            instructions = self.cache.get(key)
+            if instructions != None:
+                return instructions
+
+        # The code is appended to this list as it is generated.
+        self.instructions = []
+        self.processCar(self.astRoot, node, 0, idx)
+        self.flush()
+        instructions = self.instructions
+
+        # Rewrite the listing before it reaches the file. No rule matches
+        # across forms since each one starts with a label or directive.
+        if self.optimizer != None:
+            instructions = self.optimizer.optimize(instructions)
+        if self.branches != None:
+            instructions = self.branches.layout(instructions)
+
+        if key != None:
+            self.cache.put(key, instructions)
+        return instructions
+
+    def cacheContext(self):
+        # Everything besides the form that changes the code generated.
+        branches = None
+        if self.branches != None:
+            branches = (self.branches.cpu, self.branches.threadJumps)
+        return repr((self.optimizer != None, self.tailCalls, self.strengthReduction,
+                     self.cacheTos, sorted(self.zeroPage.items()), branches, self.incbin,
+                     self.optimizeSize))
+
+    def formContext(self, node):
+        """
+        Returns what the code of a form depends on besides its tree: the
+        contents of the table files it reads, and the kind of each name it
+        refers to, since a name that is redefined changes what is emitted.
+        """
+        symbols = set()
+        self.collectSymbols(node, symbols)
+        return repr((fileStamps(node, self.directory), sorted(symbols)))
+
+    def collectSymbols(self, node, symbols):
+        for child in node.children:
+            if child.symbol != None:
+                target = child.symbol.target
+                symbols.add((child.value, child.symbol.kind, target.name if target != None else None))
+            self.collectSymbols(child, symbols)
 
     # process the first item of a list.
     def processCar(self, parent, node, level, idx):
@@ -51,7 +183,23 @@ class CodeGenerator:
         if parent.children[idx].type != AbstractSyntaxTree.IDENTIFIER:
             raise Exception('Define requires identifier')
 
-        self.of.write(parent.children[idx].value + ":\n")
+        self.flush()
+        name = parent.children[idx].value
+        if name in self.zeroPage:
+            # The data is stored by main rather than assembled in place.
+            self.emit(".alias", "{} ${:02X}".format(name, self.zeroPage[name][0]))
+            return len(parent.children)
+
+        symbol = parent.children[idx].symbol
+        if symbol != None and symbol.kind == Symbol.ALIAS:
+            # Another name for the same address, it takes no space.
+            self.emit(".alias", "{} {}".format(name, symbol.target.name))
+            return len(parent.children)
+
+        self.emitLabel(name)
+        if name == "main":
+            for symbol, (address, width, value) in self.zeroPage.items():
+                self.emit("`init" + ("b" if width == 1 else "w"), "{}, {}".format(symbol, value))
         return idx + 1
 
     def processDisplay(self, parent, node, level, idx):
@@ -59,33 +207,63 @@ class CodeGenerator:
         idx = idx + 1
 
         if parent.children[idx].type == AbstractSyntaxTree.LITERAL:
-            self.of.write("\t`print {}\n".format(parent.children[idx].value))
+            self.emit("`print", parent.children[idx].value)
         elif parent.children[idx].type == AbstractSyntaxTree.REFERENCE:
-            self.of.write("\t`pushi ref_{}\n".format(parent.children[idx].value))
-            self.of.write("\tjsr println\n")
+            self.emitPush("`pushi", "ref_{}".format(parent.children[idx].value))
+            self.flush()
+            self.emit("jsr", "println")
         else:
             raise Exception('Display requires lieral or identifier')
         return idx + 1
 
+    def processDivide(self, parent, node, level, idx):
+        idx = idx + 1
+
+        # Check to see if arguments are missing.
+        if len(parent.children) < 3:
+            raise Exception('Division requires two arguments.')
+
+        # Unsigned division by a power of two is a right shift.
+        divisor = self.constantOperand(parent.children[2])
+        if (len(parent.children) == 3 and divisor != None and divisor != 0 and
+            divisor & (divisor - 1) == 0 and self.isSmallEnough(self.shiftsSize(divisor))):
+            self.processCar(parent, parent.children[1], level, idx)
+            for shift in range(divisor.bit_length() - 1):
+                self.emitShift("`shr16")
+            return len(parent.children)
+
+        # process the arguments which leave result on data stack.
+        idx = self.processCdr(parent, node, level, idx)
+
+        self.emitRoutine("div16")
+        return idx
+
     def processDup(self, parent, node, level, idx):
         print("dup")
-        self.of.write("\t`dup\n")
+        self.emitDup()
         return idx + 1
 
     def processEquals(self, parent, node, level, idx):
         # Recursively process the arguments.
         idx = self.processCdr(parent, node, level, idx + 1)
 
-        self.of.write("\tjsr equals16\n".format(node.value))
+        self.emitRoutine("equals16")
         return idx
 
     def processIdentifier(self, parent, node, level, idx):
         if idx == 0:
+            if node.symbol != None and node.symbol.kind == Symbol.DATA:
+                raise Exception("'{}' is data and can't be called".format(node.value))
             # Recursively process the arguments.
             idx = self.processCdr(parent, node, level, idx + 1)
-            self.of.write("\tjsr {}\n".format(node.value))
+            self.flush()
+            if parent in self.tailCallNodes:
+                # The callee's rts returns directly to our caller.
+                self.emit("jmp", node.value)
+            else:
+                self.emit("jsr", node.value)
         else:
-            self.of.write("\t`pushv {}\n".format(node.value))
+            self.emitPush("`pushv", node.value)
             idx = idx + 1
         return idx
 
@@ -94,21 +272,26 @@ class CodeGenerator:
 
         # Recursively process the test expression.
         idx = self.processCar(parent, parent.children[idx], level + 1, idx)
-        self.of.write(".scope\n")
+        self.flush()
+        self.emit(".scope")
 
         # Generate a branch to the else on false.
-        self.of.write("\tbne _else\n")
+        self.emit("bne", "_else")
 
         idx = self.processCar(parent, parent.children[idx], level + 1, idx)
+        self.flush()
         # Generate the branch to endif
-        self.of.write("\tbra _endif\n_else:\n")
+        self.emit("bra", "_endif")
+        self.emitLabel("_else")
 
         # Generate the else code
         idx = self.processCdr(parent, parent.children[idx], level + 1, idx)
+        self.flush()
 
         # Generate the label for the endif branch.
-        self.of.write("_endif:\n")
-        self.of.write(".scend\n\n")
+        self.emitLabel("_endif")
+        self.emit(".scend")
+        self.emitBlank()
         return idx
 
     def processLambda(self, parent, node, level, idx):
@@ -122,18 +305,47 @@ class CodeGenerator:
             # ignore arguments for now.
             idx = idx + 1
 
-        self.of.write(".scope\n")
+        if self.tailCalls:
+            self.markTailCalls(parent.children[-1])
+
+        self.emit(".scope")
 
         # Recursively process the body.
         idx = self.processCdr(parent, node, level, idx)
+        self.flush()
 
         # A function has a return operation.
-        self.of.write("\trts\n")
-        self.of.write(".scend\n\n")
+        self.emit("rts")
+        self.emit(".scend")
+        self.emitBlank()
         return idx
 
+    def markTailCalls(self, node):
+        """
+        Records the calls in tail position of an expression. Nothing runs
+        after such a call except the return, so it can be a jump.
+
+        Arguments:
+        node -- the last expression of a lambda body.
+        """
+        while (node.type == AbstractSyntaxTree.SEXPR and not node.quoted and
+               len(node.children) > 0):
+            first = node.children[0]
+            if first.type == AbstractSyntaxTree.IDENTIFIER:
+                self.tailCallNodes.add(node)
+                return
+            if first.type != AbstractSyntaxTree.IF or len(node.children) < 3:
+                return
+
+            # Both branches of an if are in tail position, the else branch
+            # ends with the last child.
+            self.markTailCalls(node.children[2])
+            if len(node.children) < 4:
+                return
+            node = node.children[-1]
+
     def processLiteral(self, parent, node, level, idx):
-        self.of.write("\t`pushi {}\n".format(parent.children[idx].value))
+        self.emitPush("`pushi", parent.children[idx].value)
         return idx + 1
 
     def processMultiply(self, parent, node, level, idx):
@@ -143,13 +355,188 @@ class CodeGenerator:
         if len(parent.children) < 3:
             raise Exception('Multiplication requires two arguments.')
 
+        if len(parent.children) == 3:
+            for constantIdx, otherIdx in ((2, 1), (1, 2)):
+                constant = self.constantOperand(parent.children[constantIdx])
+                # A left literal is pushed before the other operand runs,
+                # so it can only be left out when that doesn't read the stack.
+                if constantIdx == 1 and self.readsStack(parent.children[otherIdx]):
+                    continue
+                if constant != None and self.canMultiplyByShifts(constant):
+                    self.processCar(parent, parent.children[otherIdx], level, otherIdx)
+                    self.multiplyByShifts(constant)
+                    return len(parent.children)
+
         # process the arguments which leave result on data stack.
         idx = self.processCdr(parent, node, level, idx)
 
         # Now perform process the argumentsA function has a return operation.
-        self.of.write("\tjsr mul16\n")
+        self.emitRoutine("mul16")
         return idx
 
+    def constantOperand(self, node):
+        """
+        Returns the value of a literal operand if strength reduction is
+        enabled, otherwise None.
+        """
+        if (not self.strengthReduction or node.type != AbstractSyntaxTree.LITERAL or
+            node.quoted):
+            return None
+        try:
+            return int(node.value) & 0xFFFF
+        except ValueError:
+            return None
+
+    def readsStack(self, node):
+        """
+        Returns False when the code of an operand only pushes values and
+        never looks at what was already on the data stack, True when it
+        might.
+        """
+        if node.type in (AbstractSyntaxTree.LITERAL, AbstractSyntaxTree.IDENTIFIER):
+            return False
+        if (node.type == AbstractSyntaxTree.SEXPR and not node.quoted and len(node.children) == 3 and
+            node.children[0].type in (AbstractSyntaxTree.SUB, AbstractSyntaxTree.MULTIPLY,
+                                      AbstractSyntaxTree.DIVIDE)):
+            return self.readsStack(node.children[1]) or self.readsStack(node.children[2])
+        return True
+
+    def canMultiplyByShifts(self, constant):
+        # At most two bits set is at most one add, anything else is left
+        # to mul16.
+        if bin(constant).count("1") > 2:
+            return False
+        if constant == 0:
+            return self.isSmallEnough(self.sizes["`drop"] + self.sizes["`pushi"])
+        size = self.shiftsSize(constant)
+        if bin(constant).count("1") == 2:
+            size = size + self.sizes["`dup"] + self.sizes["jsr"]
+        return self.isSmallEnough(size)
+
+    def shiftsSize(self, constant):
+        # The bytes of the shifts by the highest bit of a constant.
+        return (constant.bit_length() - 1) * self.sizes["`shl16"]
+
+    def isSmallEnough(self, size):
+        """
+        Returns True when code of a size may replace pushing a constant and
+        calling mul16 or div16, which is always when optimizing for speed.
+        """
+        return not self.optimizeSize or size <= self.sizes["`pushi"] + self.sizes["jsr"]
+
+    def multiplyByShifts(self, constant):
+        """
+        Multiplies the top of the data stack by a constant with at most
+        two bits set. Each shift is an ASL/ROL pair rather than a pass
+        through the mul16 loop.
+        """
+        if constant == 0:
+            self.emitDrop()
+            self.emitPush("`pushi", "0")
+            return
+
+        low = (constant & -constant).bit_length() - 1
+        high = constant.bit_length() - 1
+        if high != low:
+            # x * (2^high + 2^low) = (x * 2^(high - low) + x) * 2^low
+            self.emitDup()
+            for shift in range(high - low):
+                self.emitShift("`shl16")
+            self.emitRoutine("add16")
+        for shift in range(low):
+            self.emitShift("`shl16")
+
+    def emit(self, opcode, operand = None, label = None):
+        self.instructions.append(Instruction(opcode, operand, label))
+
+    def emitLabel(self, label):
+        self.instructions.append(Instruction(label = label))
+
+    def emitBlank(self):
+        self.instructions.append(Instruction())
+
+    """
+    The following methods emit the data stack operations. When the top of
+    stack is cached a pushed literal or variable is held back as pending,
+    so the operation that consumes it can use it as an operand, and the
+    value below it lives in the zero page pair tos. The routines ending in
+    t take their left operand from the data stack and the right from tos,
+    and are only worth calling when tos is already loaded.
+    """
+    def emitPush(self, macro, operand):
+        if not self.cacheTos:
+            self.emit(macro, operand)
+            return
+        self.loadPending()
+        self.pending = (macro, operand)
+
+    def emitDup(self):
+        if not self.cacheTos:
+            self.emit("`dup")
+            return
+        self.loadPending()
+        # Spilling a cached value leaves a copy in tos, otherwise the top
+        # of the data stack is copied into tos.
+        if self.cached:
+            self.emit("`spill")
+        else:
+            self.emit("`peek")
+        self.cached = True
+
+    def emitDrop(self):
+        if self.pending != None:
+            self.pending = None
+        elif self.cached:
+            self.cached = False
+        else:
+            self.emit("`drop")
+
+    def emitShift(self, macro):
+        self.loadPending()
+        if self.cached:
+            self.emit(macro + "t")
+        else:
+            self.emit(macro)
+
+    def emitRoutine(self, routine):
+        if self.pending != None and routine in CodeGenerator.INLINE:
+            # The right operand is applied directly to tos.
+            macro, operand = self.pending
+            self.pending = None
+            if not self.cached:
+                self.emit("`fill")
+            self.emit("`" + CodeGenerator.INLINE[routine] + CodeGenerator.OPERANDS[macro], operand)
+        elif self.cached or self.pending != None:
+            self.loadPending()
+            self.emit("jsr", routine + "t")
+        else:
+            # Both operands are on the data stack.
+            self.emit("jsr", routine)
+            return
+        # Comparisons leave their result in the flags.
+        self.cached = routine != "equals16"
+
+    def loadPending(self):
+        if self.pending != None:
+            macro, operand = self.pending
+            self.pending = None
+            if self.cached:
+                self.emit("`spill")
+            self.emit("`load" + CodeGenerator.OPERANDS[macro], operand)
+            self.cached = True
+
+    def flush(self):
+        """
+        Writes a cached top of stack and a pending value to the data stack
+        so it is complete, as callees and the code at branch targets expect.
+        """
+        if self.cached:
+            self.emit("`spill")
+            self.cached = False
+        if self.pending != None:
+            self.emit(*self.pending)
+            self.pending = None
+
     def processNode(self, parent, node, level, idx):
         print("    " * level + str(node))
         return idx + 1
@@ -170,9 +557,20 @@ class CodeGenerator:
         return idx + 1
 
     def processStrings(self, parent, node, level, idx):
-        for element in node.children:
-            self.of.write("ref_{}:\t.byte \"{}\",0\n".
-                          format(hash(element), element.value))
+        # A string that ends another one is an alias into it, since both
+        # share the terminating zero. The longest such string is stored.
+        values = sorted(set(element.value for element in node.children),
+                        key=lambda value: (-len(value), value))
+        aliases = []
+        for position, value in enumerate(values):
+            container = next((longer for longer in values[:position]
+                              if longer.endswith(value)), None)
+            if container == None:
+                self.emit(".byte", "\"{}\",0".format(value), "ref_" + stringDigest(value))
+            else:
+                aliases.append(Instruction(".alias", "ref_{} ref_{}+{}".format(stringDigest(value),
+                               stringDigest(container), len(container) - len(value))))
+        self.instructions.extend(aliases)
         return idx + 1
 
     def processSub(self, parent, node, level, idx):
@@ -186,52 +584,298 @@ class CodeGenerator:
         idx = self.processCdr(parent, node, level, idx)
 
         # Now perform process the argumentsA function has a return operation.
-        self.of.write("\tjsr sub16\n")
+        self.emitRoutine("sub16")
         return idx
 
     def processBytes(self, parent, node, level, idx):
         idx = idx + 1
         next = parent.children[idx]
+        if isFileTable(next):
+            self.emitFileTable(next, 1, ".byte")
+            return idx + 1
 
         # The next token's value should be a quoted sexpr.
         if next.type != AbstractSyntaxTree.SEXPR and next.quoted == False:
            raise Exception('Bytes requires a quoted sxpr.')
 
-        self.of.write("\t.byte ")
-        self. processQuotedList(parent, next, level, 0)
+        self.emit(".byte", self.quotedList(next))
         return idx + 1
 
     def processWords(self, parent, node, level, idx):
         idx = idx + 1
         next = parent.children[idx]
+        if isFileTable(next):
+            self.emitFileTable(next, 2, ".word")
+            return idx + 1
 
         # The next token's value should be a quoted sexpr.
         if next.type != AbstractSyntaxTree.SEXPR and next.quoted == False:
            raise Exception('Words requires a quoted sxpr.')
 
-        self.of.write("\t.word ")
-        self. processQuotedList(parent, next, level, 0)
+        self.emit(".word", self.quotedList(next))
         return idx + 1
 
-    def processQuotedList(self, parent, node, level, idx):
-        while idx < len(node.children):
-            self.of.write(node.children[idx].value)
-            idx = idx + 1
-            if idx < len(node.children):
-                self.of.write(", ")
-        self.of.write("\n")
-        return idx
-
-tokenizer = Tokenizer(SchemeParser.COMMENT,
-                      SchemeParser.KEYWORDS,
-                      SchemeParser.OPERATORS,
-                      SchemeParser.SEPARATORS)
-tokenizer.tokenizeFile(sys.argv[1])
-parser = SchemeParser()
-parser.parse(tokenizer.tokenList)
-
-try:
-    generator = CodeGenerator(parser.astRoot)
-    generator.process(Path(sys.argv[1]).stem + ".asm")
-except Exception as ex:
-    print(ex)
+    def emitFileTable(self, node, width, directive):
+        """
+        Emits the data directives of a table read from a file, a chunk of
+        values at a time, or an .incbin of the file.
+
+        Arguments:
+        node -- the S expression that starts with file.
+        width -- the bytes of each value, 1 or 2.
+        directive -- .byte or .word.
+        """
+        table = FileTable(node, width, self.directory)
+        if self.incbin and table.canInclude() and table.count() > 0:
+            # The path is made absolute, since the assembler, the branch
+            # layout and the simulator may each resolve a relative one
+            # from another directory.
+            self.emit(".incbin", "\"{}\"".format(os.path.abspath(table.path)))
+            return
+
+        count = len(self.instructions)
+        for operand in table.chunks():
+            self.emit(directive, operand)
+        if len(self.instructions) == count:
+            raise Exception("Table file '{}' has no values.".format(table.path))
+
+    def quotedList(self, node):
+        # The operand of a data directive.
+        return ", ".join(child.value for child in node.children)
+
+def parseArguments(argv):
+    """
+    Parses the command line into the options used by compileFile.
+
+    Arguments:
+    argv -- the command line arguments without the program name.
+    """
+    argParser = argparse.ArgumentParser(description="Tiny Scheme cross compiler.")
+    argParser.add_argument("source", help="the Scheme source file")
+    argParser.add_argument("-o", "--output", help="the assembler output file")
+    argParser.add_argument("-O", dest="optimize", choices=["0", "1", "2", "s"], default="1",
+                           help="the optimization level, 2 inlines for speed and s for size (default 1)")
+    argParser.add_argument("--symbols", action="store_true",
+                           help="print the defined symbols with their kind and size")
+    argParser.add_argument("--extern", action="append", default=[], metavar="NAME",
+                           help="a name defined by another module or in assembler, which may be used without a define")
+    argParser.add_argument("--inline-threshold", type=int, default=32,
+                           help="the largest estimated bytes of a lambda inlined by -O2 (default 32)")
+    argParser.add_argument("--inline-report", action="store_true",
+                           help="print the inlined calls and dropped lambdas")
+    argParser.add_argument("--cache-tos", action="store_true",
+                           help="keep the top of the data stack in the zero page pair tos")
+    argParser.add_argument("--eval-budget", type=int, default=10000,
+                           help="the most nodes run to evaluate a call with literal arguments (default 10000)")
+    argParser.add_argument("--eval-report", action="store_true",
+                           help="print the calls replaced by the values they compute")
+    argParser.add_argument("--keep", action="append", default=[], metavar="NAME",
+                           help="keep this define along with main when dropping unreachable code")
+    argParser.add_argument("--dce-report", action="store_true",
+                           help="print the unreachable defines and strings that were dropped")
+    argParser.add_argument("--zp-window", metavar="START[:SIZE]",
+                           help="place the most used scalar defines in this zero page window, e.g. 0x80:32")
+    argParser.add_argument("--cache", nargs="?", const=".tinycomp-cache", metavar="DIR",
+                           help="reuse the code of unchanged forms from this directory (default .tinycomp-cache)")
+    argParser.add_argument("--peephole-report", action="store_true",
+                           help="print the peephole rule hits and instruction counts")
+    argParser.add_argument("--cpu", choices=BranchLayout.CPUS, default="65c02",
+                           help="the processor, the nmos 6502 has no bra (default 65c02)")
+    argParser.add_argument("--branch-report", action="store_true",
+                           help="print the jumps threaded and the branches lengthened")
+    argParser.add_argument("--incbin", action="store_true",
+                           help="include a table file that needs no conversion with .incbin")
+    argParser.add_argument("--stats", action="store_true",
+                           help="print the time, memory and counts of each phase and write them as JSON")
+    argParser.add_argument("--simulate", action="store_true",
+                           help="run main in the simulator and print the cycle counts")
+    argParser.add_argument("--profile", action="store_true",
+                           help="print the bytes and cycles of each define and write them as JSON")
+    argParser.add_argument("--trace",
+                           help="take the profile cycles from an instruction trace file")
+    options = argParser.parse_args(argv)
+    if options.cache_tos and options.zp_window != None:
+        # The macro library places tos in the zero page, where the window
+        # would overlap it.
+        argParser.error("--zp-window can't be combined with --cache-tos, whose tos pair is in the zero page")
+    return options
+
+def createTokenizer():
+    return Tokenizer(SchemeParser.COMMENT,
+                     SchemeParser.KEYWORDS,
+                     SchemeParser.OPERATORS,
+                     SchemeParser.SEPARATORS)
+
+def generateCode(tokens, options, cache = None, stats = None):
+    """
+    Runs the compiler phases on a stream of tokens and returns the
+    instruction records of the program.
+
+    Arguments:
+    tokens -- an iterable of the tokens of the source.
+    options -- the options returned by parseArguments.
+    cache -- a BuildCache that outlives this call, otherwise one is
+    opened when the options ask for it.
+    stats -- an Instrumentation that records each phase, or None.
+    """
+    parser = SchemeParser()
+    # The paths of table files are relative to the source.
+    directory = os.path.dirname(options.source)
+    if stats != None:
+        # The tokens are read ahead of parsing so each is timed apart.
+        with stats.phase("tokenize"):
+            tokens = list(tokens)
+        stats.tokens = len(tokens)
+        stats.countDispatch(parser.tokenDispatch)
+    with phase(stats, "parse"):
+        parser.parseStream(tokens)
+    if stats != None:
+        stats.countNodes(parser.astRoot)
+    with phase(stats, "resolve"):
+        symbols = SymbolTable(directory, options.extern)
+        symbols.resolve(parser.astRoot)
+    if options.symbols:
+        print(symbols.report())
+
+    if options.optimize in ("2", "s"):
+        with phase(stats, "inline"):
+            inliner = Inliner(options.inline_threshold, optimizeSize = options.optimize == "s")
+            inliner.inline(parser.astRoot)
+        if options.inline_report:
+            print(inliner.report())
+
+    optimizer = None
+    if options.optimize != "0":
+        with phase(stats, "fold"):
+            ConstantFolder().fold(parser.astRoot)
+        with phase(stats, "evaluate"):
+            evaluator = PartialEvaluator(options.eval_budget, optimizeSize = options.optimize == "s")
+            if evaluator.evaluate(parser.astRoot) > 0:
+                # The values may be the operands of arithmetic that folds.
+                ConstantFolder().fold(parser.astRoot)
+        if options.eval_report:
+            print(evaluator.report())
+        with phase(stats, "deadcode"):
+            eliminator = DeadCodeEliminator(options.keep)
+            eliminator.eliminate(parser.astRoot)
+        if options.dce_report:
+            print(eliminator.report())
+        optimizer = PeepholeOptimizer()
+
+    zeroPage = None
+    if options.zp_window != None:
+        start, sep, size = options.zp_window.partition(":")
+        with phase(stats, "zeropage"):
+            allocator = ZeroPageAllocator(int(start, 0), int(size or "32", 0))
+            zeroPage = allocator.allocate(parser.astRoot)
+        print(allocator.report())
+
+    if cache == None and options.cache != None:
+        cache = BuildCache(options.cache)
+
+    # Branches are laid out at every level, since a branch that doesn't
+    # reach or a bra on an NMOS 6502 won't assemble.
+    branches = BranchLayout(options.cpu, threadJumps = options.optimize != "0")
+
+    generator = CodeGenerator(parser.astRoot, optimizer,
+                              tailCalls = options.optimize != "0",
+                              strengthReduction = options.optimize != "0",
+                              optimizeSize = options.optimize == "s",
+                              cacheTos = options.cache_tos,
+                              zeroPage = zeroPage,
+                              cache = cache,
+                              branches = branches,
+                              directory = directory,
+                              incbin = options.incbin)
+    if stats != None:
+        stats.countDispatch(generator.astDispatch)
+    # The peephole optimizer runs on each form as it is generated.
+    with phase(stats, "generate"):
+        instructions = generator.generate()
+    if stats != None:
+        stats.countListing(instructions)
+
+    if optimizer != None and options.peephole_report:
+        print(optimizer.report())
+    if options.branch_report:
+        print(branches.report())
+    return instructions
+
+def compileSource(source, argv = (), cache = None, stats = None):
+    """
+    Compiles Scheme source text in memory, for callers that embed the
+    compiler and don't want files.
+
+    Arguments:
+    source -- the Scheme source text.
+    argv -- the compiler options, as on the command line after the source.
+    cache -- a BuildCache shared between calls.
+    stats -- an Instrumentation that records the compile, or None.
+
+    Returns:
+    the assembler text.
+    """
+    options = parseArguments(["-"] + list(argv))
+    tokenizer = createTokenizer()
+    if stats != None:
+        stats.countDispatch(tokenizer.tokenDispatch)
+
+    def tokens():
+        # Tokenized when the tokens are first read, like a file.
+        tokenizer.tokenizeLine(source + "\n")
+        yield from tokenizer.tokenList
+    return formatListing(generateCode(tokens(), options, cache, stats))
+
+def compileFile(sourceName, outputName, options, cache = None, stats = None):
+    """
+    Runs the compiler phases on a source file and writes the assembler.
+
+    Arguments:
+    sourceName -- the name of the Scheme source file.
+    outputName -- the name of the assembler file to write.
+    options -- the options returned by parseArguments.
+    cache -- a BuildCache that outlives this call, otherwise one is
+    opened when the options ask for it.
+    stats -- an Instrumentation that records the compile, otherwise one
+    is made when the options ask for it.
+    """
+    if stats == None and options.stats:
+        stats = Instrumentation()
+    tokenizer = createTokenizer()
+    if stats != None:
+        stats.countDispatch(tokenizer.tokenDispatch)
+    instructions = generateCode(tokenizer.iterTokens(sourceName), options, cache, stats)
+    with phase(stats, "write"):
+        with open(outputName, "w") as outputFile:
+            writeListing(instructions, outputFile)
+    if options.stats:
+        print(stats.report())
+        stats.writeJson(str(Path(outputName).with_suffix(".stats.json")))
+
+    if options.simulate:
+        simulator = Simulator()
+        simulator.load(instructions)
+        simulator.run()
+        print("".join(simulator.output), end="")
+        print(simulator.report())
+
+    if options.profile:
+        simulator = Simulator()
+        simulator.load(instructions)
+        profiler = Profiler(simulator)
+        if options.trace != None:
+            profiler.readTrace(options.trace)
+        else:
+            profiler.simulate()
+        print(profiler.report())
+        profiler.writeJson(str(Path(outputName).with_suffix(".profile.json")))
+
+if __name__ == '__main__':
+    options = parseArguments(sys.argv[1:])
+    try:
+        compileFile(options.source,
+                    options.output or Path(options.source).stem + ".asm",
+                    options)
+    except Exception as ex:
+        print(ex, file=sys.stderr)
+        sys.exit(1)
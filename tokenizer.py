@@ -3,8 +3,13 @@ This module contains a simple tokenizer for use in the tiny compiler.
 This tokenizer performs demarcation and minimal classification of
 the a string of input characters from a file.
 """
+import re
+import sys
 
 class Token:
+    # Tokens are numerous, so they don't carry an instance dictionary.
+    __slots__ = ("type", "value")
+
     UNKNOWN = 0
     COMMENT = 1
     IDENTIFIER = 2
@@ -35,7 +40,15 @@ class Token:
     def appendChar(self, first):
         self.value = self.value + first
 
+    def appendText(self, text):
+        self.value = self.value + text
+
 class Tokenizer:
+    # Character classes used by the scanners. \w matches the same
+    # characters as str.isalnum() plus the underscore.
+    WORD = re.compile(r"\w*")
+    DIGITS = re.compile(r"[0-9]*")
+
     def __init__(self, comment, keywords, operators, separators):
         """
         Initializer that sets up the tokenizer for processing. It also
@@ -43,22 +56,23 @@ class Tokenizer:
 
         Arguments:
         comment -- the character(s) that indicate a comment line.
-        keywords -- a list of languages keywords for classifications.
+        keywords -- the languages keywords for classifications.
         operators -- the characters that are operators for classification.
         separators -- the characters that separate elements of syntax.
         """
 
         self.comment = comment
-        self.keywords = keywords
-        self.operators = operators
+        # Each identifier is looked up, so these are hashed sets.
+        self.keywords = frozenset(keywords)
+        self.operators = frozenset(operators)
         self.separators = separators
         self.tokenList = []
         self.tokenDispatch = {
-            Token.UNKNOWN : self.processUnknown,
-            Token.COMMENT : self.processComment,
-            Token.IDENTIFIER : self.processIdentifier,
-            Token.LITERAL : self.processLiteral,
-            Token.STRING : self.processString
+            Token.UNKNOWN : self.scanUnknown,
+            Token.COMMENT : self.scanComment,
+            Token.IDENTIFIER : self.scanIdentifier,
+            Token.LITERAL : self.scanLiteral,
+            Token.STRING : self.scanString
         }
         self.workToken = Token()
 
@@ -74,83 +88,152 @@ class Tokenizer:
             for line in sourcefile:
                 self.tokenizeLine(line)
 
+    def iterTokens(self, filename, chunkSize=65536):
+        """
+        Generator that opens a file by name and lazily yields its tokens.
+        The file is read in chunks and tokens may span chunk boundaries.
+        The tokens are not kept in the token list, so memory use does not
+        grow with the size of the file.
+
+        Arguments:
+        filename -- the name of the file.
+        chunkSize -- the number of characters to read at a time.
+        """
+        # Comment markers and two character operators are recognized by
+        # looking ahead, so that many characters are held back until the
+        # next chunk arrives.
+        lookahead = max(len(self.comment), 2) - 1
+        tokenList = self.tokenList
+        self.workToken = Token()
+        try:
+            with open(filename) as sourcefile:
+                text = ""
+                while True:
+                    chunk = sourcefile.read(chunkSize)
+                    text = text + chunk
+                    limit = len(text) - lookahead if chunk != "" else len(text)
+                    self.tokenList = []
+                    idx = self.scan(text, limit)
+                    yield from self.tokenList
+                    if chunk == "":
+                        return
+                    text = text[idx:]
+        finally:
+            self.tokenList = tokenList
+
     def tokenizeLine(self, line):
-        while line != "":
+        """
+        Tokenizes a string of characters. The line is walked by index
+        and each scanner consumes as many characters as it can, so the
+        cost is linear in the length of the line. A token that is still
+        open at the end of the line stays in the working token and is
+        completed by the next call.
+
+        Arguments:
+        line -- the characters to tokenize.
+        """
+        self.scan(line, len(line))
+
+    def scan(self, text, limit):
+        """
+        Runs the scanners over text until the limit is reached.
+
+        Arguments:
+        text -- the characters to tokenize.
+        limit -- no new token is started at or after this index.
+
+        Returns:
+        the index of the first character that was not scanned.
+        """
+        idx = 0
+        end = len(text)
+        while idx < limit:
             dispatch = self.tokenDispatch.get(self.workToken.type)
-            line = dispatch(line[:1], line[1:], line)
+            idx = dispatch(text, idx, end)
+        return idx
 
     """
-    The following methods are dispatchers that all have the same
+    The following methods are scanners that all have the same
     argument signature. This allows calling them via a dispatch
     table based upon the type of token identified.
     """
-    def processUnknown(self, first, rest, line):
+    def scanUnknown(self, line, idx, end):
         """
         Default state for the tokenizer. If it identifies the token type
-        it will transition to that state which results in that dispatcher
-        getting called.
+        it will transition to that state and scan the rest of the token.
 
         Arguments:
-        first -- the first character in the line.
-        rest -- the rest of the chacters in the line.
-        line -- the entire line to parse.
+        line -- the entire line to scan.
+        idx -- the index of the first character to scan.
+        end -- the index just past the last character to scan.
 
         Returns:
-        the characters that were not consumed by the processor.
+        the index of the first character not consumed by the scanner.
         """
-        if line.startswith(self.comment):
+        first = line[idx]
+        if line.startswith(self.comment, idx):
             self.workToken.type = Token.COMMENT
-            rest = line[len(self.comment):]
+            return self.scanComment(line, idx + len(self.comment), end)
         elif first.isalpha() or first == "_":
             self.workToken.type = Token.IDENTIFIER
-            self.workToken.appendChar(first)
+            return self.scanIdentifier(line, idx, end)
         elif first.isnumeric():
             self.workToken.type = Token.LITERAL
-            self.workToken.appendChar(first)
+            return self.scanLiteral(line, idx, end)
         elif first in self.separators:
             self.appendToken(Token.SEPARATOR, first)
         elif first in self.operators:
             # check for C style two character operators (e.g. ++, --, ==, etc)
-            if first + rest[:1] in self.operators:
-                first = first + rest[:1]
-                rest = rest[1:]
+            pair = line[idx:idx + 2]
+            if len(pair) == 2 and pair in self.operators:
+                first = pair
             self.appendToken(Token.OPERATOR, first)
+            return idx + len(first)
         elif first == "\"":
             self.workToken.type = Token.STRING
-        return rest
-
-    def processComment(self, first, rest, line):
-        if first == "\n":
-            self.appendToken(Token.COMMENT, self.workToken.value)
-        else:
-            self.workToken.appendChar(first)
-        return rest
-
-    def processIdentifier(self, first, rest, line):
-        if first.isalnum() or first == "_":
-            self.workToken.appendChar(first)
-            return rest
-        elif not first.isalpha():
+            return self.scanString(line, idx + 1, end)
+        return idx + 1
+
+    def scanComment(self, line, idx, end):
+        stop = line.find("\n", idx, end)
+        if stop < 0:
+            self.workToken.appendText(line[idx:end])
+            return end
+        self.workToken.appendText(line[idx:stop])
+        self.appendToken(Token.COMMENT, self.workToken.value)
+        return stop + 1
+
+    def scanIdentifier(self, line, idx, end):
+        stop = Tokenizer.WORD.match(line, idx, end).end()
+        self.workToken.appendText(line[idx:stop])
+        if stop < end:
             if self.workToken.value in self.keywords:
                 self.appendToken(Token.KEYWORD, self.workToken.value)
             else:
-                self.appendToken(Token.IDENTIFIER, self.workToken.value)
-            return line
-
-    def processLiteral(self, first, rest, line):
-        if first.isnumeric():
-            self.workToken.appendChar(first)
-            return rest
-        else:
+                # Interned once here, so later passes compare and hash
+                # one string per name.
+                self.appendToken(Token.IDENTIFIER, sys.intern(self.workToken.value))
+        return stop
+
+    def scanLiteral(self, line, idx, end):
+        # Decimal digits are matched in bulk, other numeric characters
+        # (e.g. vulgar fractions) one at a time.
+        stop = Tokenizer.DIGITS.match(line, idx, end).end()
+        while stop < end and line[stop].isnumeric():
+            stop = Tokenizer.DIGITS.match(line, stop + 1, end).end()
+        self.workToken.appendText(line[idx:stop])
+        if stop < end:
             self.appendToken(Token.LITERAL, self.workToken.value)
-            return line
-
-    def processString(self, first, rest, line):
-        if first != "\"":
-            self.workToken.appendChar(first)
-        else:
-            self.appendToken(Token.STRING, self.workToken.value)
-        return rest
+        return stop
+
+    def scanString(self, line, idx, end):
+        stop = line.find("\"", idx, end)
+        if stop < 0:
+            self.workToken.appendText(line[idx:end])
+            return end
+        self.workToken.appendText(line[idx:stop])
+        self.appendToken(Token.STRING, self.workToken.value)
+        return stop + 1
 
     def appendToken(self, type, value):
         """
@@ -0,0 +1,131 @@
+"""
+This module contains the zero page allocator which runs on the abstract
+syntax tree before code generation. Defines of a single byte or word are
+scalar variables, and the ones referenced most often are moved into a
+window of the zero page. Each access to them then saves a byte and a cycle.
+Their initial values are stored by main, so nothing is moved in a source
+without one, such as a library.
+"""
+from filetable import isFileTable
+from schemeparser import AbstractSyntaxTree
+
+class ZeroPageAllocator:
+    # The bytes each kind of scalar takes.
+    WIDTHS = {AbstractSyntaxTree.BYTES : 1, AbstractSyntaxTree.WORDS : 2}
+
+    def __init__(self, start = 0x80, size = 32):
+        """
+        Initializer for the window of the zero page to allocate in.
+
+        Arguments:
+        start -- the first address of the window.
+        size -- the number of bytes in the window.
+        """
+        if start < 0 or size < 0 or start + size > 0x100:
+            raise Exception('Zero page window ${:02X} of {} bytes is outside the zero page'.
+                            format(start, size))
+        self.start = start
+        self.size = size
+        self.promoted = {}
+        self.references = {}
+        self.left = size
+        self.hasMain = False
+
+    def allocate(self, root):
+        """
+        Counts the references to the scalars defined below the root and
+        places the most referenced ones in the window, when there is a main
+        to store their initial values.
+
+        Arguments:
+        root -- the root of the abstract syntax tree.
+
+        Returns:
+        a dictionary of the promoted names to (address, width, value).
+        """
+        scalars = []
+        self.symbols = {}
+        for node in root.children:
+            scalar = self.scalarDefine(node)
+            if scalar != None:
+                scalars.append(scalar)
+                self.references[scalar[0]] = 0
+                if node.children[1].symbol != None:
+                    self.symbols[node.children[1].symbol] = scalar[0]
+        self.countReferences(root)
+        self.hasMain = self.findMain(root)
+        if not self.hasMain:
+            return self.promoted
+
+        # The order of definition breaks ties so the result is stable.
+        address = self.start
+        for name, width, value in sorted(scalars, key=lambda scalar: -self.references[scalar[0]]):
+            if self.references[name] > 0 and width <= self.left:
+                self.promoted[name] = (address, width, value)
+                address = address + width
+                self.left = self.left - width
+        return self.promoted
+
+    def scalarDefine(self, node):
+        """
+        Returns the (name, width, value) of a define of a single byte or
+        word, or None for any other node.
+        """
+        if (node.type != AbstractSyntaxTree.SEXPR or len(node.children) != 3 or
+            node.children[0].type != AbstractSyntaxTree.DEFINE or
+            node.children[1].type != AbstractSyntaxTree.IDENTIFIER):
+            return None
+        data = node.children[2]
+        if (data.type != AbstractSyntaxTree.SEXPR or len(data.children) != 2 or
+            data.children[0].type not in ZeroPageAllocator.WIDTHS):
+            return None
+        values = data.children[1].children
+        if len(values) != 1 or values[0].type != AbstractSyntaxTree.LITERAL:
+            return None
+        return (node.children[1].value, ZeroPageAllocator.WIDTHS[data.children[0].type],
+                values[0].value)
+
+    def countReferences(self, node):
+        # An identifier at the head of an S expression is a call and the
+        # one after define is the name being defined, neither is an access.
+        # An alias of a scalar accesses the scalar.
+        for idx, child in enumerate(node.children):
+            if child.type == AbstractSyntaxTree.IDENTIFIER:
+                name = self.symbols.get(child.symbol.resolve()) if child.symbol != None else None
+                if (name != None and (idx > 0 or node.quoted) and
+                    not (idx == 1 and node.children[0].type == AbstractSyntaxTree.DEFINE)):
+                    self.references[name] += 1
+            elif not isFileTable(child):
+                self.countReferences(child)
+
+    def findMain(self, node):
+        """
+        Returns True when main is defined below a node as code, whose
+        label the initial values are stored after, rather than as an
+        alias.
+        """
+        for child in node.children:
+            if (child.type == AbstractSyntaxTree.SEXPR and len(child.children) >= 2 and
+                child.children[0].type == AbstractSyntaxTree.DEFINE and
+                child.children[1].type == AbstractSyntaxTree.IDENTIFIER and child.children[1].value == "main"):
+                return not (len(child.children) == 3 and child.children[2].type == AbstractSyntaxTree.IDENTIFIER)
+            if child.type != AbstractSyntaxTree.STRING_POOL and self.findMain(child):
+                return True
+        return False
+
+    def report(self):
+        """
+        Returns a text report of the promoted symbols and the space left.
+        """
+        lines = ["zero page: {} of {} bytes used at ${:02X}, {} left".format(
+                 self.size - self.left, self.size, self.start, self.left)]
+        if not self.hasMain and self.references:
+            lines.append("    no main to store the initial values, nothing promoted")
+        for name, (address, width, value) in self.promoted.items():
+            lines.append("    {:<24}${:02X}{:>4} bytes{:>6} references".format(
+                         name, address, width, self.references[name]))
+        for name in self.references:
+            if name not in self.promoted:
+                lines.append("    {:<24}not promoted{:>6} references".format(
+                             name, self.references[name]))
+        return "\n".join(lines)